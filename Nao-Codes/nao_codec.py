@@ -0,0 +1,31 @@
+"""On-robot audio compression for uploads.
+
+IMA ADPCM (stdlib audioop, so nothing to install on NAO) stores 16-bit PCM in
+4 bits per sample. The file is a small header (magic, sample rate, channels)
+followed by the ADPCM stream; the host's nao_audio.to_wav decodes it.
+"""
+import wave
+import struct
+import audioop
+
+ADPCM_MAGIC = b"NAOA"
+ADPCM_HEADER = struct.Struct("<4sIH")
+
+
+def encode_adpcm(pcm, rate, channels=1):
+    data, _ = audioop.lin2adpcm(pcm, 2, None)
+    return ADPCM_HEADER.pack(ADPCM_MAGIC, rate, channels) + data
+
+
+def encode_adpcm_file(wav_path, out_path):
+    """Compress a 16-bit PCM WAV recording; returns the size written."""
+    w = wave.open(wav_path, "rb")
+    try:
+        if w.getsampwidth() != 2:
+            raise ValueError("expected 16-bit PCM, got %d-bit" % (w.getsampwidth() * 8))
+        data = encode_adpcm(w.readframes(w.getnframes()), w.getframerate(), w.getnchannels())
+    finally:
+        w.close()
+    with open(out_path, "wb") as f:
+        f.write(data)
+    return len(data)
@@ -0,0 +1,58 @@
+"""Energy-based end-of-speech detection for NAO recordings.
+
+Fed one microphone energy reading per frame (ALAudioDevice energy
+computation), it says when the learner has stopped talking so recording can
+end early instead of always running for the full time.
+"""
+
+
+class Endpointer(object):
+    def __init__(self, frame_seconds=0.1, max_seconds=5.0, silence_seconds=0.8, no_speech_seconds=3.0,
+                 calibration_seconds=0.3, ratio=2.5, min_energy=400.0, min_speech_seconds=0.2):
+        self.frame_seconds = frame_seconds
+        self.max_seconds = max_seconds
+        self.silence_seconds = silence_seconds
+        self.no_speech_seconds = no_speech_seconds
+        self.calibration_frames = max(1, int(round(calibration_seconds / frame_seconds)))
+        self.ratio = ratio
+        self.min_energy = min_energy
+        self.min_speech_frames = max(1, int(round(min_speech_seconds / frame_seconds)))
+
+        self.elapsed = 0.0
+        self.noise = []
+        self.speech_frames = 0
+        self.speech_seconds = 0.0
+        self.silent_seconds = 0.0
+        self.started = False
+
+    @property
+    def threshold(self):
+        noise = sorted(self.noise)[len(self.noise) // 2] if self.noise else 0.0
+        return max(self.min_energy, noise * self.ratio)
+
+    def update(self, energy):
+        """Account for one frame; True once recording should stop."""
+        self.elapsed += self.frame_seconds
+        if len(self.noise) < self.calibration_frames:
+            # The first frames, before the learner starts, set the noise floor.
+            self.noise.append(energy)
+            return False
+
+        if energy > self.threshold:
+            self.speech_frames += 1
+            self.silent_seconds = 0.0
+            if self.speech_frames >= self.min_speech_frames:
+                self.started = True
+        else:
+            self.silent_seconds += self.frame_seconds
+            if not self.started:
+                # Isolated clicks don't count as the start of speech.
+                self.speech_frames = 0
+        if self.started:
+            self.speech_seconds += self.frame_seconds
+
+        if self.started and self.silent_seconds >= self.silence_seconds:
+            return True
+        if not self.started and self.elapsed >= self.no_speech_seconds:
+            return True
+        return self.elapsed >= self.max_seconds
@@ -0,0 +1,88 @@
+"""Microphone buffers streamed to the host while the learner speaks.
+
+ALAudioDevice hands every buffer to a subscribed module's processRemote
+(see MicStreamModule in nao_tutor_loop.py), which push()es it here. frames()
+runs the same energy endpointing as a file recording on those buffers and
+yields them for HttpTransport.stream_upload, starting with a little audio
+from before the learner began, and stops at end of speech. A turn with no
+speech yields nothing, so nothing is sent.
+"""
+import time
+import audioop
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+class MicStream(object):
+    def __init__(self, make_endpointer, rate=16000, preroll_seconds=0.5, buffer_timeout=1.0):
+        # make_endpointer(frame_seconds): buffer sizes are only known once they arrive.
+        self.make_endpointer = make_endpointer
+        self.rate = rate
+        self.preroll_seconds = preroll_seconds
+        self.buffer_timeout = buffer_timeout
+        self._queue = queue.Queue()
+        self.listening = False
+        self.heard = False
+        self.captured = False
+        self.seconds = 0.0
+
+    def push(self, buffer):
+        """Called on NAOqi's thread with 16-bit mono PCM."""
+        if self.listening:
+            self._queue.put(buffer)
+
+    def start(self):
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self.heard = False
+        self.captured = False
+        self.seconds = 0.0
+        self.listening = True
+
+    def stop(self):
+        self.listening = False
+
+    def frames(self, capture=None, capture_lead_seconds=1.0):
+        """Buffers from just before speech starts until it ends.
+
+        capture() runs once the learner has spoken for capture_lead_seconds;
+        for shorter answers the caller can still run it afterwards.
+        """
+        endpointer = None
+        preroll = []
+        tried_capture = False
+        started = time.time()
+        while True:
+            try:
+                buffer = self._queue.get(timeout=self.buffer_timeout)
+            except queue.Empty:
+                print("[WARN] Microphone stream stalled")
+                break
+            frame_seconds = len(buffer) / 2.0 / self.rate
+            if endpointer is None:
+                endpointer = self.make_endpointer(frame_seconds)
+            done = endpointer.update(audioop.rms(buffer, 2))
+            self.seconds += frame_seconds
+
+            if not self.heard:
+                preroll.append(buffer)
+                if not endpointer.started:
+                    del preroll[:-max(1, int(self.preroll_seconds / frame_seconds))]
+                else:
+                    self.heard = True
+                    for held in preroll:
+                        yield held
+                    preroll = []
+            else:
+                yield buffer
+
+            if capture is not None and not tried_capture and endpointer.speech_seconds >= capture_lead_seconds:
+                tried_capture = True
+                # Buffers queue up meanwhile and are sent right after.
+                self.captured = capture()
+            if done:
+                break
+        print("[INFO] Recorded %.1f s (speech: %s), streamed while recording" % (time.time() - started, self.heard))
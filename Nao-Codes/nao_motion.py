@@ -0,0 +1,124 @@
+"""Gestures as precompiled ALMotion keyframe timelines.
+
+Every gesture is a set of (time, angle) keyframes per joint. A gesture pair
+is compiled once into the (names, angles, times) arguments of one
+angleInterpolation call and cached, so a turn costs a single post call that
+runs while NAO speaks, instead of chains of setAngles + sleep before the
+first word. Stiffness is set once, when the engine is created.
+"""
+
+# Joints used by the gestures below, and the pose every gesture returns to.
+REST = {
+    "HeadPitch": 0.0,
+    "HeadYaw": 0.0,
+    "RShoulderPitch": 1.5,
+    "RShoulderRoll": 0.0,
+    "RElbowYaw": 1.2,
+    "RElbowRoll": 0.0,
+    "RHand": 0.0,
+}
+STIFF_CHAINS = ["Head", "LArm", "RArm"]
+TEXT_TYPES = (str, type(u""))
+
+GESTURES = {
+    "wave": {
+        "RShoulderPitch": [(0.4, 0.0), (1.2, 0.0), (1.7, 1.5)],
+        "RShoulderRoll": [(0.4, -0.3), (1.2, -0.3), (1.7, 0.0)],
+        "RElbowRoll": [(0.6, 1.5), (0.8, 0.5), (1.0, 1.5), (1.2, 0.5), (1.7, 0.0)],
+    },
+    "nod": {
+        "HeadPitch": [(0.3, 0.3), (0.6, -0.1), (0.9, 0.0)],
+    },
+    "shake_head": {
+        "HeadYaw": [(0.3, 0.5), (0.6, -0.5), (0.9, 0.0)],
+    },
+    "look_up": {
+        "HeadPitch": [(0.3, -0.3), (0.8, -0.3), (1.1, 0.0)],
+    },
+    "look_left": {
+        "HeadYaw": [(0.3, 0.5), (0.8, 0.5), (1.1, 0.0)],
+    },
+    "look_right": {
+        "HeadYaw": [(0.3, -0.5), (0.8, -0.5), (1.1, 0.0)],
+    },
+    "hand_open": {
+        "RShoulderPitch": [(0.4, 0.5), (0.9, 0.5), (1.3, 1.5)],
+        "RElbowRoll": [(0.4, 1.0), (0.9, 1.0), (1.3, 0.0)],
+        "RHand": [(0.4, 1.0), (0.9, 1.0), (1.3, 0.0)],
+    },
+    "hand_close": {
+        "RShoulderPitch": [(0.4, 0.5), (0.9, 0.5), (1.3, 1.5)],
+        "RElbowRoll": [(0.4, 1.0), (0.9, 1.0), (1.3, 0.0)],
+        "RHand": [(0.4, 0.0), (1.3, 0.0)],
+    },
+    "think": {
+        "HeadPitch": [(0.3, -0.2), (0.9, -0.2), (1.2, 0.0)],
+        "HeadYaw": [(0.3, 0.3), (0.9, 0.3), (1.2, 0.0)],
+        "RShoulderPitch": [(0.4, 0.4), (0.9, 0.4), (1.3, 1.5)],
+        "RElbowRoll": [(0.4, 1.5), (0.9, 1.5), (1.3, 0.0)],
+    },
+}
+
+
+def duration(gesture):
+    return max(keys[-1][0] for keys in GESTURES[gesture].values())
+
+
+def compile_timeline(gestures, delay=0.0):
+    """(names, angles, times) playing gestures one after another, starting after delay seconds.
+
+    A joint that only moves in a later gesture holds its rest angle until then.
+    """
+    gestures = [g for g in gestures if g in GESTURES]
+    if not gestures:
+        return None
+    frames = {}
+    offset = delay
+    for gesture in gestures:
+        for joint, keys in GESTURES[gesture].items():
+            joint_frames = frames.setdefault(joint, [])
+            if not joint_frames and offset > 0:
+                joint_frames.append((offset, REST[joint]))
+            joint_frames.extend((offset + t, angle) for t, angle in keys)
+        offset += duration(gesture)
+    names = sorted(frames)
+    angles = [[angle for _, angle in frames[name]] for name in names]
+    times = [[round(t, 3) for t, _ in frames[name]] for name in names]
+    return names, angles, times
+
+
+class MotionEngine(object):
+    """Plays gestures on an ALMotion proxy without blocking the caller.
+
+    delay_seconds shifts every timeline so the first movement lands when the
+    speech started alongside it becomes audible.
+    """
+
+    def __init__(self, motion, delay_seconds=0.0, max_gestures=2):
+        self.motion = motion
+        self.delay_seconds = delay_seconds
+        self.max_gestures = max_gestures
+        self._timelines = {}
+        for gesture in GESTURES:
+            self.timeline([gesture])
+        # Once per session instead of before every gesture.
+        motion.setStiffnesses(STIFF_CHAINS, 1.0)
+
+    def timeline(self, gestures):
+        # Gesture lists come from the model; ignore anything that is not a known name.
+        key = tuple([g for g in gestures if isinstance(g, TEXT_TYPES) and g in GESTURES][:self.max_gestures])
+        if key not in self._timelines:
+            self._timelines[key] = compile_timeline(key, self.delay_seconds)
+        return self._timelines[key]
+
+    def start(self, gestures):
+        """Begin the gestures in the background; returns a task id for wait(), or None."""
+        timeline = self.timeline(gestures)
+        if timeline is None:
+            return None
+        names, angles, times = timeline
+        return self.motion.post.angleInterpolation(names, angles, times, True)
+
+    def wait(self, task_id):
+        if task_id is not None:
+            self.motion.wait(task_id, 0)
@@ -0,0 +1,236 @@
+"""How NAO moves files to and from the host.
+
+ScpTransport keeps the original scp workflow but multiplexes every call over
+one SSH ControlMaster connection, so only the first hop pays for the
+handshake. HttpTransport talks to the host's nao_http endpoint over a single
+keep-alive connection and long-polls for replies instead of polling.
+"""
+import os
+import json
+import time
+import socket
+import hashlib
+import subprocess
+
+try:
+    import httplib
+except ImportError:
+    import http.client as httplib
+
+MARKER_SUFFIX = ".done"
+
+
+def message_stem(stem, seq):
+    # Message 1 of a turn is <stem>.json, later ones <stem>.<seq>.json.
+    return stem if seq == 1 else "%s.%d" % (stem, seq)
+
+
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(65536), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def write_upload_marker(local_file, remote_name, extra=None):
+    info = {"size": os.path.getsize(local_file), "sha1": file_sha1(local_file)}
+    if extra:
+        info.update(extra)
+    marker = os.path.join(os.path.dirname(local_file), remote_name + MARKER_SUFFIX)
+    with open(marker, "w") as f:
+        json.dump(info, f)
+    return marker
+
+
+class ScpTransport(object):
+    def __init__(self, ssh_target, remote_dirs, local_dir, poll_seconds=0.3, markers=True, multiplex=True):
+        self.ssh_target = ssh_target
+        self.remote_dirs = remote_dirs
+        self.local_dir = local_dir
+        self.poll_seconds = poll_seconds
+        self.markers = markers
+        self.options = ["-o", "BatchMode=yes", "-o", "StrictHostKeyChecking=no"]
+        if multiplex:
+            self.options += [
+                "-o", "ControlMaster=auto",
+                "-o", "ControlPath=/tmp/nao-ssh-%r@%h:%p",
+                "-o", "ControlPersist=600"
+            ]
+
+    def _scp(self, sources, dest, quiet_errors=False):
+        cmd = ["scp"] + self.options + ["-q"] + sources + [dest]
+        if not quiet_errors:
+            subprocess.check_call(cmd)
+            return True
+        with open(os.devnull, "w") as devnull:
+            return subprocess.call(cmd, stderr=devnull) == 0
+
+    def upload(self, local_file, area, remote_name, marker_extra=None):
+        remote_dir = self.remote_dirs[area]
+        remote_path = "%s/%s" % (remote_dir, remote_name)
+        if not self.markers:
+            self._scp([local_file], "%s:%s" % (self.ssh_target, remote_path))
+            return
+
+        marker = write_upload_marker(local_file, remote_name, marker_extra)
+        try:
+            if os.path.basename(local_file) == remote_name:
+                # scp copies its sources in order, so the marker lands only after the
+                # file is complete - one connection for both.
+                self._scp([local_file, marker], "%s:%s/" % (self.ssh_target, remote_dir))
+            else:
+                self._scp([local_file], "%s:%s" % (self.ssh_target, remote_path))
+                self._scp([marker], "%s:%s%s" % (self.ssh_target, remote_path, MARKER_SUFFIX))
+        finally:
+            try:
+                os.remove(marker)
+            except OSError:
+                pass
+
+    def fetch(self, stem, timeout):
+        """Poll for outgoing/<stem>.json; returns the parsed reply or None."""
+        local_json = os.path.join(self.local_dir, "%s.json" % stem)
+        remote_json = "%s:%s/%s.json" % (self.ssh_target, self.remote_dirs["outgoing"], stem)
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self._scp([remote_json], local_json, quiet_errors=True):
+                with open(local_json, "r") as f:
+                    return json.loads(f.read())
+            time.sleep(self.poll_seconds)
+        return None
+
+    def fetch_after(self, stem, after, timeout):
+        """Messages of a turn with seq > after; scp fetches them one file at a time."""
+        message = self.fetch(message_stem(stem, after + 1), timeout)
+        return [message] if message is not None else []
+
+    def close(self):
+        with open(os.devnull, "w") as devnull:
+            subprocess.call(["ssh"] + self.options + ["-O", "exit", self.ssh_target], stdout=devnull, stderr=devnull)
+
+
+class HttpTransport(object):
+    def __init__(self, host, port, connect_timeout=5.0, token=None):
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        # Sent with every request; the host refuses requests without it (401).
+        self.token = token
+        self._conn = None
+
+    def _request(self, method, path, body=None, headers=None, timeout=None):
+        # One reconnect covers a host restart or an idle connection the host closed.
+        for attempt in (1, 2):
+            if self._conn is None:
+                self._conn = httplib.HTTPConnection(self.host, self.port, timeout=self.connect_timeout)
+            try:
+                self._conn.timeout = timeout or self.connect_timeout
+                if self._conn.sock is not None:
+                    self._conn.sock.settimeout(self._conn.timeout)
+                headers = dict(headers or {})
+                if self.token:
+                    headers["X-Nao-Token"] = self.token
+                self._conn.request(method, path, body, headers)
+                resp = self._conn.getresponse()
+                return resp.status, resp.read()
+            except (httplib.HTTPException, socket.error):
+                self.close()
+                if attempt == 2:
+                    raise
+
+    def ping(self):
+        """True if the host answers and accepts our token."""
+        try:
+            status, _ = self._request("GET", "/outgoing/ping.json")
+        except (httplib.HTTPException, socket.error):
+            return False
+        return status != 401
+
+    def upload(self, local_file, area, remote_name, marker_extra=None):
+        with open(local_file, "rb") as f:
+            body = f.read()
+        headers = {
+            "Content-Type": "application/octet-stream",
+            "X-Content-SHA1": hashlib.sha1(body).hexdigest()
+        }
+        if marker_extra:
+            headers["X-Upload-Extra"] = json.dumps(marker_extra)
+        status, _ = self._request("PUT", "/%s/%s" % (area, remote_name), body, headers)
+        if status != 201:
+            raise IOError("upload of %s failed with HTTP %d" % (remote_name, status))
+
+    def stream_upload(self, area, remote_name, frames, marker_extra=None, query="", trailer=None):
+        """PUT the byte strings frames yields as they are produced (chunked).
+
+        Uses a connection of its own, since a stream cannot be replayed on a
+        stale keep-alive one. Returns False if frames yields nothing.
+        trailer(), called once frames is exhausted, returns marker fields
+        known only then; they go in the chunked trailer.
+        """
+        frames = iter(frames)
+        try:
+            frame = next(frames)
+        except StopIteration:
+            return False
+        conn = httplib.HTTPConnection(self.host, self.port, timeout=self.connect_timeout)
+        try:
+            conn.putrequest("PUT", "/%s/%s%s" % (area, remote_name, "?" + query if query else ""))
+            conn.putheader("Content-Type", "application/octet-stream")
+            conn.putheader("Transfer-Encoding", "chunked")
+            if self.token:
+                conn.putheader("X-Nao-Token", self.token)
+            if marker_extra:
+                conn.putheader("X-Upload-Extra", json.dumps(marker_extra))
+            if trailer is not None:
+                conn.putheader("Trailer", "X-Upload-Extra")
+            conn.endheaders()
+            while frame is not None:
+                if frame:
+                    conn.send(("%x\r\n" % len(frame)).encode("ascii") + frame + b"\r\n")
+                frame = next(frames, None)
+            late_extra = trailer() if trailer is not None else None
+            end = b"0\r\n"
+            if late_extra:
+                end += ("X-Upload-Extra: %s\r\n" % json.dumps(late_extra)).encode("ascii")
+            conn.send(end + b"\r\n")
+            resp = conn.getresponse()
+            resp.read()
+        finally:
+            conn.close()
+        if resp.status != 201:
+            raise IOError("stream of %s failed with HTTP %d" % (remote_name, resp.status))
+        return True
+
+    def fetch(self, stem, timeout):
+        """Long-poll outgoing/<stem>.json; returns the parsed reply or None."""
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            status, body = self._request("GET", "/outgoing/%s.json?wait=%.2f" % (stem, remaining),
+                                         timeout=remaining + self.connect_timeout)
+            if status == 200:
+                return json.loads(body.decode("utf-8"))
+            if status != 404:
+                raise IOError("fetch of %s failed with HTTP %d" % (stem, status))
+
+    def fetch_after(self, stem, after, timeout):
+        """Long-poll the messages of a turn with seq > after, in order; [] on timeout."""
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return []
+            status, body = self._request("GET", "/outgoing/%s?after=%d&wait=%.2f" % (stem, after, remaining),
+                                         timeout=remaining + self.connect_timeout)
+            if status == 200:
+                return json.loads(body.decode("utf-8"))
+            if status != 404:
+                raise IOError("fetch of %s failed with HTTP %d" % (stem, status))
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -1,28 +1,91 @@
 import time
 import os
+import re
 import json
-import subprocess
-from naoqi import ALProxy
+import uuid
+from naoqi import ALBroker, ALModule, ALProxy
+from nao_transport import HttpTransport, ScpTransport
+from nao_endpointing import Endpointer
+from nao_codec import encode_adpcm_file
+from nao_motion import MotionEngine
+from nao_mic_stream import MicStream
 
 LAPTOP_SSH = "khaled@192.168.0.178"
 
+# Identifies this robot's session on a laptop shared by several NAOs. Every
+# NAO ships with the hostname "nao", so without NAO_ROBOT_ID the id comes
+# from the robot's MAC address.
+ROBOT_ID = re.sub(r"[^A-Za-z0-9-]", "-", os.environ.get("NAO_ROBOT_ID") or "nao-%012x" % uuid.getnode())
+
 LAPTOP_INCOMING_DIR = "Documents/Nao_Project/incoming"
 LAPTOP_OUTGOING_DIR = "Documents/Nao_Project/outgoing"
 LAPTOP_IMAGES_DIR = "Documents/Nao_Project/images"
+LOCAL_DIR = "/home/nao/sanaz"
+
+# "http" talks to the host's keep-alive endpoint (NAO_HTTP_PORT on the host)
+# and long-polls for replies; if it is unreachable NAO falls back to scp,
+# multiplexed over one SSH ControlMaster connection.
+TRANSPORT = "http"
+HOST_HTTP_PORT = 8765
+# The host's NAO_HTTP_TOKEN; it only serves HTTP without one on its own loopback.
+HOST_HTTP_TOKEN = ""
+SSH_MULTIPLEX = True
 
 SAMPLE_RATE = 16000
 CHANNELS = [0, 0, 1, 0]
-FORMAT_NAME = "wav"
+
+# What NAO uploads per turn: "wav" (16-bit PCM), "ogg" (ALAudioRecorder
+# encodes Ogg Vorbis while recording, about 10x smaller) or "adpcm" (the WAV
+# compressed 4:1 on the robot after recording). The host decodes all three.
+UPLOAD_FORMAT = "wav"
+FORMAT_NAME = "ogg" if UPLOAD_FORMAT == "ogg" else "wav"
+# Recordings smaller than this hold no usable audio.
+MIN_UPLOAD_BYTES = {"wav": 2000, "ogg": 300, "adpcm": 500}
 
 RECORD_SECONDS = 5
+
+# "stream" sends microphone buffers to the host while the learner talks
+# (HTTP transport only), so upload and recognition overlap the answer;
+# "file" records to a file and uploads it once they stop.
+MIC_MODE = "stream"
+MIC_MODULE = "NaoTutorMic"
+# ALAudioDevice channel setting for the front microphone alone, the only
+# one it delivers at 16 kHz.
+FRONT_MIC = 3
+
+# Stop recording once the learner has been quiet for ENDPOINT_SILENCE_SECONDS
+# (front-mic energy from ALAudioDevice) instead of always recording
+# RECORD_SECONDS, which stays the upper limit. Turns with no speech within
+# NO_SPEECH_SECONDS end early and are not uploaded.
+ENDPOINTING = True
+ENDPOINT_FRAME_SECONDS = 0.1
+ENDPOINT_SILENCE_SECONDS = 0.8
+NO_SPEECH_SECONDS = 3.0
 POLL_SECONDS = 0.3
 RESPONSE_TIMEOUT = 20
+# Before saying a filler ("Hmm, let me think."), check this long whether
+# the real reply has already arrived; if it has, the filler is skipped.
+FILLER_PEEK_SECONDS = 0.05
+
+# Send a "<name>.done" marker (size + sha1) after each scp upload so the
+# laptop can start on the file at once instead of polling its size. The
+# HTTP endpoint always writes one.
+UPLOAD_MARKERS = True
+
+# Grab a camera frame while the learner is still talking and upload it with
+# the recording, so vision questions need no extra round trip.
+SPECULATIVE_CAPTURE = True
+CAPTURE_LEAD_SECONDS = 1.0
 
 INTRO = (
     "Hi! I am SantaNao, your English teacher. "
     "Please tell me your name and what topic you want to learn today."
 )
 
+# ALTextToSpeech starts talking about this long after say() is posted;
+# gesture timelines are delayed by it so movement and voice start together.
+SPEECH_ONSET_SECONDS = 0.25
+
 LED_COLORS = {
     "green": 0x0000FF00,
     "blue": 0x000000FF,
@@ -31,15 +94,79 @@ LED_COLORS = {
     "white": 0x00FFFFFF
 }
 
-def record_once(rec, out_wav):
+def record_once(rec, out_wav, capture=None, audio=None):
+    """Record one answer; returns (heard, captured).
+
+    With an ALAudioDevice proxy the recording ends when the learner stops
+    talking and capture() runs once they have spoken for CAPTURE_LEAD_SECONDS;
+    without one it lasts RECORD_SECONDS and capture() runs shortly before the end.
+    """
     try:
         rec.stopMicrophonesRecording()
     except Exception:
         pass
 
     rec.startMicrophonesRecording(out_wav, FORMAT_NAME, SAMPLE_RATE, CHANNELS)
-    time.sleep(RECORD_SECONDS)
+    started = time.time()
+    captured = False
+    if audio is None or not ENDPOINTING:
+        if capture is not None:
+            time.sleep(max(0.0, RECORD_SECONDS - CAPTURE_LEAD_SECONDS))
+            captured = capture()
+        time.sleep(max(0.0, RECORD_SECONDS - (time.time() - started)))
+        rec.stopMicrophonesRecording()
+        return True, captured
+
+    endpointer = Endpointer(ENDPOINT_FRAME_SECONDS, RECORD_SECONDS, ENDPOINT_SILENCE_SECONDS, NO_SPEECH_SECONDS)
+    tried_capture = False
+    while True:
+        time.sleep(ENDPOINT_FRAME_SECONDS)
+        if endpointer.update(audio.getFrontMicEnergy()):
+            break
+        if capture is not None and not tried_capture and endpointer.speech_seconds >= CAPTURE_LEAD_SECONDS:
+            tried_capture = True
+            captured = capture()
     rec.stopMicrophonesRecording()
+    print "[INFO] Recorded %.1f s (speech: %s)" % (time.time() - started, endpointer.started)
+
+    if capture is not None and not tried_capture and endpointer.started:
+        # A short answer ended before the lead time; the frame is still fresh.
+        captured = capture()
+    return endpointer.started, captured
+
+class MicStreamModule(ALModule):
+    """Receives ALAudioDevice buffers while subscribed."""
+
+    def __init__(self, name, stream):
+        ALModule.__init__(self, name)
+        self.stream = stream
+
+    def processRemote(self, nbOfChannels, nbOfSamplesByChannel, timeStamp, inputBuffer):
+        """Called by ALAudioDevice with every microphone buffer."""
+        self.stream.push(inputBuffer)
+
+def make_endpointer(frame_seconds):
+    return Endpointer(frame_seconds, RECORD_SECONDS, ENDPOINT_SILENCE_SECONDS, NO_SPEECH_SECONDS)
+
+def stream_once(audio, mic, transport, stem, capture=None):
+    """Stream one answer to the host while it is spoken; returns (heard, captured)."""
+    def trailer():
+        if capture is not None and mic.heard and not mic.captured:
+            # A short answer ended before the lead time; the frame is still fresh.
+            mic.captured = capture()
+        # The marker only promises a frame NAO has taken, so the host never
+        # waits out IMAGE_TIMEOUT_SEC for a capture that failed.
+        return {"image": True} if mic.captured else None
+
+    mic.start()
+    audio.subscribe(MIC_MODULE)
+    try:
+        transport.stream_upload("stream", "%s.pcm" % stem, mic.frames(capture, CAPTURE_LEAD_SECONDS),
+                                None, "rate=%d" % SAMPLE_RATE, trailer)
+    finally:
+        audio.unsubscribe(MIC_MODULE)
+        mic.stop()
+    return mic.heard, mic.captured
 
 def take_photo(video, image_path):
     try:
@@ -71,105 +198,27 @@ def take_photo(video, image_path):
         print "[ERROR] Failed to save image:", e
         return False
 
-def scp_to_laptop(local_file, remote_name, remote_dir):
-    remote_path = "%s/%s" % (remote_dir, remote_name)
-    cmd = [
-        "scp",
-        "-o", "BatchMode=yes",
-        "-o", "StrictHostKeyChecking=no",
-        "-q",
-        local_file,
-        "%s:%s" % (LAPTOP_SSH, remote_path)
-    ]
-    subprocess.check_call(cmd)
-
-def scp_from_laptop(stem, local_json):
-    remote_json = "%s/%s.json" % (LAPTOP_OUTGOING_DIR, stem)
-    cmd = [
-        "scp",
-        "-o", "BatchMode=yes",
-        "-o", "StrictHostKeyChecking=no",
-        "-q",
-        "%s:%s" % (LAPTOP_SSH, remote_json),
-        local_json
-    ]
-    try:
-        with open(os.devnull, 'w') as devnull:
-            subprocess.check_call(cmd, stderr=devnull)
-        return True
-    except subprocess.CalledProcessError:
-        return False
+def make_transport():
+    if TRANSPORT == "http":
+        transport = HttpTransport(LAPTOP_SSH.split("@")[-1], HOST_HTTP_PORT, token=HOST_HTTP_TOKEN or None)
+        if transport.ping():
+            print "[INFO] Using HTTP transport"
+            return transport
+        print "[WARN] Host HTTP endpoint unreachable or refused HOST_HTTP_TOKEN, falling back to scp"
+    remote_dirs = {
+        "incoming": LAPTOP_INCOMING_DIR,
+        "images": LAPTOP_IMAGES_DIR,
+        "outgoing": LAPTOP_OUTGOING_DIR
+    }
+    return ScpTransport(LAPTOP_SSH, remote_dirs, LOCAL_DIR, POLL_SECONDS, UPLOAD_MARKERS, SSH_MULTIPLEX)
 
 def set_eye_color(leds, color_name):
     color = LED_COLORS.get(color_name, LED_COLORS["blue"])
     try:
-        leds.fadeRGB("FaceLeds", color, 0.5)
+        leds.post.fadeRGB("FaceLeds", color, 0.5)
     except Exception as e:
         print "[WARN] Could not set LED color:", e
 
-def perform_gesture(motion, gesture_name):
-    try:
-        motion.setStiffnesses("Head", 1.0)
-        motion.setStiffnesses("LArm", 1.0)
-        motion.setStiffnesses("RArm", 1.0)
-        
-        if gesture_name == "wave":
-            motion.setAngles("RShoulderPitch", 0.0, 0.3)
-            motion.setAngles("RShoulderRoll", -0.3, 0.3)
-            time.sleep(0.3)
-            for _ in range(2):
-                motion.setAngles("RElbowRoll", 1.5, 0.5)
-                time.sleep(0.2)
-                motion.setAngles("RElbowRoll", 0.5, 0.5)
-                time.sleep(0.2)
-            motion.setAngles(["RShoulderPitch", "RShoulderRoll", "RElbowRoll"], [1.5, 0.0, 0.0], 0.3)
-            
-        elif gesture_name == "nod":
-            motion.setAngles("HeadPitch", 0.3, 0.3)
-            time.sleep(0.3)
-            motion.setAngles("HeadPitch", -0.1, 0.3)
-            time.sleep(0.3)
-            motion.setAngles("HeadPitch", 0.0, 0.3)
-            
-        elif gesture_name == "shake_head":
-            motion.setAngles("HeadYaw", 0.5, 0.3)
-            time.sleep(0.3)
-            motion.setAngles("HeadYaw", -0.5, 0.3)
-            time.sleep(0.3)
-            motion.setAngles("HeadYaw", 0.0, 0.3)
-            
-        elif gesture_name == "look_up":
-            motion.setAngles("HeadPitch", -0.3, 0.3)
-            time.sleep(0.5)
-            motion.setAngles("HeadPitch", 0.0, 0.3)
-            
-        elif gesture_name == "look_left":
-            motion.setAngles("HeadYaw", 0.5, 0.3)
-            time.sleep(0.5)
-            motion.setAngles("HeadYaw", 0.0, 0.3)
-            
-        elif gesture_name == "look_right":
-            motion.setAngles("HeadYaw", -0.5, 0.3)
-            time.sleep(0.5)
-            motion.setAngles("HeadYaw", 0.0, 0.3)
-            
-        elif gesture_name == "hand_open":
-            motion.setAngles(["RShoulderPitch", "RElbowRoll"], [0.5, 1.0], 0.3)
-            motion.setAngles("RHand", 1.0, 0.3)
-            time.sleep(0.5)
-            motion.setAngles(["RShoulderPitch", "RElbowRoll", "RHand"], [1.5, 0.0, 0.0], 0.3)
-            
-        elif gesture_name == "hand_close":
-            motion.setAngles(["RShoulderPitch", "RElbowRoll"], [0.5, 1.0], 0.3)
-            motion.setAngles("RHand", 0.0, 0.3)
-            time.sleep(0.5)
-            motion.setAngles(["RShoulderPitch", "RElbowRoll", "RHand"], [1.5, 0.0, 0.0], 0.3)
-        
-        time.sleep(0.2)
-        
-    except Exception as e:
-        print "[WARN] Gesture error:", e
-
 def say_and_move(tts, motion, leds, speech, gestures, led_color):
     if speech is None:
         speech = ""
@@ -188,66 +237,54 @@ def say_and_move(tts, motion, leds, speech, gestures, led_color):
     print "[INFO] LED color:", led_color
     
     set_eye_color(leds, led_color)
-    
-    if gestures and len(gestures) > 0:
-        for gesture in gestures[:2]:
-            perform_gesture(motion, gesture)
-    
-    tts.say(speech)
 
-def wait_for_response(stem, timeout=RESPONSE_TIMEOUT):
-    """Wait for JSON response from laptop"""
-    local_json = "/home/nao/sanaz/%s.json" % stem
-    start_wait = time.time()
-    
-    while time.time() - start_wait < timeout:
-        if scp_from_laptop(stem, local_json):
-            try:
-                with open(local_json, "r") as f:
-                    raw = f.read()
-                obj = json.loads(raw)
-                return obj
-            except Exception as e:
-                print "[ERROR] JSON parse error:", e
-                return None
-        time.sleep(POLL_SECONDS)
-    
-    return None
+    # Speech and gestures run side by side; the next step waits for both.
+    speech_id = tts.post.say(speech)
+    gesture_id = motion.start(gestures or [])
+    tts.wait(speech_id, 0)
+    motion.wait(gesture_id)
 
-def wait_for_updated_response(stem, old_speech, timeout=RESPONSE_TIMEOUT):
-    """Wait for UPDATED JSON response (different from old one)"""
-    local_json = "/home/nao/sanaz/%s.json" % stem
-    start_wait = time.time()
-    
-    while time.time() - start_wait < timeout:
-        if scp_from_laptop(stem, local_json):
-            try:
-                with open(local_json, "r") as f:
-                    raw = f.read()
-                obj = json.loads(raw)
-                
-                # Check if this is a NEW response (different speech)
-                new_speech = obj.get("speech", "")
-                if new_speech and new_speech != old_speech:
-                    print "[INFO] Got updated response!"
-                    return obj
-                else:
-                    print "[DEBUG] Still same response, waiting..."
-                    
-            except Exception as e:
-                print "[ERROR] JSON parse error:", e
-        
-        time.sleep(POLL_SECONDS)
-    
-    print "[WARN] Timeout waiting for updated response"
-    return None
+def wait_for_messages(transport, stem, after=0, timeout=RESPONSE_TIMEOUT):
+    """Wait for the turn's reply messages with seq > after"""
+    try:
+        return transport.fetch_after(stem, after, timeout)
+    except ValueError as e:
+        print "[ERROR] JSON parse error:", e
+        return []
+
+def skip_stale_fillers(transport, stem, messages):
+    """Drop fillers the real reply has already overtaken.
+
+    A filler is only said while it is the newest message of the turn.
+    """
+    while messages and messages[0].get("filler"):
+        if len(messages) == 1:
+            newer = wait_for_messages(transport, stem, messages[0].get("seq", 1), FILLER_PEEK_SECONDS)
+            if not newer:
+                break
+            messages = messages + newer
+        print "[INFO] Skipping filler, the reply is already here"
+        messages.pop(0)
+    return messages
 
 def main():
+    global NaoTutorMic
     tts = ALProxy("ALTextToSpeech", "127.0.0.1", 9559)
     rec = ALProxy("ALAudioRecorder", "127.0.0.1", 9559)
-    motion = ALProxy("ALMotion", "127.0.0.1", 9559)
+    motion = MotionEngine(ALProxy("ALMotion", "127.0.0.1", 9559), SPEECH_ONSET_SECONDS)
     leds = ALProxy("ALLeds", "127.0.0.1", 9559)
     video = ALProxy("ALVideoDevice", "127.0.0.1", 9559)
+    audio = ALProxy("ALAudioDevice", "127.0.0.1", 9559)
+    audio.enableEnergyComputation()
+    transport = make_transport()
+
+    mic = None
+    if MIC_MODE == "stream" and isinstance(transport, HttpTransport):
+        # NAOqi finds a Python module by the global variable named like it.
+        broker = ALBroker("NaoTutorBroker", "0.0.0.0", 0, "127.0.0.1", 9559)
+        mic = MicStream(make_endpointer, SAMPLE_RATE)
+        NaoTutorMic = MicStreamModule(MIC_MODULE, mic)
+        audio.setClientPreferences(MIC_MODULE, SAMPLE_RATE, FRONT_MIC, 0)
 
     set_eye_color(leds, "blue")
     tts.say(INTRO)
@@ -255,80 +292,93 @@ def main():
     while True:
         try:
             ts = int(time.time())
-            local_wav = "/home/nao/sanaz/input_%d.wav" % ts
-            stem = "input_%d" % ts
-            remote_name = stem + ".wav"
+            stem = "input_%s_%d" % (ROBOT_ID, ts)
+            local_wav = "%s/%s.%s" % (LOCAL_DIR, stem, FORMAT_NAME)
+            remote_name = "%s.%s" % (stem, UPLOAD_FORMAT)
+            image_stem = stem.replace("input_", "image_")
+            local_image = "%s/%s.jpg" % (LOCAL_DIR, image_stem)
+
+            capture = None
+            if SPECULATIVE_CAPTURE:
+                capture = lambda: take_photo(video, local_image)
 
             print "[INFO] Recording..."
             set_eye_color(leds, "yellow")
-            record_once(rec, local_wav)
-
-            size = 0
-            try:
-                size = os.path.getsize(local_wav)
-            except Exception:
+            if mic is not None:
+                # The answer reaches the host while it is spoken.
+                heard, photo_taken = stream_once(audio, mic, transport, stem, capture)
+                if not heard:
+                    set_eye_color(leds, "red")
+                    tts.say("Sorry, I did not hear you.")
+                    continue
+                if photo_taken:
+                    transport.upload(local_image, "images", "%s.jpg" % image_stem)
+            else:
+                heard, photo_taken = record_once(rec, local_wav, capture, audio)
+
+                upload_file = local_wav
                 size = 0
-            print "[INFO] Recorded size:", size
-
-            if size < 2000:
-                set_eye_color(leds, "red")
-                tts.say("Sorry, I did not hear you.")
-                continue
-
-            print "[INFO] Uploading:", remote_name
-            scp_to_laptop(local_wav, remote_name, LAPTOP_INCOMING_DIR)
+                try:
+                    if UPLOAD_FORMAT == "adpcm" and heard:
+                        upload_file = "%s/%s" % (LOCAL_DIR, remote_name)
+                        size = encode_adpcm_file(local_wav, upload_file)
+                    else:
+                        size = os.path.getsize(local_wav)
+                except Exception as e:
+                    print "[WARN] Could not prepare the recording:", e
+                    size = 0
+                print "[INFO] Recorded size:", size
+
+                if size < MIN_UPLOAD_BYTES[UPLOAD_FORMAT] or not heard:
+                    set_eye_color(leds, "red")
+                    tts.say("Sorry, I did not hear you.")
+                    continue
+
+                print "[INFO] Uploading:", remote_name
+                if photo_taken:
+                    # The marker tells the laptop a frame follows, so it never asks for one.
+                    transport.upload(upload_file, "incoming", remote_name, {"image": True})
+                    transport.upload(local_image, "images", "%s.jpg" % image_stem)
+                else:
+                    transport.upload(upload_file, "incoming", remote_name)
 
             print "[INFO] Waiting for response..."
-            response = wait_for_response(stem)
-
-            if not response:
-                set_eye_color(leds, "red")
-                tts.say("Sorry, I did not get a reply.")
-                continue
-
-            speech = response.get("speech", "")
-            gestures = response.get("gestures", [])
-            led_color = response.get("led_color", "blue")
-            need_camera = response.get("need_camera", False)
-            
-            if not isinstance(gestures, list):
-                gestures = []
-
-            # Speak first message (might be "Let me look at that")
-            say_and_move(tts, motion, leds, speech, gestures, led_color)
-            
-            # If camera is needed
-            if need_camera:
-                print "[INFO] Taking photo..."
-                image_stem = stem.replace("input_", "image_")
-                local_image = "/home/nao/sanaz/%s.jpg" % image_stem
-                
-                if take_photo(video, local_image):
-                    print "[INFO] Uploading photo..."
-                    scp_to_laptop(local_image, "%s.jpg" % image_stem, LAPTOP_IMAGES_DIR)
-                    
-                    # Wait for laptop to process and OVERWRITE JSON
-                    print "[INFO] Waiting for vision result (will overwrite JSON)..."
-                    time.sleep(3.0)
-                    
-                    # Get UPDATED response with vision result
-                    vision_response = wait_for_updated_response(stem, speech, timeout=15)
-                    
-                    if vision_response:
-                        new_speech = vision_response.get("speech", "")
-                        new_gestures = vision_response.get("gestures", [])
-                        new_led_color = vision_response.get("led_color", "blue")
-                        
-                        if not isinstance(new_gestures, list):
-                            new_gestures = []
-                        
-                        print "[INFO] Got vision result!"
-                        say_and_move(tts, motion, leds, new_speech, new_gestures, new_led_color)
+
+            # A turn's reply is a run of messages: a filler if the host is
+            # slow, "Let me look at that" when it needs a photo, and streamed
+            # replies sentence by sentence, each carrying "more" until the
+            # last. Each fetch asks only for what came after the last message seen.
+            messages = []
+            seq = 0
+            while True:
+                if not messages:
+                    messages = skip_stale_fillers(transport, stem, wait_for_messages(transport, stem, seq))
+                if not messages:
+                    if seq == 0:
+                        set_eye_color(leds, "red")
+                        tts.say("Sorry, I did not get a reply.")
                     else:
-                        print "[WARN] Did not get updated vision response"
-                        tts.say("Sorry, I had trouble seeing that.")
-                else:
-                    tts.say("Sorry, I could not take a photo.")
+                        print "[WARN] Missing reply message", seq + 1
+                        tts.say("Sorry, I did not get the rest of my answer.")
+                    break
+                response = messages.pop(0)
+                seq = response.get("seq", seq + 1)
+                gestures = response.get("gestures", [])
+                if not isinstance(gestures, list):
+                    gestures = []
+                say_and_move(tts, motion, leds, response.get("speech", ""), gestures, response.get("led_color", "blue"))
+
+                # If camera is needed, the answer follows as the next message
+                if response.get("need_camera"):
+                    print "[INFO] Taking photo..."
+                    if not take_photo(video, local_image):
+                        tts.say("Sorry, I could not take a photo.")
+                        break
+                    print "[INFO] Uploading photo..."
+                    transport.upload(local_image, "images", "%s.jpg" % image_stem)
+
+                if not response.get("more"):
+                    break
 
             time.sleep(0.2)
 
@@ -338,6 +388,7 @@ def main():
                 rec.stopMicrophonesRecording()
             except Exception:
                 pass
+            transport.close()
             break
         except Exception as e:
             print "[ERROR] Loop error:", e
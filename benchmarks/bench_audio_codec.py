@@ -0,0 +1,180 @@
+"""Bytes per turn and upload-to-STT latency for WAV vs compressed uploads.
+
+Synthesises endpointed learner answers (see bench_vad.py), encodes each in
+every upload format and sends it with the NAO-side HttpTransport to the host
+endpoint (child process) through a local proxy that caps the bandwidth.
+Latency per turn = encode on the robot + upload + host decode and silence
+trim, i.e. until the clip is ready for STT. Formats:
+- wav: 16-bit PCM as recorded
+- adpcm: Nao-Codes/nao_codec.py, 4:1 on the robot
+- ogg / flac: ALAudioRecorder's Ogg Vorbis and FLAC, encoded here with
+  soundfile (only if it is installed)
+
+Encode times are for this machine; NAO's CPU is several times slower.
+
+    python benchmarks/bench_audio_codec.py --caps 0.25,0.5,1,2,5 --turns 20
+"""
+import io
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+import statistics
+import multiprocessing
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "Nao-Codes"))
+
+from nao_audio import to_wav, trim_silence
+from nao_codec import encode_adpcm
+from nao_transport import HttpTransport
+from bench_transport import serve
+from bench_vad import RATE, endpoint, make_turn, to_wav as pcm_to_wav
+
+CHUNK = 4096
+
+
+class Throttle:
+    """TCP proxy forwarding at most `rate` bytes per second in each direction."""
+
+    def __init__(self, target_port):
+        self.target_port = target_port
+        self.rate = None
+        self.port = None
+        ready = threading.Event()
+        threading.Thread(target=self._run, args=(ready,), daemon=True).start()
+        ready.wait(5)
+
+    def _run(self, ready):
+        async def main():
+            server = await asyncio.start_server(self._connect, "127.0.0.1", 0)
+            self.port = server.sockets[0].getsockname()[1]
+            ready.set()
+            await asyncio.Event().wait()
+
+        asyncio.run(main())
+
+    async def _pipe(self, reader, writer):
+        try:
+            while True:
+                data = await reader.read(CHUNK)
+                if not data:
+                    break
+                if self.rate:
+                    await asyncio.sleep(len(data) / self.rate)
+                writer.write(data)
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def _connect(self, reader, writer):
+        up_reader, up_writer = await asyncio.open_connection("127.0.0.1", self.target_port)
+        await asyncio.gather(self._pipe(reader, up_writer), self._pipe(up_reader, writer), return_exceptions=True)
+
+
+def encoders():
+    yield "wav", ".wav", lambda pcm: pcm_to_wav(pcm)
+    yield "adpcm", ".adpcm", lambda pcm: encode_adpcm(pcm.astype("<i2").tobytes(), RATE)
+    try:
+        import soundfile
+    except ImportError:
+        print("[WARN] soundfile not installed: ogg/flac rows skipped")
+        return
+
+    def encode(fmt, subtype):
+        def run(pcm):
+            out = io.BytesIO()
+            soundfile.write(out, pcm.astype("<i2"), RATE, format=fmt, subtype=subtype)
+            return out.getvalue()
+        return run
+
+    yield "ogg", ".ogg", encode("OGG", "VORBIS")
+    yield "flac", ".flac", encode("FLAC", "PCM_16")
+
+
+def make_answers(turns, seed):
+    rng = np.random.default_rng(seed)
+    answers = []
+    while len(answers) < turns:
+        samples, speech = make_turn(rng)
+        heard, recorded = endpoint(samples)
+        if speech is not None and heard:
+            answers.append(np.clip(samples[:recorded], -32768, 32767))
+    return answers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--caps", default="0.25,0.5,1,2,5", help="bandwidth caps in Mbit/s")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--port", type=int, default=18766)
+    args = parser.parse_args()
+    caps = [float(c) for c in args.caps.split(",")]
+
+    answers = make_answers(args.turns, args.seed)
+    seconds = statistics.mean(len(a) / RATE for a in answers)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        for name in ("incoming", "images", "outgoing", "nao"):
+            (root / name).mkdir()
+        ready = multiprocessing.Event()
+        host = multiprocessing.Process(target=serve, args=(root, args.port, ready), daemon=True)
+        host.start()
+        ready.wait(10)
+        throttle = Throttle(args.port)
+        http = HttpTransport("127.0.0.1", throttle.port)
+
+        formats = []
+        for name, suffix, encode in encoders():
+            files, sizes, encode_ms, decode_ms = [], [], [], []
+            for i, pcm in enumerate(answers):
+                start = time.perf_counter()
+                data = encode(pcm)
+                encode_ms.append((time.perf_counter() - start) * 1000)
+                start = time.perf_counter()
+                trim_silence(to_wav(data))
+                decode_ms.append((time.perf_counter() - start) * 1000)
+                path = root / "nao" / f"input_bench_{i}{suffix}"
+                path.write_bytes(data)
+                files.append(path)
+                sizes.append(len(data))
+            formats.append((name, files, sizes, encode_ms, decode_ms))
+
+        print(f"{len(answers)} answers, {seconds:.2f} s recorded on average")
+        print(f"{'format':<8}  {'bytes/turn':>10}  {'ratio':>6}  {'encode ms':>9}  {'decode+trim ms':>14}")
+        wav_bytes = statistics.mean(formats[0][2])
+        for name, _, sizes, encode_ms, decode_ms in formats:
+            print(f"{name:<8}  {statistics.mean(sizes):>10.0f}  {wav_bytes / statistics.mean(sizes):>6.1f}  "
+                  f"{statistics.mean(encode_ms):>9.2f}  {statistics.mean(decode_ms):>14.2f}")
+
+        print()
+        print("upload-to-STT latency per turn, mean ms (p95)")
+        print(f"{'Mbit/s':>7}" + "".join(f"  {name:>16}" for name, *_ in formats))
+        for cap in caps:
+            throttle.rate = cap * 1e6 / 8
+            row = f"{cap:>7.2f}"
+            for name, files, sizes, encode_ms, decode_ms in formats:
+                totals = []
+                for i, path in enumerate(files):
+                    start = time.perf_counter()
+                    http.upload(str(path), "incoming", f"{path.stem}_{cap}{path.suffix}")
+                    totals.append((time.perf_counter() - start) * 1000 + encode_ms[i] + decode_ms[i])
+                totals.sort()
+                p95 = totals[max(0, int(len(totals) * 0.95) - 1)]
+                row += f"  {statistics.mean(totals):>8.0f} ({p95:>5.0f})"
+            print(row)
+
+        http.close()
+        host.terminate()
+
+
+if __name__ == "__main__":
+    main()
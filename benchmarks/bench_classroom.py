@@ -0,0 +1,169 @@
+"""A classroom of robots sharing one Gemini API key, with and without the scheduler.
+
+--robots robots hold lessons at the same time against the local Gemini stand-in
+(gemini_standin.py), which enforces a quota of --quota requests (and
+optionally --quota-tokens tokens) per --window seconds and answers 429
+beyond it. Every turn is a tutor call the learner waits for, or a vision
+call with a camera frame for --vision-share of them. --prefetch-share of the
+turns also start a background call nobody waits for yet (like the
+introduction prefetch). One robot is chatty: its learner talks
+--chatty-factor times as often as the others. Every call runs under the
+server's 15 s reply deadline. Modes:
+- none: requests go straight out, as before the scheduler, and the quota
+  only shows up as 429s, retried with backoff
+- scheduled: nao_scheduler token buckets sized to the quota, priority
+  classes (interactive > vision > background) and round-robin per robot
+
+Reported per class: calls, share answered before the deadline, latency
+p50/p95, time spent queued (p95), 429s returned by the stand-in, the
+deepest queue seen, and the interactive p95 of the chatty robot against the
+rest. Time is compressed: the quota window is --window seconds rather than
+a minute, and the scheduler is sized to the same rate.
+
+    python benchmarks/bench_classroom.py --robots 30 --seconds 40 --quota 80 --window 10
+"""
+import io
+import sys
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+from collections import defaultdict
+
+from PIL import Image
+from google.genai import types
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import nao_gemini
+from nao_scheduler import PRIORITIES
+from gemini_standin import GeminiStandIn, Latency
+
+MODEL_NAME = "models/gemini-2.5-flash"
+# About the size of the server's tutor prompt.
+PROMPT = "You are NAO robot, a professional English tutor. " * 50 + "Student said: I likes apples."
+REPLY_BUDGET_SEC = 15
+MODES = ("none", "scheduled")
+DEFAULTS = {"QUOTA_BURST_SEC": nao_gemini.QUOTA_BURST_SEC, "THROTTLE_PAUSE_SEC": nao_gemini.THROTTLE_PAUSE_SEC}
+
+
+def camera_frame():
+    out = io.BytesIO()
+    Image.new("RGB", (640, 480), (90, 120, 200)).save(out, "JPEG", quality=85)
+    return types.Part.from_bytes(data=out.getvalue(), mime_type="image/jpeg")
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else float("nan")
+
+
+async def timed_call(client, robot, priority, contents, call, results):
+    start = time.monotonic()
+    try:
+        with nao_gemini.deadline(REPLY_BUDGET_SEC), nao_gemini.scheduling(robot, priority):
+            await nao_gemini.generate(client, MODEL_NAME, contents, call=call)
+        ok = True
+    except Exception:
+        ok = False
+    results.append((robot, priority, time.monotonic() - start, ok))
+
+
+async def robot_loop(client, robot, think_sec, args, rng, frame, end, results, background):
+    while time.monotonic() < end:
+        await asyncio.sleep(rng.lognormvariate(0, 0.5) * think_sec)
+        if rng.random() < args.prefetch_share:
+            background.append(asyncio.create_task(timed_call(client, robot, "background", PROMPT, "tutor", results)))
+        if rng.random() < args.vision_share:
+            await timed_call(client, robot, "vision", [PROMPT, frame], "vision", results)
+        else:
+            await timed_call(client, robot, "interactive", PROMPT, "tutor", results)
+
+
+async def run(client, args, seed):
+    rng = random.Random(seed)
+    frame = camera_frame()
+    results, background, depths = [], [], []
+    end = time.monotonic() + args.seconds
+
+    async def sample_depth():
+        while True:
+            depths.append(sum(nao_gemini.scheduler.depths().values()))
+            await asyncio.sleep(0.1)
+
+    sampler = asyncio.create_task(sample_depth())
+    robots = [f"robot{r:02d}" for r in range(args.robots)]
+    await asyncio.gather(*(
+        robot_loop(client, robot, args.think_sec / (args.chatty_factor if i == 0 else 1), args,
+                   random.Random(rng.random()), frame, end, results, background)
+        for i, robot in enumerate(robots)
+    ))
+    await asyncio.gather(*background)
+    sampler.cancel()
+    return results, max(depths or [0])
+
+
+def configure(mode, args):
+    scale = 60.0 / args.window
+    scheduled = mode == "scheduled"
+    nao_gemini.REQUESTS_PER_MINUTE = int(args.quota * scale) if scheduled else 0
+    nao_gemini.TOKENS_PER_MINUTE = int(args.quota_tokens * scale) if scheduled else 0
+    nao_gemini.QUOTA_BURST_SEC = DEFAULTS["QUOTA_BURST_SEC"] / scale
+    nao_gemini.THROTTLE_PAUSE_SEC = DEFAULTS["THROTTLE_PAUSE_SEC"] if scheduled else 0.0
+    nao_gemini.reset()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--robots", type=int, default=30)
+    parser.add_argument("--seconds", type=float, default=40.0, help="lesson time per mode")
+    parser.add_argument("--think-sec", type=float, default=4.0, help="median gap between a robot's turns")
+    parser.add_argument("--quota", type=int, default=80, help="requests allowed per window")
+    parser.add_argument("--quota-tokens", type=int, default=0, help="tokens allowed per window (0: no limit)")
+    parser.add_argument("--window", type=float, default=10.0, help="quota window in seconds")
+    parser.add_argument("--vision-share", type=float, default=0.1)
+    parser.add_argument("--prefetch-share", type=float, default=0.2)
+    parser.add_argument("--chatty-factor", type=float, default=5.0, help="how much more often robot00 talks")
+    parser.add_argument("--gemini", default="600:0.4", help="stand-in latency median_ms[:sigma[:stall_rate:stall_ms]]")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{args.robots} robots for {args.seconds:g} s, quota {args.quota} requests"
+          f"{f' / {args.quota_tokens} tokens' if args.quota_tokens else ''} per {args.window:g} s, "
+          f"stand-in {Latency.parse(args.gemini)!r}")
+    for mode in args.modes.split(","):
+        standin = GeminiStandIn(Latency.parse(args.gemini), seed=args.seed, quota_rpm=args.quota,
+                                quota_tpm=args.quota_tokens, quota_window_sec=args.window)
+        standin.start()
+        client = nao_gemini.create_client("classroom", standin.base_url)
+        configure(mode, args)
+        waits = defaultdict(list)
+        nao_gemini._queue_listeners[:] = [lambda priority, waited: waits[priority].append(waited)]
+        results, max_depth = asyncio.run(run(client, args, args.seed))
+        standin.stop()
+
+        print()
+        print(f"{mode}: {standin.calls['throttled']} x 429 from the stand-in, deepest queue {max_depth}")
+        print(f"{'class':<12}  {'calls':>5}  {'answered':>8}  {'p50 ms':>7}  {'p95 ms':>7}  {'queued p95 ms':>13}")
+        for priority in PRIORITIES:
+            rows = [r for r in results if r[1] == priority]
+            if not rows:
+                continue
+            times = [t * 1000 for _, _, t, _ in rows]
+            answered = sum(ok for *_, ok in rows) / len(rows)
+            queued = percentile(waits[priority], 0.95) * 1000 if waits[priority] else 0.0
+            print(f"{priority:<12}  {len(rows):>5}  {answered:>8.1%}  {statistics.median(times):>7.0f}  "
+                  f"{percentile(times, 0.95):>7.0f}  {queued:>13.0f}")
+        interactive = [r for r in results if r[1] == "interactive"]
+        chatty = [t * 1000 for robot, _, t, _ in interactive if robot == "robot00"]
+        others = [t * 1000 for robot, _, t, _ in interactive if robot != "robot00"]
+        print(f"interactive p95: chatty robot {percentile(chatty, 0.95):.0f} ms ({len(chatty)} calls), "
+              f"others {percentile(others, 0.95):.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""Load test: a growing fleet of virtual NAOs against the pipeline server.
+
+Every robot is the real Nao-Codes/nao_tutor_loop.py, run by a Python 2.7
+interpreter (--python) on the fake NAOqi in fake_nao/. It listens to canned
+answers, streams or uploads them, long-polls the replies and says them, and
+sends a canned photo ahead of time or when a reply asks for one. The host is
+the server's own serve(), with its HTTP endpoint on a local port, the Gemini
+stand-in (gemini_standin.py) and the stub STT engine, which knows the
+transcript of every canned answer. Each robot has six of them: an
+introduction, practice answers and a vision question.
+
+The fleet grows in steps (--robots 1,4,8,16). Each step runs new robots for
+--seconds and reports:
+- turns/s: turns the robots got an answer to, per second
+- first word: from NAO ending the recording to the first thing it says,
+  fillers included
+- answer: the same, to the first message that is not a filler
+- fallback: answers that were one of the server's apologies
+- robot err: turns where NAO apologised itself (no reply, no photo), plus
+  [ERROR] lines in the robot logs and robots that died
+Turns still open when a step ends are left out. Robot logs are kept with
+--keep.
+
+    python benchmarks/bench_fleet.py --robots 1,4,8,16 --seconds 60
+    python benchmarks/bench_fleet.py --robots 8 --mic file --no-speculative --python /usr/bin/python2.7
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import signal
+import socket
+import asyncio
+import argparse
+import tempfile
+import contextlib
+import statistics
+import subprocess
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parent.parent
+FAKE_NAO = ROOT / "benchmarks" / "fake_nao"
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "Nao-Codes"))
+sys.path.insert(0, str(FAKE_NAO))
+
+import nao_gemini
+import nao_pipeline_server as srv
+from nao_audio import pcm_wav, trim_silence
+from nao_cache import ResponseCache
+from nao_endpointing import Endpointer
+from nao_mic_stream import MicStream
+from nao_stt import StubEngine
+from naoqi import BUFFER_SAMPLES
+from gemini_standin import GeminiStandIn, Latency
+from bench_replay import ANSWERS, NAMES, TOPICS, VISION_QUESTION, percentile
+from bench_vad import RATE, RECORD_SECONDS, endpoint, make_turn, to_wav
+
+# What nao_tutor_loop.py says itself when a turn goes wrong.
+ROBOT_APOLOGIES = {
+    "Sorry, I did not hear you.",
+    "Sorry, I did not get a reply.",
+    "Sorry, I did not get the rest of my answer.",
+    "Sorry, I could not take a photo.",
+}
+ANSWERS_PER_ROBOT = 6
+# The robots authenticate to the endpoint as they would on a real network.
+FLEET_TOKEN = "fleet-token"
+
+
+def answer_texts(r):
+    name, topic = NAMES[r % len(NAMES)], TOPICS[r % len(TOPICS)]
+    texts = [f"Hi, my name is {name} and I want to learn about {topic}"]
+    for t in range(1, ANSWERS_PER_ROBOT):
+        text = VISION_QUESTION if t == 3 else ANSWERS[(t + r) % len(ANSWERS)]
+        texts.append(text.format(topic=topic, n=r * 10 + t))
+    return texts
+
+
+def streamed_wav(samples):
+    """What the host gets of a streamed answer: MicStream on the fake microphone's buffers."""
+    pcm = np.clip(samples, -32768, 32767).astype("<i2").tobytes()
+    size = BUFFER_SAMPLES * 2
+    pcm += b"\0" * (int(RECORD_SECONDS * RATE) * 2 + size)
+    mic = MicStream(lambda frame_seconds: Endpointer(frame_seconds, RECORD_SECONDS), RATE)
+    mic.start()
+    for offset in range(0, len(pcm) - size + 1, size):
+        mic.push(pcm[offset:offset + size])
+    with contextlib.redirect_stdout(io.StringIO()):
+        return pcm_wav(b"".join(mic.frames()), RATE)
+
+
+def canned_answers(folder, robots, seed):
+    """answers/<r>/*.wav for every robot, and the stub STT engine that knows what they say."""
+    rng = np.random.default_rng(seed)
+    engine = StubEngine(default="")
+    for r in range(robots):
+        answers = folder / "answers" / f"{r:02d}"
+        answers.mkdir(parents=True)
+        for t, text in enumerate(answer_texts(r)):
+            while True:
+                samples, speech = make_turn(rng)
+                heard, recorded = endpoint(samples)
+                if speech is not None and heard:
+                    break
+            data = to_wav(samples[:recorded])
+            (answers / f"{t:02d}.wav").write_bytes(data)
+            # Uploaded as recorded, or streamed from the microphone.
+            for wav in (data, streamed_wav(samples[:recorded])):
+                clip = trim_silence(wav)
+                if clip is not None:
+                    engine.add(clip.wav, text)
+    Image.new("RGB", (640, 480), (90, 120, 200)).save(folder / "frame.jpg", quality=85)
+    return engine
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_for_port(port, timeout):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            if loop.time() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+def read_turns(events_path, end):
+    """[(first_word_sec, answer_sec, outcome)] for the turns answered before end, and how many were still open."""
+    turns, current = [], None
+    if events_path.exists():
+        for line in events_path.read_text().splitlines():
+            event = json.loads(line)
+            if event["event"] == "listened":
+                current = {"listened": event["t"], "says": []}
+                turns.append(current)
+            elif event["event"] == "say" and current is not None:
+                current["says"].append(event)
+    done, open_turns = [], 0
+    for turn in turns:
+        answer = next((say for say in turn["says"] if say["text"] not in srv.FILLER_SPEECH), None)
+        if answer is None or answer["t"] > end:
+            open_turns += 1
+            continue
+        if answer["text"] in ROBOT_APOLOGIES:
+            outcome = "robot_error"
+        elif answer["text"] in srv.FALLBACK_REASONS:
+            outcome = "fallback"
+        else:
+            outcome = "ok"
+        done.append((turn["says"][0]["t"] - turn["listened"], answer["t"] - turn["listened"], outcome))
+    return done, open_turns
+
+
+async def run_step(args, step, robots, folder, port):
+    procs = []
+    for r in range(robots):
+        robot = f"fleet{step}-{r:02d}"
+        home = folder / robot
+        home.mkdir()
+        settings = {
+            "LAPTOP_SSH": "fleet@127.0.0.1",
+            "HOST_HTTP_PORT": port,
+            "HOST_HTTP_TOKEN": FLEET_TOKEN,
+            "LOCAL_DIR": str(home),
+            "MIC_MODE": args.mic,
+            "SPECULATIVE_CAPTURE": not args.no_speculative,
+        }
+        env = dict(os.environ,
+                   NAO_ROBOT_ID=robot,
+                   FAKE_NAO_ANSWERS=str(folder / "answers" / f"{r % args.answer_sets:02d}"),
+                   FAKE_NAO_FRAME="" if args.no_camera else str(folder / "frame.jpg"),
+                   FAKE_NAO_EVENTS=str(home / "events.jsonl"),
+                   FAKE_NAO_WORDS_PER_SEC=str(args.words_per_sec),
+                   FAKE_NAO_SETTINGS=json.dumps(settings))
+        with open(home / "robot.log", "wb") as log:
+            procs.append(await asyncio.create_subprocess_exec(
+                args.python, str(FAKE_NAO / "robot.py"), env=env, stdout=log, stderr=subprocess.STDOUT))
+    await asyncio.sleep(args.seconds)
+    # Robots stamp their events with time.time().
+    end = time.time()
+
+    died = sum(p.returncode is not None for p in procs)
+    for p in procs:
+        if p.returncode is None:
+            p.send_signal(signal.SIGINT)
+    for p in procs:
+        try:
+            await asyncio.wait_for(p.wait(), 5)
+        except asyncio.TimeoutError:
+            p.kill()
+            await p.wait()
+
+    done, open_turns, log_errors = [], 0, 0
+    for r in range(robots):
+        home = folder / f"fleet{step}-{r:02d}"
+        turns, still_open = read_turns(home / "events.jsonl", end)
+        done += turns
+        open_turns += still_open
+        log = (home / "robot.log").read_text(errors="replace")
+        log_errors += sum(line.startswith("[ERROR]") for line in log.splitlines())
+    return {"robots": robots, "turns": done, "open": open_turns, "log_errors": log_errors, "died": died}
+
+
+async def run_fleet(args, steps, folder, standin, engine):
+    srv.INCOMING_DIR, srv.OUTGOING_DIR, srv.IMAGES_DIR = folder / "incoming", folder / "outgoing", folder / "images"
+    srv.watcher = srv.make_watcher()
+    srv.client = nao_gemini.create_client("fleet", standin.base_url)
+    srv.stt_engine = engine
+    srv.NAO_HTTP_HOST, srv.NAO_HTTP_PORT = "127.0.0.1", free_port()
+    srv.NAO_HTTP_TOKEN = FLEET_TOKEN
+    srv.METRICS_PORT = 0
+    srv.JOURNAL_DIR = str(folder / "journal")
+    srv.FILLER_AFTER_MS = args.filler_ms
+    if args.no_cache:
+        srv.response_cache = ResponseCache(max_entries=0)
+    server = asyncio.create_task(srv.serve())
+    await wait_for_port(srv.NAO_HTTP_PORT, 30)
+
+    rows = []
+    try:
+        for step, robots in enumerate(steps):
+            rows.append(await run_step(args, step, robots, folder, srv.NAO_HTTP_PORT))
+            print_row(args, rows[-1], file=sys.__stdout__)
+    finally:
+        server.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await server
+    return rows
+
+
+def print_header():
+    print(f"{'robots':>6}  {'turns':>5}  {'turns/s':>7}  {'first word p50':>14}  "
+          f"{'answer p50':>10}  {'p95':>6}  {'p99':>6}  {'fallback':>8}  {'robot err':>9}  {'open':>4}")
+
+
+def print_row(args, row, file=None):
+    turns = row["turns"]
+    if not turns:
+        print(f"{row['robots']:>6}  {0:>5}  {'-':>7}   no answered turns; "
+              f"{row['log_errors']} logged errors, {row['died']} robots died", file=file)
+        return
+    first = [t[0] * 1000 for t in turns]
+    answer = [t[1] * 1000 for t in turns]
+    fallback = sum(t[2] == "fallback" for t in turns) / len(turns)
+    robot_err = sum(t[2] == "robot_error" for t in turns) / len(turns)
+    extra = f"  ({row['log_errors']} logged errors, {row['died']} died)" if row["log_errors"] or row["died"] else ""
+    print(f"{row['robots']:>6}  {len(turns):>5}  {len(turns) / args.seconds:>7.2f}  {statistics.median(first):>11.0f} ms  "
+          f"{statistics.median(answer):>7.0f} ms  {percentile(answer, 95):>6.0f}  {percentile(answer, 99):>6.0f}  "
+          f"{fallback:>8.1%}  {robot_err:>9.1%}  {row['open']:>4}{extra}", file=file, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--robots", default="1,4,8,16", help="fleet size of each step")
+    parser.add_argument("--seconds", type=float, default=60.0, help="length of each step")
+    parser.add_argument("--python", default="python2", help="Python 2.7 interpreter for the robots")
+    parser.add_argument("--mic", choices=["stream", "file"], default="stream", help="the loop's MIC_MODE")
+    parser.add_argument("--no-speculative", action="store_true", help="photos only when a reply asks for one")
+    parser.add_argument("--no-camera", action="store_true", help="every photo the robots take fails")
+    parser.add_argument("--words-per-sec", type=float, default=3.0, help="fake TTS speaking rate, 0: instant")
+    parser.add_argument("--answer-sets", type=int, default=10,
+                        help="distinct sets of canned answers; robots sharing one hit the response cache")
+    parser.add_argument("--gemini", default="600:0.4", help="stand-in latency median_ms[:sigma[:stall_rate:stall_ms]]")
+    parser.add_argument("--stt-latency", default="300:0.3", help="stub STT latency, same format as --gemini")
+    parser.add_argument("--filler-ms", type=int, default=srv.FILLER_AFTER_MS, help="filler message budget, 0 disables")
+    parser.add_argument("--no-cache", action="store_true", help="disable the tutor/profile response cache")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--keep", metavar="DIR", help="keep robot logs, events and uploads here")
+    parser.add_argument("--verbose", action="store_true", help="show the server's log")
+    args = parser.parse_args()
+    steps = [int(n) for n in args.robots.split(",")]
+
+    try:
+        subprocess.run([args.python, "-c", "import audioop, httplib"], check=True, capture_output=True)
+    except (OSError, subprocess.CalledProcessError):
+        sys.exit(f"the robots need a Python 2.7 interpreter; {args.python!r} is not one (use --python)")
+
+    with contextlib.ExitStack() as stack:
+        if args.keep:
+            folder = Path(args.keep)
+            folder.mkdir(parents=True, exist_ok=True)
+        else:
+            folder = Path(stack.enter_context(tempfile.TemporaryDirectory(prefix="nao-fleet-")))
+        engine = canned_answers(folder, args.answer_sets, args.seed)
+        rng = random.Random(args.seed)
+        latency = Latency.parse(args.stt_latency)
+        engine.latency = lambda: latency.sample(rng)
+
+        standin = GeminiStandIn(Latency.parse(args.gemini), seed=args.seed)
+        standin.start()
+        print(f"fleet of {args.robots} robots, {args.seconds:g} s per step, mic {args.mic}, "
+              f"stand-in {Latency.parse(args.gemini)!r}")
+        print_header()
+        log = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with log:
+            asyncio.run(run_fleet(args, steps, folder, standin, engine))
+        standin.stop()
+        print(f"Gemini stand-in calls: {dict(standin.calls)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Tail latency of Gemini calls with and without the nao_gemini call policy.
+
+Sends tutor-sized requests to the local Gemini stand-in (gemini_standin.py)
+whose latency has a lognormal body plus occasional stalls, and some calls
+fail with 503. Each call runs under the server's per-reply deadline and ends
+either with Gemini's answer or, when it fails ("fallback"), with the local
+degraded reply. Policies:
+- sdk: the bare SDK call, as before (no deadline, 60 s HTTP timeout)
+- retry: per-call timeout from the deadline + jittered retries + breaker
+- hedge: retry, plus a second request after the rolling p95
+
+Then an outage: every request fails, with the circuit breaker on and off.
+
+    python benchmarks/bench_gemini_tail.py --calls 300 --gemini 600:0.4:0.03:20000 --error-rate 0.02
+    python benchmarks/bench_gemini_tail.py --stream     # time to the first streamed chunk
+"""
+import sys
+import time
+import asyncio
+import argparse
+import contextlib
+import statistics
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import nao_gemini
+from gemini_standin import GeminiStandIn, Latency
+
+MODEL_NAME = "models/gemini-2.5-flash"
+PROMPT = "Student said: I likes apples. Return ONLY this JSON format."
+POLICIES = ("sdk", "retry", "hedge")
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def upstream_requests(standin):
+    return sum(count for kind, count in standin.calls.items() if kind not in ("get", "errors", "throttled"))
+
+
+async def one_call(client, policy, stream, budget):
+    start = time.monotonic()
+    try:
+        if policy == "sdk":
+            if stream:
+                response = await client.aio.models.generate_content_stream(model=MODEL_NAME, contents=PROMPT)
+                async for _ in response:
+                    break
+                await response.aclose()
+            else:
+                await client.aio.models.generate_content(model=MODEL_NAME, contents=PROMPT)
+        else:
+            with nao_gemini.deadline(budget):
+                if stream:
+                    async with contextlib.aclosing(nao_gemini.generate_stream(client, MODEL_NAME, PROMPT, call="tutor")) as chunks:
+                        async for _ in chunks:
+                            break
+                else:
+                    await nao_gemini.generate(client, MODEL_NAME, PROMPT, call="tutor")
+        ok = True
+    except Exception:
+        ok = False
+    return time.monotonic() - start, ok
+
+
+async def run(client, policy, calls, concurrency, stream, budget):
+    slots = asyncio.Semaphore(concurrency)
+
+    async def worker():
+        async with slots:
+            return await one_call(client, policy, stream, budget)
+
+    return await asyncio.gather(*(worker() for _ in range(calls)))
+
+
+def configure(policy, breaker=True):
+    nao_gemini.HEDGE_REQUESTS = policy == "hedge"
+    nao_gemini.BREAKER_FAILURES = 5 if breaker else 10 ** 9
+    nao_gemini.reset()
+
+
+def row(name, results, requests, calls):
+    times = [t * 1000 for t, _ in results]
+    failed = sum(1 for _, ok in results if not ok)
+    events = nao_gemini.stats
+    retries = sum(count for (_, event), count in events.items() if event == "retry")
+    hedges = sum(count for (_, event), count in events.items() if event == "hedge")
+    rejected = sum(count for (_, event), count in events.items() if event == "rejected")
+    print(f"{name:<14}  {statistics.median(times):>7.0f}  {percentile(times, 0.95):>7.0f}  {percentile(times, 0.99):>7.0f}  "
+          f"{max(times):>7.0f}  {failed / len(results) * 100:>8.1f}  {requests / calls:>8.2f}  "
+          f"{retries:>7}  {hedges:>6}  {rejected:>8}")
+
+
+def header():
+    print(f"{'policy':<14}  {'p50 ms':>7}  {'p95 ms':>7}  {'p99 ms':>7}  {'max ms':>7}  {'fallback':>8}  "
+          f"{'req/call':>8}  {'retries':>7}  {'hedges':>6}  {'rejected':>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8, help="calls in flight (robots waiting on a reply)")
+    parser.add_argument("--gemini", default="600:0.4:0.03:20000", help="stand-in latency median_ms[:sigma[:stall_rate:stall_ms]]")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="share of requests failing with 503")
+    parser.add_argument("--budget", type=float, default=15.0, help="per-reply deadline in seconds (REPLY_BUDGET_SEC)")
+    parser.add_argument("--warmup", type=int, default=40, help="unmeasured calls that fill the latency window")
+    parser.add_argument("--outage-calls", type=int, default=60, help="calls during a full outage (0 skips it)")
+    parser.add_argument("--policies", default=",".join(POLICIES))
+    parser.add_argument("--stream", action="store_true", help="time to the first chunk of a streamed reply")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    standin = GeminiStandIn(Latency.parse(args.gemini), error_rate=args.error_rate, seed=args.seed)
+    standin.start()
+    client = nao_gemini.create_client("bench", standin.base_url)
+
+    async def bench():
+        print(f"stand-in {Latency.parse(args.gemini)!r}, {args.error_rate:.0%} errors, "
+              f"{args.calls} {'streamed ' if args.stream else ''}calls, {args.concurrency} in flight, "
+              f"{args.budget:g} s deadline")
+        header()
+        for policy in args.policies.split(","):
+            configure(policy)
+            await run(client, policy, args.warmup, args.concurrency, args.stream, args.budget)
+            nao_gemini.stats.clear()
+            before = upstream_requests(standin)
+            results = await run(client, policy, args.calls, args.concurrency, args.stream, args.budget)
+            row(policy, results, upstream_requests(standin) - before, args.calls)
+
+        if not args.outage_calls:
+            return
+        print()
+        print(f"outage: every request fails with {standin.error_status}")
+        header()
+        standin.error_rate = 1.0
+        for name, breaker in (("breaker off", False), ("breaker on", True)):
+            configure("hedge", breaker)
+            before = upstream_requests(standin)
+            results = await run(client, "hedge", args.outage_calls, args.concurrency, args.stream, args.budget)
+            row(name, results, upstream_requests(standin) - before, args.outage_calls)
+
+    asyncio.run(bench())
+    standin.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Prompt size and tutor latency over a long lesson, with and without lesson memory.
+
+Runs one learner through --turns turns of the server's handle_turn (stub STT,
+Gemini stand-in whose delay grows by --prefill-ms per 1000 prompt tokens),
+pausing --gap-ms between turns while NAO would speak. Modes:
+- off: the tutor prompt carries the current answer only (MEMORY_BUDGET_TOKENS=0)
+- full: the whole conversation so far, word for word
+- rolling: nao_memory within the default budget, older turns folded into a
+  summary in the background every few turns
+
+Reported per mode: tutor prompt tokens at a few points of the lesson and at
+most, all prompt tokens sent (summaries included), summary calls, and the
+mean tutor call time over the first and the last ten turns.
+
+    python benchmarks/bench_memory.py --turns 40 --prefill-ms 80
+"""
+import io
+import sys
+import json
+import shutil
+import asyncio
+import argparse
+import tempfile
+import contextlib
+import statistics
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import nao_gemini
+import nao_pipeline_server as srv
+from nao_audio import to_wav, trim_silence
+from nao_cache import ResponseCache
+from nao_sessions import Session
+from nao_stt import StubEngine
+from gemini_standin import GeminiStandIn, Latency
+from bench_replay import ANSWERS, stage_times, write_upload
+from bench_vad import endpoint, make_turn, to_wav as pcm_to_wav
+
+MODES = {"off": 0, "full": 10 ** 9, "rolling": srv.MEMORY_BUDGET_TOKENS}
+CHECKPOINTS = (5, 20, 40, 80)
+
+
+def synthesize(folder, turns, seed):
+    """A learner's answers and the stub STT engine that knows them."""
+    rng = np.random.default_rng(seed)
+    engine = StubEngine(default="")
+    # Only tutor turns: anything that sounds like a vision request would wait for a photo.
+    answers = [a for a in ANSWERS if not srv.needs_vision(a)]
+    paths = []
+    for t in range(turns):
+        text = "Hi, my name is Anna and I want to learn about animals" if t == 0 else answers[t % len(answers)]
+        text = text.format(topic="animals", n=t)
+        while True:
+            samples, speech = make_turn(rng)
+            heard, recorded = endpoint(samples)
+            if speech is not None and heard:
+                break
+        path = folder / f"input_lesson_{1000 + t}.wav"
+        path.write_bytes(pcm_to_wav(samples[:recorded]))
+        engine.add(trim_silence(to_wav(path.read_bytes())).wav, text)
+        paths.append(path)
+    return engine, paths
+
+
+async def lesson(paths, args, standin, budget, engine):
+    root = Path(tempfile.mkdtemp(prefix="nao-memory-"))
+    srv.INCOMING_DIR, srv.OUTGOING_DIR, srv.IMAGES_DIR = root / "incoming", root / "outgoing", root / "images"
+    for directory in (srv.INCOMING_DIR, srv.OUTGOING_DIR, srv.IMAGES_DIR):
+        directory.mkdir()
+    srv.watcher = srv.make_watcher()
+    srv.watcher.listen(lambda event: None)
+    srv.watcher.start()
+    srv.client = nao_gemini.create_client("memory", standin.base_url)
+    srv.stt_engine = engine
+    srv.response_cache = ResponseCache(max_entries=0)
+    srv.MEMORY_BUDGET_TOKENS = budget
+    srv.tracer.trace_path = root / "trace.jsonl"
+    session = Session("lesson", srv.default_state())
+    try:
+        for path in paths:
+            dest = srv.INCOMING_DIR / path.name
+            await srv.run_blocking(write_upload, path, dest, True)
+            await srv.handle_turn(session, dest)
+            await asyncio.sleep(args.gap_ms / 1000.0)
+        if session.summarizing is not None:
+            await session.summarizing
+        traces = [json.loads(line) for line in srv.tracer.trace_path.read_text().splitlines()]
+    finally:
+        srv.watcher.stop()
+        shutil.rmtree(root, ignore_errors=True)
+    return [stage_times(trace).get("tutor") for trace in traces]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--gemini", default="600:0.2", help="stand-in latency median_ms[:sigma[:stall_rate:stall_ms]]")
+    parser.add_argument("--prefill-ms", type=float, default=80.0, help="extra stand-in delay per 1000 prompt tokens")
+    parser.add_argument("--gap-ms", type=float, default=500.0, help="pause between turns")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    checkpoints = [c for c in CHECKPOINTS if c <= args.turns]
+    print(f"one lesson of {args.turns} turns, stand-in {Latency.parse(args.gemini)!r} "
+          f"+ {args.prefill_ms:g} ms per 1000 prompt tokens, memory budget {srv.MEMORY_BUDGET_TOKENS} tokens")
+    print(f"{'mode':<8}  " + "  ".join(f"{f'turn {c}':>7}" for c in checkpoints)
+          + f"  {'max':>6}  {'all tokens':>10}  {'summaries':>9}  {'tutor ms first 10':>17}  {'last 10':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, paths = synthesize(Path(tmp), args.turns, args.seed)
+        for mode in args.modes.split(","):
+            standin = GeminiStandIn(Latency.parse(args.gemini), seed=args.seed, prefill_ms=args.prefill_ms)
+            standin.start()
+            with contextlib.redirect_stdout(io.StringIO()):
+                tutor_times = asyncio.run(lesson(paths, args, standin, MODES[mode], engine))
+            standin.stop()
+
+            # The profile turn makes no tutor call; the first call is the introduction of turn 2.
+            tokens = {i + 2: n for i, n in enumerate(standin.prompt_tokens["tutor"])}
+            times = [t * 1000 for t in tutor_times if t is not None]
+            everything = sum(sum(v) for v in standin.prompt_tokens.values())
+            print(f"{mode:<8}  " + "  ".join(f"{tokens.get(c, 0):>7}" for c in checkpoints)
+                  + f"  {max(tokens.values()):>6}  {everything:>10}  {standin.calls['summary']:>9}  "
+                  f"{statistics.mean(times[:10]):>17.0f}  {statistics.mean(times[-10:]):>7.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""End of speech to transcript ready: file upload vs streaming from the microphone.
+
+Synthesises endpointed learner answers (see bench_vad.py) and plays each one
+into NAO-side code in real time:
+- file: the answer is recorded to a WAV, uploaded with HttpTransport.upload
+  once the learner stops, trimmed on the host and transcribed whole
+- stream: 100 ms microphone buffers go through nao_mic_stream.MicStream and
+  HttpTransport.stream_upload while the learner talks; the host endpoint
+  feeds them to an incremental recognizer as they arrive (LiveAudio), so
+  only the final result is left once NAO ends the stream
+
+The host endpoint runs in this process behind a local proxy that caps the
+bandwidth. STT is a stand-in costing `rtf` seconds per second of audio plus a
+fixed overhead per result, so the numbers do not depend on Vosk being
+installed; pass the real-time factor of the engine on your laptop. Answers
+play in real time, so a run takes a few seconds per turn.
+
+    python benchmarks/bench_mic_stream.py --turns 10 --caps 0.5,2,0 --rtf 0.3
+"""
+import io
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+import contextlib
+import statistics
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "Nao-Codes"))
+
+from nao_audio import to_wav, trim_silence
+from nao_http import NaoHttpEndpoint
+from nao_live_audio import LiveAudio
+from nao_watcher import DirectoryWatcher
+from nao_endpointing import Endpointer
+from nao_mic_stream import MicStream
+from nao_transport import HttpTransport
+from bench_audio_codec import Throttle, make_answers
+from bench_vad import FRAME_SECONDS, RATE, RECORD_SECONDS, endpoint, to_wav as pcm_to_wav
+
+
+class StandInEngine:
+    """Sleeps like an STT engine with the given real-time factor."""
+
+    name = "stand-in"
+
+    def __init__(self, rtf, overhead_sec):
+        self.rtf = rtf
+        self.overhead_sec = overhead_sec
+
+    def transcribe(self, wav_bytes):
+        seconds = (len(wav_bytes) - 44) / 2.0 / RATE
+        time.sleep(self.overhead_sec + seconds * self.rtf)
+        return "text"
+
+    def stream(self, rate):
+        return StandInStream(self, rate)
+
+
+class StandInStream:
+    def __init__(self, engine, rate):
+        self.engine = engine
+        self.rate = rate
+
+    def accept(self, pcm):
+        time.sleep(len(pcm) / 2.0 / self.rate * self.engine.rtf)
+
+    def result(self):
+        time.sleep(self.engine.overhead_sec)
+        return "text"
+
+
+class Host:
+    """NaoHttpEndpoint on its own event loop, noting when each streamed transcript is ready."""
+
+    def __init__(self, root, engine):
+        self.root = root
+        self.engine = engine
+        self.port = None
+        self.ready = {}
+        self._events = {}
+        started = threading.Event()
+        threading.Thread(target=self._run, args=(started,), daemon=True).start()
+        started.wait(5)
+
+    def _run(self, started):
+        async def main():
+            loop = asyncio.get_running_loop()
+            watcher = DirectoryWatcher()
+            watcher.add(self.root / "outgoing", "*.json", "outgoing")
+            watcher.listen(lambda event: None)
+            watcher.start()
+
+            async def blocking(func, *args):
+                return await loop.run_in_executor(None, func, *args)
+
+            def on_stream(path, rate, extra):
+                live = LiveAudio(path, rate, extra, self.engine.stream(rate), blocking)
+                loop.create_task(self._transcribe(live, blocking))
+                return live
+
+            endpoint = NaoHttpEndpoint(watcher, self.root / "incoming", self.root / "images",
+                                       self.root / "outgoing", on_stream=on_stream)
+            with contextlib.redirect_stdout(io.StringIO()):
+                await endpoint.start("127.0.0.1", 0)
+            self.port = endpoint._server.sockets[0].getsockname()[1]
+            started.set()
+            await asyncio.Event().wait()
+
+        asyncio.run(main())
+
+    async def _transcribe(self, live, blocking):
+        # As stt_from_live does in the server.
+        await live.wait_closed()
+        await blocking(trim_silence, live.wav())
+        await blocking(live.recognizer.result)
+        self.ready[live.path.stem] = time.perf_counter()
+        self.event(live.path.stem).set()
+
+    def event(self, stem):
+        return self._events.setdefault(stem, threading.Event())
+
+
+def play(mic, samples):
+    """Push the answer into the stream in real time, like ALAudioDevice would."""
+    frame = int(FRAME_SECONDS * RATE)
+    pcm = np.clip(samples, -32768, 32767).astype("<i2").tobytes()
+    start = time.perf_counter()
+    for i, offset in enumerate(range(0, len(pcm), frame * 2)):
+        if not mic.listening:
+            break
+        time.sleep(max(0.0, start + (i + 1) * FRAME_SECONDS - time.perf_counter()))
+        mic.push(pcm[offset:offset + frame * 2])
+
+
+def stream_turn(http, host, samples, stem):
+    mic = MicStream(lambda frame_seconds: Endpointer(frame_seconds, RECORD_SECONDS), RATE)
+    mic.start()
+    player = threading.Thread(target=play, args=(mic, samples), daemon=True)
+    player.start()
+    ended = []
+
+    def frames():
+        for buffer in mic.frames():
+            yield buffer
+        ended.append(time.perf_counter())
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        sent = http.stream_upload("stream", stem + ".pcm", frames(), None, "rate=%d" % RATE)
+    mic.stop()
+    player.join()
+    if not sent:
+        return None
+    host.event(stem).wait(30)
+    return host.ready[stem] - ended[0]
+
+
+def file_turn(http, engine, samples, stem, nao_dir):
+    # Only what happens after the learner stops counts; recording itself is the same in both modes.
+    _, recorded = endpoint(samples)
+    start = time.perf_counter()
+    data = pcm_to_wav(samples[:recorded])
+    path = nao_dir / (stem + ".wav")
+    path.write_bytes(data)
+    http.upload(str(path), "incoming", path.name)
+    clip = trim_silence(to_wav(data))
+    engine.transcribe(clip.wav)
+    return time.perf_counter() - start
+
+
+def summary(samples):
+    ms = sorted(s * 1000 for s in samples)
+    p95 = ms[max(0, int(len(ms) * 0.95) - 1)]
+    return f"{statistics.mean(ms):>7.0f} ({p95:>5.0f})"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--caps", default="0.5,2,0", help="bandwidth caps in Mbit/s (0: no cap)")
+    parser.add_argument("--rtf", type=float, default=0.3, help="STT seconds per second of audio")
+    parser.add_argument("--overhead-ms", type=float, default=50.0, help="STT cost per transcript")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    engine = StandInEngine(args.rtf, args.overhead_ms / 1000)
+    answers = make_answers(args.turns, args.seed)
+    seconds = statistics.mean(endpoint(a)[1] / RATE for a in answers)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        for name in ("incoming", "images", "outgoing", "nao"):
+            (root / name).mkdir()
+        host = Host(root, engine)
+        throttle = Throttle(host.port)
+        http = HttpTransport("127.0.0.1", throttle.port)
+
+        print(f"{len(answers)} answers, {seconds:.2f} s recorded on average, STT rtf {args.rtf:g}")
+        print("end of speech to transcript, mean ms (p95)")
+        print(f"{'Mbit/s':>7}  {'file':>15}  {'stream':>15}")
+        for cap in [float(c) for c in args.caps.split(",")]:
+            throttle.rate = cap * 1e6 / 8 if cap else None
+            files, streams = [], []
+            for i, samples in enumerate(answers):
+                files.append(file_turn(http, engine, samples, f"input_file_{cap}_{i}", root / "nao"))
+                streamed = stream_turn(http, host, samples, f"input_stream_{cap}_{i}")
+                if streamed is not None:
+                    streams.append(streamed)
+            print(f"{cap if cap else 'none':>7}  {summary(files)}  {summary(streams)}")
+        http.close()
+
+
+if __name__ == "__main__":
+    main()
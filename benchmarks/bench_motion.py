@@ -0,0 +1,118 @@
+"""Time to the first word of a reply with sequential gestures vs nao_motion.
+
+Replays random gesture pairs from the model (up to two per message) on a
+virtual clock where every NAOqi proxy call costs --rpc-ms:
+- legacy: the old say_and_move, a blocking 0.5 s LED fade, then each gesture
+  as setStiffnesses x3 + setAngles chains with sleeps, then tts.say
+- engine: LEDs and speech posted, the precompiled timeline posted with them
+  and delayed by SPEECH_ONSET_SECONDS
+
+and reports the delay from the message arriving to the first audible word,
+how far the first movement is from it, and the proxy calls per message.
+The legacy sleeps are copied from perform_gesture as it was before nao_motion.
+
+    python benchmarks/bench_motion.py --messages 500 --rpc-ms 15
+"""
+import sys
+import random
+import argparse
+import statistics
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "Nao-Codes"))
+
+from nao_motion import GESTURES, MotionEngine
+
+SPEECH_ONSET_SECONDS = 0.25
+LED_FADE_SECONDS = 0.5
+
+# gesture -> (setAngles calls, seconds slept) of the old perform_gesture,
+# which also set stiffness three times and slept 0.2 s after every gesture.
+LEGACY = {
+    "wave": (7, 0.3 + 4 * 0.2),
+    "nod": (3, 0.6),
+    "shake_head": (3, 0.6),
+    "look_up": (2, 0.5),
+    "look_left": (2, 0.5),
+    "look_right": (2, 0.5),
+    "hand_open": (3, 0.5),
+    "hand_close": (3, 0.5),
+    "think": (4, 0.6),
+}
+
+
+class Proxy:
+    """Counts calls, and posts, of a NAOqi proxy; returns task ids."""
+
+    def __init__(self):
+        self.calls = 0
+        self.post = self
+
+    def __getattr__(self, name):
+        def call(*args):
+            self.calls += 1
+            return self.calls
+        return call
+
+
+def legacy(gestures, rpc):
+    """Seconds to the first word, seconds from the first movement to it, proxy calls."""
+    clock = rpc + LED_FADE_SECONDS
+    calls = 1
+    first_move = None
+    for gesture in gestures[:2]:
+        angles, slept = LEGACY[gesture]
+        clock += 3 * rpc
+        if first_move is None:
+            first_move = clock
+        clock += angles * rpc + slept + 0.2
+        calls += 3 + angles
+    clock += rpc
+    calls += 1
+    word = clock + SPEECH_ONSET_SECONDS
+    return word, None if first_move is None else word - first_move, calls
+
+
+def engine(motion, proxy, gestures, rpc):
+    before = proxy.calls
+    clock = 2 * rpc
+    speech_at = clock + SPEECH_ONSET_SECONDS
+    move_at = None
+    if motion.start(gestures) is not None:
+        clock += rpc
+        move_at = clock + motion.delay_seconds
+    return speech_at, None if move_at is None else speech_at - move_at, 2 + proxy.calls - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--rpc-ms", type=float, default=15.0, help="cost of one NAOqi proxy call")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    rpc = args.rpc_ms / 1000
+
+    proxy = Proxy()
+    motion = MotionEngine(proxy, SPEECH_ONSET_SECONDS)
+    setup_calls = proxy.calls
+    names = sorted(GESTURES)
+    rows = {"legacy": [], "engine": []}
+    for _ in range(args.messages):
+        gestures = rng.sample(names, rng.choice((0, 1, 2, 2)))
+        rows["legacy"].append(legacy(gestures, rpc))
+        rows["engine"].append(engine(motion, proxy, gestures, rpc))
+
+    print(f"{args.messages} messages, {args.rpc_ms:g} ms per proxy call, "
+          f"engine setup: {setup_calls} call(s), {len(motion._timelines)} timelines compiled")
+    print(f"{'mode':<8}  {'first word ms':>13}  {'p95 ms':>7}  {'move-to-word ms':>15}  {'calls/msg':>9}")
+    for mode, results in rows.items():
+        words = sorted(r[0] * 1000 for r in results)
+        gaps = [r[1] * 1000 for r in results if r[1] is not None]
+        print(f"{mode:<8}  {statistics.mean(words):>13.0f}  {words[int(0.95 * (len(words) - 1))]:>7.0f}  "
+              f"{statistics.mean(gaps):>15.0f}  {statistics.mean(r[2] for r in results):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Profile extraction: local extractor vs a Gemini round trip.
+
+Runs nao_profile.guess_profile over a corpus of transcribed intro
+utterances (one JSON object per line with the expected name and topic) and
+reports its per-call latency and accuracy. The corpus includes "I'm
+<nationality or mood>" lines with no name, which must not be taken for one.
+For each confidence threshold it shows how many turns skip the model, how
+many of those it gets right and wrong, and the expected collect_profile
+latency. Model latency is a flag; pass --gemini to call the real model for
+the fallbacks instead (needs GEMINI_API_KEY). Without it, the fallbacks are
+counted as unknown, not as right.
+
+    python benchmarks/bench_profile_extractor.py --model-ms 900
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from nao_profile import canonical_topic, guess_profile
+
+CORPUS = Path(__file__).resolve().parent / "intro_utterances.jsonl"
+THRESHOLDS = [0.5, 0.6, 0.7, 0.8, 0.9]
+
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def same_name(got, want):
+    return (got or "").strip().lower() == (want or "").strip().lower()
+
+
+def same_topic(got, want):
+    return canonical_topic(got) == canonical_topic(want)
+
+
+def time_local(corpus, repeats):
+    samples = []
+    for _ in range(repeats):
+        for item in corpus:
+            start = time.perf_counter()
+            guess_profile(item["text"])
+            samples.append(time.perf_counter() - start)
+    samples.sort()
+    return statistics.mean(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def is_confident(guess, threshold):
+    # A fresh session needs both fields; the server only skips the model if both clear the bar.
+    return all(guess[field] and guess[field + "_confidence"] >= threshold for field in ("name", "topic"))
+
+
+async def gemini_profiles(corpus):
+    import nao_gemini
+    import nao_pipeline_server as server
+    from nao_cache import ResponseCache
+
+    server.client = nao_gemini.create_client(os.environ["GEMINI_API_KEY"])
+    server.response_cache = ResponseCache(max_entries=0)
+    out = []
+    for item in corpus:
+        start = time.perf_counter()
+        profile = await server.gemini_extract_profile(item["text"])
+        out.append((profile, time.perf_counter() - start))
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=Path, default=CORPUS)
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--model-ms", type=float, default=900.0, help="assumed Gemini round trip")
+    parser.add_argument("--gemini", action="store_true", help="call the real model for fallbacks")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    guesses = [guess_profile(item["text"]) for item in corpus]
+    mean_sec, p99_sec = time_local(corpus, args.repeats)
+
+    name_ok = sum(same_name(g["name"], item["name"]) for g, item in zip(guesses, corpus))
+    topic_ok = sum(same_topic(g["topic"], item["topic"]) for g, item in zip(guesses, corpus))
+    print(f"corpus: {len(corpus)} utterances")
+    print(f"local extractor: mean {mean_sec * 1e6:.1f} us, p99 {p99_sec * 1e6:.1f} us")
+    print(f"local accuracy: name {name_ok / len(corpus):.0%}, topic {topic_ok / len(corpus):.0%}")
+
+    model = None
+    model_sec = args.model_ms / 1000
+    if args.gemini:
+        model = asyncio.run(gemini_profiles(corpus))
+        model_sec = statistics.mean(seconds for _, seconds in model)
+        both = sum(same_name(p["name"], item["name"]) and same_topic(p["topic"], item["topic"]) for (p, _), item in zip(model, corpus))
+        print(f"gemini: mean {model_sec * 1000:.0f} ms, both fields right {both / len(corpus):.0%}")
+
+    print()
+    print(f"{'threshold':>9}  {'local':>6}  {'local right':>11}  {'local wrong':>11}  {'hybrid right':>12}  {'unknown':>7}  {'mean ms':>8}")
+    for threshold in THRESHOLDS:
+        local = right = hybrid = unknown = 0
+        for i, (guess, item) in enumerate(zip(guesses, corpus)):
+            if is_confident(guess, threshold):
+                local += 1
+                ok = same_name(guess["name"], item["name"]) and same_topic(guess["topic"], item["topic"])
+                right += ok
+                hybrid += ok
+            elif model is not None:
+                profile = model[i][0]
+                hybrid += same_name(profile["name"], item["name"]) and same_topic(profile["topic"], item["topic"])
+            else:
+                # Without --gemini nobody checks the fallback.
+                unknown += 1
+        mean_ms = (mean_sec + (len(corpus) - local) / len(corpus) * model_sec) * 1000
+        local_right = f"{right / local:.0%}" if local else "-"
+        print(f"{threshold:>9.2f}  {local / len(corpus):>6.0%}  {local_right:>11}  {local - right:>11}  "
+              f"{hybrid / len(corpus):>12.0%}  {unknown / len(corpus):>7.0%}  {mean_ms:>8.0f}")
+    print(f"{'gemini':>9}  {0:>6.0%}  {'-':>11}  {'-':>11}  {'-':>12}  {'-':>7}  {model_sec * 1000:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""Replay recorded sessions through the pipeline and break down turn latency.
+
+Each robot's turns (input_<robot>_<ts>.wav/.ogg/.adpcm plus image_<robot>_<ts>.jpg
+for vision turns, optional input_*.txt transcripts) are uploaded in order the
+way NAO would, with .done markers, and run through the server's handle_turn,
+robots concurrently. Gemini is the local stand-in (gemini_standin.py) reached
+through the real SDK. STT is the stub engine, which returns the .txt
+transcripts, unless --stt names a real engine. Both have configurable
+latency distributions.
+
+Per-stage latency (mean, p50/p95/p99 ms) comes from the server's own turn
+traces (nao_trace):
+- upload_wait: stable-file / .done marker wait
+- stt: decode, silence trim and recognition
+- profile: name/topic extraction (local extractor or Gemini)
+- tutor / vision: the Gemini call, including streamed message writes
+- image_wait: waiting for the camera frame on vision turns
+- write: reply file writes (summed per turn)
+- first_message: from upload to the first real reply NAO can fetch
+- filler: from upload to the filler, on turns that got one (--filler-ms)
+- turn: the whole turn
+- turn_1 / turn_2: the whole turn, for each robot's first two turns (profile
+  and introduction, which --no-prefetch stops generating ahead of time;
+  use --gap-ms to give the prefetch the time NAO spends speaking)
+Spans that occur several times in a turn are summed.
+
+Results, throughput and the git commit go to --out as JSON. --compare prints
+the change against an earlier result file.
+
+    python benchmarks/bench_replay.py --synthetic 8 --turns 6 --out replay.json
+    python benchmarks/bench_replay.py --synthetic 8 --gap-ms 3000 --no-prefetch
+    python benchmarks/bench_replay.py sessions/ --gemini 800:0.5 --stt stub --out replay.json --compare base.json
+"""
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import contextlib
+import subprocess
+import statistics
+from pathlib import Path
+from datetime import datetime, timezone
+
+import numpy as np
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import nao_gemini
+import nao_pipeline_server as srv
+from nao_audio import UPLOAD_SUFFIXES, to_wav, trim_silence
+from nao_cache import ResponseCache
+from nao_messages import message_name, read_messages
+from nao_sessions import Session, session_id_for
+from nao_stt import StubEngine, create_engine
+from nao_upload import marker_path
+from gemini_standin import GeminiStandIn, Latency
+from bench_vad import endpoint, make_turn, to_wav as pcm_to_wav
+
+STAGES = ["upload_wait", "stt", "profile", "tutor", "vision", "image_wait", "write", "filler", "first_message", "turn", "turn_1", "turn_2"]
+
+NAMES = ["Anna", "Ben", "Carla", "David", "Ella", "Farid", "Grace", "Hugo", "Ines", "Jonas"]
+TOPICS = ["animals", "colors", "food", "family", "sports", "weather", "clothes", "numbers"]
+ANSWERS = ["I likes {topic} very much", "My favourite is the {n} one", "I think it is {n} times better",
+           "Yes I has {n} of them at home", "Yesterday I go to see {topic} with my friend",
+           "I am not sure, maybe {n}", "It is big and it is {n} years old"]
+VISION_QUESTION = "What color is my shirt?"
+
+def synthesize(folder, robots, turns, seed):
+    """Sessions with a spoken introduction, practice answers and one vision turn per robot."""
+    rng = np.random.default_rng(seed)
+    for r in range(robots):
+        robot = f"sim{r:02d}"
+        name, topic = NAMES[r % len(NAMES)], TOPICS[r % len(TOPICS)]
+        for t in range(turns):
+            if t == 0:
+                # Every third learner is vague, so the profile needs a Gemini call.
+                text = "hello robot, nice to meet you" if r % 3 == 2 else f"Hi, my name is {name} and I want to learn about {topic}"
+            elif t == 3:
+                text = VISION_QUESTION
+            else:
+                text = ANSWERS[(t + r) % len(ANSWERS)].format(topic=topic, n=r * 10 + t)
+            while True:
+                samples, speech = make_turn(rng)
+                heard, recorded = endpoint(samples)
+                if speech is not None and heard:
+                    break
+            stem = f"input_{robot}_{1000 + t}"
+            (folder / f"{stem}.wav").write_bytes(pcm_to_wav(samples[:recorded]))
+            (folder / f"{stem}.txt").write_text(text)
+            if t == 3:
+                pixels = rng.integers(0, 255, (48, 64, 3), dtype=np.uint8)
+                Image.fromarray(pixels).resize((640, 480)).save(folder / f"image_{robot}_{1000 + t}.jpg", quality=85)
+
+
+def load_sessions(folder):
+    sessions = {}
+    for path in sorted(folder.rglob("input_*")):
+        if path.suffix not in UPLOAD_SUFFIXES:
+            continue
+        transcript = path.with_suffix(".txt")
+        image = path.with_name(path.stem.replace("input_", "image_", 1) + ".jpg")
+        sessions.setdefault(session_id_for(path), []).append({
+            "path": path,
+            "text": transcript.read_text().strip() if transcript.exists() else None,
+            "image": image if image.exists() else None,
+        })
+    for turns in sessions.values():
+        turns.sort(key=lambda turn: int(turn["path"].stem.rsplit("_", 1)[-1]))
+    return sessions
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100.0 * len(ordered))) - 1))]
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "mean_ms": round(statistics.mean(values) * 1000, 2),
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+    }
+
+
+def stage_times(trace):
+    times = {"turn": trace["duration_ms"] / 1000.0}
+    for span in trace["spans"]:
+        times[span["name"]] = times.get(span["name"], 0.0) + span["duration_ms"] / 1000.0
+        if span["name"] == "write" and "first_message" not in times:
+            times["first_message"] = (span["start_ms"] + span["duration_ms"]) / 1000.0
+        if span["name"] == "filler":
+            times["filler"] = (span["start_ms"] + span["duration_ms"]) / 1000.0
+    return times
+
+
+def write_upload(src, dest, markers, extra=None):
+    data = src.read_bytes()
+    tmp = dest.with_name("." + dest.name + ".part")
+    tmp.write_bytes(data)
+    tmp.replace(dest)
+    if markers:
+        info = {"size": len(data), "sha1": hashlib.sha1(data).hexdigest()}
+        info.update(extra or {})
+        marker_path(dest).write_text(json.dumps(info))
+
+
+async def nao_camera(stem, image, camera_sec, markers):
+    """Upload the frame once the host asks for it, like NAO on a need_camera reply."""
+    seq = 1
+    while True:
+        path = srv.OUTGOING_DIR / message_name(stem, seq)
+        if not await srv.watcher.wait_for_file_async(path, 30):
+            return
+        message = json.loads(path.read_text())
+        if not message.get("filler"):
+            break
+        seq += 1
+    if not message.get("need_camera"):
+        return
+    await asyncio.sleep(camera_sec)
+    name = stem.replace("input_", "image_", 1) + ".jpg"
+    await srv.run_blocking(write_upload, image, srv.IMAGES_DIR / name, markers)
+
+
+async def run_robot(robot, turns, args, records):
+    session = Session(robot, srv.default_state())
+    for index, turn in enumerate(turns):
+        path, image = turn["path"], turn["image"]
+        speculative = image is not None and args.vision_flow == "speculative"
+        dest = srv.INCOMING_DIR / path.name
+        if speculative:
+            await srv.run_blocking(write_upload, image, srv.IMAGES_DIR / image.name, not args.no_markers)
+        camera = None
+        if not speculative:
+            # NAO answers any need_camera reply with a photo, even on turns recorded without one.
+            frame = image or args.default_frame
+            camera = asyncio.create_task(nao_camera(path.stem, frame, args.camera_ms / 1000.0, not args.no_markers))
+
+        await srv.run_blocking(write_upload, path, dest, not args.no_markers, {"image": True} if speculative else None)
+        await srv.handle_turn(session, dest)
+        if camera is not None:
+            camera.cancel()
+
+        messages = read_messages(srv.OUTGOING_DIR, path.stem)
+        fallback = not messages or any(m.get("speech") in srv.FALLBACK_REASONS for m in messages)
+        records[path.stem] = {"robot": robot, "fallback": fallback, "index": index}
+        if args.gap_ms:
+            await asyncio.sleep(args.gap_ms / 1000.0)
+
+
+def stt_engine(args, sessions):
+    if args.stt != "stub":
+        return create_engine(args.stt)
+    rng = random.Random(args.seed)
+    latency = Latency.parse(args.stt_latency)
+    engine = StubEngine(default="", latency=lambda: latency.sample(rng))
+    for turns in sessions.values():
+        for turn in turns:
+            clip = trim_silence(to_wav(turn["path"].read_bytes()))
+            if clip is not None and turn["text"]:
+                engine.add(clip.wav, turn["text"])
+    return engine
+
+
+async def replay(sessions, args, standin):
+    root = Path(tempfile.mkdtemp(prefix="nao-replay-"))
+    srv.INCOMING_DIR, srv.OUTGOING_DIR, srv.IMAGES_DIR = root / "incoming", root / "outgoing", root / "images"
+    for directory in (srv.INCOMING_DIR, srv.OUTGOING_DIR, srv.IMAGES_DIR):
+        directory.mkdir()
+    args.default_frame = root / "frame.jpg"
+    Image.new("RGB", (640, 480), (90, 120, 200)).save(args.default_frame, quality=85)
+    srv.watcher = srv.make_watcher()
+    srv.watcher.listen(lambda event: None)
+    srv.watcher.start()
+    srv.client = nao_gemini.create_client("replay", standin.base_url)
+    srv.stt_engine = stt_engine(args, sessions)
+    srv.STREAM_REPLIES = not args.no_stream
+    srv.FILLER_AFTER_MS = args.filler_ms
+    srv.INTRO_PREFETCH = not args.no_prefetch
+    if args.no_cache:
+        srv.response_cache = ResponseCache(max_entries=0)
+    srv.tracer.trace_path = root / "trace.jsonl"
+
+    records = {}
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(run_robot(robot, turns, args, records) for robot, turns in sessions.items()))
+        wall = time.perf_counter() - start
+        for line in srv.tracer.trace_path.read_text().splitlines():
+            trace = json.loads(line)
+            record = records[trace["turn"]]
+            record.update(stage_times(trace))
+            if record["index"] < 2:
+                record[f"turn_{record['index'] + 1}"] = record["turn"]
+    finally:
+        srv.watcher.stop()
+        shutil.rmtree(root, ignore_errors=True)
+    return list(records.values()), wall
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+    return commit + ("-dirty" if dirty else "") if commit else None
+
+
+def print_table(result, base=None):
+    print(f"{result['turns']} turns from {result['robots']} robots in {result['wall_sec']:.1f} s: "
+          f"{result['throughput_turns_per_sec']:.2f} turns/s, {result['fallbacks']} fallback replies")
+    print(f"{'stage':<14}  {'count':>5}  {'mean ms':>8}  {'p50 ms':>8}  {'p95 ms':>8}  {'p99 ms':>8}")
+    for stage, s in result["stages"].items():
+        line = f"{stage:<14}  {s['count']:>5}  {s['mean_ms']:>8.0f}  {s['p50_ms']:>8.0f}  {s['p95_ms']:>8.0f}  {s['p99_ms']:>8.0f}"
+        old = (base or {}).get("stages", {}).get(stage)
+        if old:
+            line += "   vs base: " + "  ".join(f"{q} {s[q + '_ms'] - old[q + '_ms']:+.0f}" for q in ("p50", "p95", "p99"))
+        print(line)
+    if base:
+        print(f"base: {base.get('commit')}, {base['throughput_turns_per_sec']:.2f} turns/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sessions", nargs="?", help="directory of recorded input_*/image_* files")
+    parser.add_argument("--synthetic", type=int, metavar="ROBOTS", help="generate sessions for this many robots instead")
+    parser.add_argument("--turns", type=int, default=6, help="turns per synthetic session")
+    parser.add_argument("--gemini", default="600:0.4", help="stand-in latency median_ms[:sigma[:stall_rate:stall_ms]]")
+    parser.add_argument("--chunk-ms", type=float, default=40.0, help="gap between streamed chunks")
+    parser.add_argument("--stt", default="stub", help="STT engine spec; stub returns the .txt transcripts")
+    parser.add_argument("--stt-latency", default="300:0.3", help="stub STT latency, same format as --gemini")
+    parser.add_argument("--vision-flow", choices=["speculative", "need_camera"], default="speculative")
+    parser.add_argument("--camera-ms", type=float, default=400.0, help="NAO photo + upload time on need_camera")
+    parser.add_argument("--gap-ms", type=float, default=0.0, help="pause between a robot's turns")
+    parser.add_argument("--no-markers", action="store_true", help="upload without .done markers (size-stability wait)")
+    parser.add_argument("--no-stream", action="store_true", help="whole tutor replies instead of streamed sentences")
+    parser.add_argument("--no-cache", action="store_true", help="disable the tutor/profile response cache")
+    parser.add_argument("--no-prefetch", action="store_true", help="generate the introduction on the turn that needs it")
+    parser.add_argument("--filler-ms", type=int, default=srv.FILLER_AFTER_MS, help="filler message budget, 0 disables")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", help="write the results here as JSON")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--verbose", action="store_true", help="show the server's log")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(args.sessions) if args.sessions else Path(tmp)
+        if args.synthetic:
+            synthesize(folder, args.synthetic, args.turns, args.seed)
+        elif not args.sessions:
+            parser.error("give a sessions directory or --synthetic ROBOTS")
+        sessions = load_sessions(folder)
+        if not sessions:
+            sys.exit(f"no input_* recordings in {folder}")
+
+        standin = GeminiStandIn(Latency.parse(args.gemini), chunk_ms=args.chunk_ms, seed=args.seed)
+        standin.start()
+        log = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with log:
+            records, wall = asyncio.run(replay(sessions, args, standin))
+        standin.stop()
+
+    result = {
+        "commit": git_commit(),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "verbose", "default_frame")},
+        "robots": len(sessions),
+        "turns": len(records),
+        "wall_sec": round(wall, 3),
+        "throughput_turns_per_sec": round(len(records) / wall, 3),
+        "fallbacks": sum(r["fallback"] for r in records),
+        "gemini_calls": dict(standin.calls),
+        "stages": {stage: summarize([r[stage] for r in records if stage in r])
+                   for stage in STAGES if any(stage in r for r in records)},
+    }
+    base = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_table(result, base)
+    if args.out:
+        Path(args.out).write_text(json.dumps(result, indent=2))
+        print(f"results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Server restart with a backlog of old uploads, with and without the session journal.
+
+Builds what a server leaves behind after running for a while: --robots
+robots, each with --uploads answered recordings in incoming/ (an hour old)
+and a lesson in progress of --lesson-turns turns. Then one new recording
+per robot arrives, and the server is started on all of it:
+- legacy: no journal (NAO_JOURNAL_DIR=""); every recording found is
+  answered again and every lesson starts over at the profile question
+- journal: the journal holds every session and the uploads answered, as
+  the server writes it while running
+
+Reported per mode: journal restore time, sessions restored, turns the
+server handled within --settle seconds (one per robot is the new
+recording), profile calls (lessons started over), and the time from
+startup to the answer to each new recording.
+
+    python benchmarks/bench_restart.py --robots 16 --uploads 200
+"""
+import io
+import os
+import re
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import nao_gemini
+import nao_memory
+import nao_pipeline_server as srv
+from nao_audio import to_wav, trim_silence
+from nao_cache import ResponseCache
+from nao_journal import SessionJournal
+from nao_messages import read_messages
+from nao_stt import StubEngine
+from gemini_standin import GeminiStandIn, Latency
+from bench_replay import ANSWERS, NAMES, TOPICS, percentile, write_upload
+from bench_vad import endpoint, make_turn, to_wav as pcm_to_wav
+
+MODES = ("legacy", "journal")
+RESTORED_RE = re.compile(r"Restored (\d+) sessions and \d+ answered uploads from .* in ([\d.]+) ms")
+
+
+def synthesize(folder, args):
+    """The backlog: old uploads in incoming/, the journal of their lessons, and the new recordings."""
+    rng = np.random.default_rng(args.seed)
+    while True:
+        samples, speech = make_turn(rng)
+        heard, recorded = endpoint(samples)
+        if speech is not None and heard:
+            break
+    recording = folder / "answer.wav"
+    recording.write_bytes(pcm_to_wav(samples[:recorded]))
+    engine = StubEngine(default="")
+    engine.add(trim_silence(to_wav(recording.read_bytes())).wav, ANSWERS[0].format(topic="animals", n=1))
+
+    incoming = folder / "incoming"
+    incoming.mkdir()
+    journal = SessionJournal(folder / "journal", fsync=False, keep_uploads=srv.RECENT_UPLOADS_LIMIT)
+    journal.load()
+    old = time.time() - 3600
+    fresh = []
+    for r in range(args.robots):
+        robot = f"nao{r:02d}"
+        state = srv.default_state()
+        state.update(phase="tutor", name=NAMES[r % len(NAMES)], topic=TOPICS[r % len(TOPICS)],
+                     turn=args.lesson_turns, lesson_stage="practice")
+        for t in range(args.lesson_turns):
+            nao_memory.remember(state["memory"], ANSWERS[t % len(ANSWERS)].format(topic=state["topic"], n=t),
+                                "Good job! Say it once more, slowly.")
+        for u in range(args.uploads):
+            dest = incoming / f"input_{robot}_{1000000 + u}.wav"
+            write_upload(recording, dest, True)
+            for path in (dest, dest.with_name(dest.name + srv.MARKER_SUFFIX)):
+                os.utime(path, (old + u, old + u))
+            journal.write(journal.record(robot, state, dest.name))
+        fresh.append(f"input_{robot}_{2000000}")
+    journal.close()
+    return engine, recording, fresh
+
+
+async def restart(folder, recording, fresh, args, standin, engine, mode):
+    srv.INCOMING_DIR, srv.OUTGOING_DIR, srv.IMAGES_DIR = folder / "incoming", folder / "outgoing", folder / "images"
+    srv.JOURNAL_DIR = str(folder / "journal") if mode == "journal" else ""
+    srv.watcher = srv.make_watcher()
+    srv.client = nao_gemini.create_client("restart", standin.base_url)
+    srv.stt_engine = engine
+    srv.response_cache = ResponseCache(max_entries=0)
+    srv.NAO_HTTP_PORT = srv.METRICS_PORT = 0
+    srv.tracer.trace_path = folder / "trace.jsonl"
+    # serve() shuts its pool down on the way out; each restart gets a new one.
+    srv.blocking_pool = ThreadPoolExecutor(max_workers=srv.BLOCKING_WORKERS, thread_name_prefix="nao-io")
+    # The new recordings arrive as NAO would send them after the restart.
+    for stem in fresh:
+        write_upload(recording, srv.INCOMING_DIR / f"{stem}.wav", True)
+
+    turns_before = srv.tracer.turns_total.value()
+    start = time.monotonic()
+    server = asyncio.create_task(srv.serve())
+    answered = {}
+    try:
+        while time.monotonic() - start < args.settle:
+            for stem in fresh:
+                if stem not in answered and any(not m.get("filler") for m in read_messages(srv.OUTGOING_DIR, stem)):
+                    answered[stem] = time.monotonic() - start
+            await asyncio.sleep(0.05)
+    finally:
+        server.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await server
+    return srv.tracer.turns_total.value() - turns_before, answered
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--robots", type=int, default=16)
+    parser.add_argument("--uploads", type=int, default=200, help="answered uploads per robot left in incoming/")
+    parser.add_argument("--lesson-turns", type=int, default=12, help="turns of each lesson in progress")
+    parser.add_argument("--gemini", default="600:0.2", help="stand-in latency median_ms[:sigma[:stall_rate:stall_ms]]")
+    parser.add_argument("--settle", type=float, default=10.0, help="seconds to run the restarted server")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{args.robots} robots, {args.uploads} old uploads and {args.lesson_turns} lesson turns each, "
+          f"stand-in {Latency.parse(args.gemini)!r}, {args.settle:g} s after restart")
+    print(f"{'mode':<8}  {'restore ms':>10}  {'sessions':>8}  {'turns':>6}  {'profile calls':>13}  "
+          f"{'new answered':>12}  {'answer s p50':>12}  {'max':>6}")
+    with tempfile.TemporaryDirectory() as tmp:
+        base = Path(tmp) / "backlog"
+        base.mkdir()
+        engine, recording, fresh = synthesize(base, args)
+        for mode in args.modes.split(","):
+            folder = Path(tmp) / mode
+            shutil.copytree(base, folder)
+            standin = GeminiStandIn(Latency.parse(args.gemini), seed=args.seed)
+            standin.start()
+            log = io.StringIO()
+            with contextlib.redirect_stdout(log):
+                turns, answered = asyncio.run(restart(folder, recording, fresh, args, standin, engine, mode))
+            standin.stop()
+
+            restored = RESTORED_RE.search(log.getvalue())
+            sessions, restore_ms = (int(restored.group(1)), f"{float(restored.group(2)):.1f}") if restored else (0, "-")
+            times = list(answered.values())
+            p50 = f"{percentile(times, 50):.2f}" if times else "-"
+            slowest = f"{max(times):.2f}" if times else "-"
+            print(f"{mode:<8}  {restore_ms:>10}  {sessions:>8}  {turns:>6}  {standin.calls['profile']:>13}  "
+                  f"{len(answered):>5} of {len(fresh):<4}  {p50:>12}  {slowest:>6}")
+
+
+if __name__ == "__main__":
+    main()
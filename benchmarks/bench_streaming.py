@@ -0,0 +1,126 @@
+"""Time to first word: whole-reply tutor turns vs streamed sentence chunks.
+
+Drives the server's gemini_tutor_reply and stream_tutor_reply against a
+local stand-in that releases a canned reply token by token, and measures
+when <stem>.json (the first thing NAO can speak) is written.
+
+    python benchmarks/bench_streaming.py --first-token-ms 500 --token-ms 25
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import nao_pipeline_server as server
+from nao_cache import ResponseCache
+from nao_messages import read_messages
+
+REPLY = {
+    "gestures": ["nod", "look_up"],
+    "led_color": "green",
+    "speech": (
+        "Très bien, Anna! You said the sky is blue, and that is correct \U0001F600. "
+        "We say colours after the word is, like the apple is green. "
+        "Now try this one for me. What colour is a banana?"
+    )
+}
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class _Models:
+    def __init__(self, first_token_sec, token_sec):
+        self.first_token_sec = first_token_sec
+        self.token_sec = token_sec
+        raw = json.dumps(REPLY)
+        self.tokens = [raw[i:i + 4] for i in range(0, len(raw), 4)]
+
+    async def generate_content(self, model, contents):
+        await asyncio.sleep(self.first_token_sec + self.token_sec * len(self.tokens))
+        return _Chunk("".join(self.tokens))
+
+    async def generate_content_stream(self, model, contents):
+        async def stream():
+            await asyncio.sleep(self.first_token_sec)
+            for token in self.tokens:
+                await asyncio.sleep(self.token_sec)
+                yield _Chunk(token)
+        return stream()
+
+
+class _Client:
+    def __init__(self, models):
+        self.aio = type("Aio", (), {"models": models})()
+
+
+async def first_word_latency(streaming, outgoing, n):
+    state = server.default_state()
+    state.update({"phase": "tutor", "name": "Anna", "topic": "colours", "turn": 3})
+    replies = server.TurnReplies(outgoing, f"input_bench_{n}")
+    first = outgoing / f"input_bench_{n}.json"
+
+    start = time.monotonic()
+    if streaming:
+        task = asyncio.create_task(server.stream_tutor_reply(state, "The sky is blue", replies))
+    else:
+        async def whole():
+            payload = await server.gemini_tutor_reply(state, "The sky is blue")
+            await server.write_outgoing(replies, payload)
+        task = asyncio.create_task(whole())
+
+    while not first.exists():
+        await asyncio.sleep(0.002)
+    first_ms = (time.monotonic() - start) * 1000
+    await task
+    total_ms = (time.monotonic() - start) * 1000
+    spoken = " ".join(message["speech"] for message in read_messages(outgoing, f"input_bench_{n}"))
+    return first_ms, total_ms, spoken
+
+
+async def run(args):
+    server.client = _Client(_Models(args.first_token_ms / 1000, args.token_ms / 1000))
+    # Every run asks the same question; measure the model path, not cache hits.
+    server.response_cache = ResponseCache(max_entries=0)
+    with tempfile.TemporaryDirectory() as tmp:
+        server.OUTGOING_DIR = Path(tmp)
+        results = {}
+        n = 0
+        for streaming in (False, True):
+            samples = []
+            for _ in range(args.runs):
+                n += 1
+                samples.append(await first_word_latency(streaming, server.OUTGOING_DIR, n))
+            results["streamed" if streaming else "whole"] = samples
+
+    # json.dumps escapes the accent and the emoji (a surrogate pair), as Gemini may;
+    # the streamed sentences must say what the whole reply does.
+    expected = " ".join(results["whole"][0][2].split())
+    for sample in results["streamed"]:
+        if " ".join(sample[2].split()) != expected:
+            print(f"[WARN] streamed reply spoken as {sample[2]!r}, whole as {expected!r}")
+    print(f"{'mode':<10}{'first word ms':>15}{'complete ms':>14}")
+    for mode, samples in results.items():
+        first = statistics.mean(s[0] for s in samples)
+        total = statistics.mean(s[1] for s in samples)
+        print(f"{mode:<10}{first:>15.0f}{total:>14.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--first-token-ms", type=float, default=500)
+    parser.add_argument("--token-ms", type=float, default=25)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Latency, throughput and word error rate of the STT engines in nao_stt.
+
+Runs every engine over a folder of WAVs. A reference transcript for
+clip.wav is read from clip.txt next to it; clips without one count towards
+latency only. Clips go through nao_audio.trim_silence first, as in the
+server (--no-trim to skip). Reports per engine:
+- load: time to create the engine (model load for local engines)
+- latency: mean / p50 / p95 per clip and the real-time factor
+  (recognition time / audio length)
+- throughput: clips per second with --workers transcriptions in parallel
+- WER: word error rate over all clips with a reference
+
+    python benchmarks/bench_stt.py recordings/ --engine google --engine vosk:/opt/vosk-model-small-en-us
+    python benchmarks/bench_stt.py recordings/ --engine whisper:tiny.en --engine whisper:base.en --workers 4
+"""
+import re
+import sys
+import time
+import argparse
+import statistics
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from nao_audio import trim_silence
+from nao_stt import create_engine
+
+
+def words(text):
+    return re.sub(r"[^a-z0-9' ]+", " ", text.lower()).split()
+
+
+def edit_distance(ref, hyp):
+    row = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        prev, row[0] = row[0], i
+        for j, h in enumerate(hyp, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (r != h))
+    return row[-1]
+
+
+def load_clips(folder, trim):
+    clips = []
+    for wav in sorted(Path(folder).glob("*.wav")):
+        data = wav.read_bytes()
+        clip = trim_silence(data)
+        if clip is None:
+            print(f"[WARN] {wav.name}: no speech, skipped")
+            continue
+        ref = wav.with_suffix(".txt")
+        clips.append({
+            "name": wav.name,
+            "wav": clip.wav if trim else data,
+            "seconds": clip.seconds_out if trim else clip.seconds_in,
+            "ref": ref.read_text(encoding="utf-8").strip() if ref.exists() else None,
+        })
+    return clips
+
+
+def timed(engine, clip):
+    start = time.perf_counter()
+    text = engine.transcribe(clip["wav"])
+    return text, time.perf_counter() - start
+
+
+def run(spec, clips, workers, show):
+    start = time.perf_counter()
+    try:
+        engine = create_engine(spec)
+    except (ImportError, OSError, ValueError) as e:
+        print(f"{spec:<28}  unavailable: {e}")
+        return
+    load = time.perf_counter() - start
+
+    # Sequential pass for per-clip latency and accuracy.
+    latencies, errors, ref_words, empty = [], 0, 0, 0
+    for clip in clips:
+        try:
+            text, seconds = timed(engine, clip)
+        except Exception as e:
+            print(f"{spec:<28}  failed on {clip['name']}: {e}")
+            return
+        latencies.append(seconds)
+        empty += not text
+        if clip["ref"] is not None:
+            ref = words(clip["ref"])
+            errors += edit_distance(ref, words(text))
+            ref_words += len(ref)
+        if show:
+            print(f"    {clip['name']}: {text!r}")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda clip: timed(engine, clip), clips))
+    throughput = len(clips) / (time.perf_counter() - start)
+
+    latencies.sort()
+    audio = sum(clip["seconds"] for clip in clips)
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    wer = f"{errors / ref_words:.1%}" if ref_words else "n/a"
+    print(f"{spec:<28}  {load:>7.2f}  {statistics.mean(latencies) * 1000:>8.0f}  "
+          f"{statistics.median(latencies) * 1000:>7.0f}  {p95 * 1000:>7.0f}  {sum(latencies) / audio:>5.2f}  "
+          f"{throughput:>8.2f}  {wer:>6}  {empty:>5}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("folder", help="directory of WAVs with optional .txt reference transcripts")
+    parser.add_argument("--engine", action="append", help="engine spec for nao_stt.create_engine (repeatable)")
+    parser.add_argument("--workers", type=int, default=2, help="parallel transcriptions for the throughput pass")
+    parser.add_argument("--no-trim", action="store_true", help="send the untrimmed recordings")
+    parser.add_argument("--show", action="store_true", help="print each transcript")
+    args = parser.parse_args()
+
+    clips = load_clips(args.folder, not args.no_trim)
+    if not clips:
+        sys.exit(f"no WAVs with speech in {args.folder}")
+    refs = sum(clip["ref"] is not None for clip in clips)
+    audio = sum(clip["seconds"] for clip in clips)
+    print(f"{len(clips)} clips ({refs} with references), {audio:.1f} s of audio, {args.workers} workers")
+    print(f"{'engine':<28}  {'load s':>7}  {'mean ms':>8}  {'p50 ms':>7}  {'p95 ms':>7}  {'RTF':>5}  "
+          f"{'clips/s':>8}  {'WER':>6}  {'empty':>5}")
+    for spec in args.engine or ["google"]:
+        run(spec, clips, args.workers, args.show)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Speech scrubbing and vision-intent detection: legacy loops vs nao_text.
+
+The legacy scrub made three str.replace passes per forbidden word and the
+legacy intent check scanned every keyword as a substring. nao_text runs
+one precompiled whole-word pattern over the text instead.
+
+    python benchmarks/bench_text.py --sentences 40 --repeats 2000
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from nao_text import GESTURE_WORDS, LED_COLOR_WORDS, VISION_KEYWORDS, WordMatcher, scrub_speech
+
+SENTENCES = [
+    "Great job, you said the sky is blue and that is correct.",
+    "Nod if you understand, then look up at the board.",
+    "The node of a tree is where a new branch grows.",
+    "If you feel bored, we can try a shorter exercise.",
+    "Now tell me, what colour is a banana?",
+]
+
+LEGACY_FORBIDDEN = ["wave", "nod", "shake_head", "look_up", "look_left", "look_right",
+                    "hand_open", "hand_close", "red", "green", "blue", "yellow", "white"]
+LEGACY_VISION = ["see", "look", "watch", "color", "colour", "wearing", "hand", "holding",
+                 "what is this", "show", "picture", "photo", "capture"]
+
+
+def legacy_scrub(speech):
+    for word in LEGACY_FORBIDDEN:
+        speech = speech.replace(" " + word + " ", " ")
+        speech = speech.replace(" " + word, "")
+        speech = speech.replace(word + " ", "")
+    return " ".join(speech.split())
+
+
+def legacy_needs_vision(text):
+    text_lower = text.lower()
+    for keyword in LEGACY_VISION:
+        if keyword in text_lower:
+            return True
+    return False
+
+
+def per_call_us(func, text, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        func(text)
+    return (time.perf_counter() - start) / repeats * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sentences", type=int, default=40, help="length of the long reply")
+    parser.add_argument("--repeats", type=int, default=2000)
+    args = parser.parse_args()
+
+    short = SENTENCES[0]
+    long_reply = " ".join(SENTENCES[i % len(SENTENCES)] for i in range(args.sentences))
+    utterance = "I am not sure what you mean by that, can you say it again slower please"
+    intent = WordMatcher(VISION_KEYWORDS)
+    scrubber = WordMatcher(GESTURE_WORDS + LED_COLOR_WORDS)
+
+    print(f"{'case':<34}  {'legacy us':>10}  {'compiled us':>11}")
+    rows = [
+        ("scrub, 1 sentence", legacy_scrub, lambda t: scrub_speech(t, scrubber), short),
+        (f"scrub, {args.sentences} sentences ({len(long_reply)} chars)", legacy_scrub,
+         lambda t: scrub_speech(t, scrubber), long_reply),
+        ("vision intent, no keyword", legacy_needs_vision, intent.search, utterance),
+    ]
+    for label, legacy, compiled, text in rows:
+        print(f"{label:<34}  {per_call_us(legacy, text, args.repeats):>10.1f}  "
+              f"{per_call_us(compiled, text, args.repeats):>11.1f}")
+
+    print()
+    for sentence in SENTENCES[1:4]:
+        print(f"in:       {sentence}")
+        print(f"legacy:   {legacy_scrub(sentence)}")
+        print(f"compiled: {scrub_speech(sentence, scrubber)}")
+    print()
+    for text in ("My brother is very handsome", "We planted a seed today", "What do you see?"):
+        print(f"vision intent? legacy {legacy_needs_vision(text)!s:<5}  compiled {intent.search(text)!s:<5}  {text}")
+
+
+if __name__ == "__main__":
+    main()
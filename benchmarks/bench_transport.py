@@ -0,0 +1,163 @@
+"""Per-hop latency and client CPU: HTTP keep-alive transport vs scp.
+
+Starts the host's nao_http endpoint in a child process on temp directories
+and drives it with the NAO-side HttpTransport, measuring:
+- upload: PUT of a recording-sized WAV (file + .done marker on the host)
+- fetch: GET of a reply that is already there
+- pickup: delay between the host writing a reply and NAO having it, for the
+  long-poll vs the old 0.3 s polling loop (which also pays one hop per poll)
+
+Client CPU is this process plus any children it forks (scp). Without an SSH
+server, the scp rows fall back to the cost of forking a no-op process, a
+lower bound for any scp hop. With --scp user@host the real ScpTransport runs
+with and without ControlMaster multiplexing (the host dirs must exist).
+
+    python benchmarks/bench_transport.py --hops 50
+    python benchmarks/bench_transport.py --scp nao@localhost
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import resource
+import threading
+import tempfile
+import statistics
+import subprocess
+import multiprocessing
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "Nao-Codes"))
+
+from nao_transport import HttpTransport, ScpTransport
+
+WAV_BYTES = 5 * 16000 * 2 + 44
+POLL_SECONDS = 0.3
+
+
+def serve(root, port, ready):
+    from nao_http import NaoHttpEndpoint
+    from nao_watcher import DirectoryWatcher
+
+    async def main():
+        watcher = DirectoryWatcher()
+        watcher.add(root / "outgoing", "*.json", "outgoing")
+        watcher.listen(lambda event: None)
+        watcher.start()
+        endpoint = NaoHttpEndpoint(watcher, root / "incoming", root / "images", root / "outgoing")
+        await endpoint.start("127.0.0.1", port)
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+def cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def measure(label, hop, hops):
+    samples = []
+    cpu = cpu_seconds()
+    for i in range(hops):
+        start = time.perf_counter()
+        hop(i)
+        samples.append(time.perf_counter() - start)
+    cpu = (cpu_seconds() - cpu) / hops
+    samples.sort()
+    p95 = samples[max(0, int(len(samples) * 0.95) - 1)]
+    print(f"{label:<38}  {statistics.mean(samples) * 1000:>8.2f}  {p95 * 1000:>8.2f}  {cpu * 1000:>8.2f}")
+
+
+def pickup_delay(root, fetch, stem, delay):
+    reply = root / "outgoing" / f"{stem}.json"
+    written = []
+
+    def write_later():
+        time.sleep(delay)
+        reply.write_text('{"speech": "hi"}')
+        written.append(time.perf_counter())
+
+    writer = threading.Thread(target=write_later)
+    writer.start()
+    fetch(stem)
+    got = time.perf_counter()
+    writer.join()
+    return got - written[0]
+
+
+def legacy_fetch(hop_cost):
+    def fetch(path_exists):
+        while True:
+            time.sleep(hop_cost)
+            if path_exists():
+                return
+            time.sleep(POLL_SECONDS)
+    return fetch
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hops", type=int, default=50)
+    parser.add_argument("--port", type=int, default=18765)
+    parser.add_argument("--scp", help="user@host with an SSH server, to time real scp hops")
+    parser.add_argument("--scp-hop-ms", type=float, default=250.0,
+                        help="assumed cost of one scp hop with a full SSH handshake, when --scp is not given")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        for name in ("incoming", "images", "outgoing", "nao"):
+            (root / name).mkdir()
+        wav = root / "nao" / "input_bench_1.wav"
+        wav.write_bytes(os.urandom(WAV_BYTES))
+        (root / "outgoing" / "input_bench_1.json").write_text('{"speech": "hello", "gestures": [], "led_color": "blue"}')
+
+        ready = multiprocessing.Event()
+        host = multiprocessing.Process(target=serve, args=(root, args.port, ready), daemon=True)
+        host.start()
+        ready.wait(10)
+
+        http = HttpTransport("127.0.0.1", args.port)
+        print(f"{'hop':<38}  {'mean ms':>8}  {'p95 ms':>8}  {'cpu ms':>8}")
+        measure("http upload (keep-alive)", lambda i: http.upload(str(wav), "incoming", f"input_bench_{i}.wav"), args.hops)
+        measure("http fetch (keep-alive)", lambda i: http.fetch("input_bench_1", 5), args.hops)
+
+        if args.scp:
+            dirs = {"incoming": str(root / "incoming"), "images": str(root / "images"), "outgoing": str(root / "outgoing")}
+            for multiplex in (False, True):
+                scp = ScpTransport(args.scp, dirs, str(root / "nao"), multiplex=multiplex)
+                label = "scp " + ("multiplexed" if multiplex else "new handshake")
+                measure(f"{label} upload", lambda i: scp.upload(str(wav), "incoming", f"input_scp_{i}.wav"), args.hops)
+                measure(f"{label} fetch", lambda i: scp.fetch("input_bench_1", 5), args.hops)
+                scp.close()
+        else:
+            measure("fork+exec of a no-op (scp lower bound)", lambda i: subprocess.call(["true"]), args.hops)
+
+        print()
+        print(f"{'reply pickup after it is written':<38}  {'mean ms':>8}  {'max ms':>8}")
+        rng = random.Random(1)
+        delays = [rng.uniform(0.2, 2.0) for _ in range(min(args.hops, 20))]
+        long_poll = [pickup_delay(root, lambda stem: http.fetch(stem, 10), f"input_poll_{i}", d) for i, d in enumerate(delays)]
+        print(f"{'http long-poll':<38}  {statistics.mean(long_poll) * 1000:>8.1f}  {max(long_poll) * 1000:>8.1f}")
+
+        hop_cost = args.scp_hop_ms / 1000
+        poll = []
+        for i, d in enumerate(delays):
+            reply = root / "outgoing" / f"input_legacy_{i}.json"
+            poll.append(pickup_delay(root, lambda stem: legacy_fetch(hop_cost)(reply.exists), f"input_legacy_{i}", d))
+        print(f"{f'scp poll every {POLL_SECONDS}s ({args.scp_hop_ms:.0f} ms/hop)':<38}  "
+              f"{statistics.mean(poll) * 1000:>8.1f}  {max(poll) * 1000:>8.1f}")
+
+        http.close()
+        host.terminate()
+
+
+if __name__ == "__main__":
+    main()
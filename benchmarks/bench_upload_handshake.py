@@ -0,0 +1,95 @@
+"""Compare legacy size-stability waits with the upload marker handshake.
+
+Simulates scp writing a WAV and a JPEG into watched directories and measures
+how long the server waits, after the last byte lands, before it can start.
+
+    python benchmarks/bench_upload_handshake.py --runs 10
+"""
+import sys
+import time
+import json
+import argparse
+import tempfile
+import threading
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from nao_watcher import DirectoryWatcher
+from nao_upload import file_sha1, marker_path, wait_for_upload
+
+FILES = {
+    "wav": ("input_{n}.wav", 160 * 1024),
+    "jpg": ("image_{n}.jpg", 40 * 1024),
+}
+
+
+def simulate_upload(path, size, transfer_sec, with_marker, done):
+    chunks = 8
+    with open(path, "wb") as f:
+        for _ in range(chunks):
+            f.write(b"\0" * (size // chunks))
+            f.flush()
+            time.sleep(transfer_sec / chunks)
+    if with_marker:
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps({"size": path.stat().st_size, "sha1": file_sha1(path)}))
+        tmp.replace(marker_path(path))
+    done["t"] = time.monotonic()
+
+
+def measure(watcher, directory, name, size, transfer_sec, with_marker, waits):
+    path = directory / name
+    done = {}
+    writer = threading.Thread(target=simulate_upload, args=(path, size, transfer_sec, with_marker, done))
+    writer.start()
+    watcher.wait_for_file(path, timeout=5)
+    for _ in range(waits):
+        wait_for_upload(path, watcher)
+    ready = time.monotonic()
+    writer.join()
+    return max(0.0, ready - done["t"])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--transfer-sec", type=float, default=0.3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        watcher = DirectoryWatcher()
+        watcher.add(directory, "*", "file")
+        watcher.start(initial_scan=False)
+
+        results = {}
+        n = 0
+        for kind, (pattern, size) in FILES.items():
+            # The old server checked every WAV twice (main() and stt_from_wav).
+            legacy_waits = 2 if kind == "wav" else 1
+            for mode, with_marker, waits in (("legacy", False, legacy_waits), ("marker", True, 1)):
+                samples = []
+                for _ in range(args.runs):
+                    n += 1
+                    name = pattern.format(n=n)
+                    samples.append(measure(watcher, directory, name, size, args.transfer_sec, with_marker, waits))
+                results[(kind, mode)] = samples
+
+        watcher.stop()
+
+    print(f"[INFO] Watcher backend: {watcher.backend}, runs: {args.runs}")
+    print(f"{'file':<6}{'mode':<8}{'mean ms':>10}{'p95 ms':>10}")
+    for (kind, mode), samples in results.items():
+        samples = sorted(samples)
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        print(f"{kind:<6}{mode:<8}{statistics.mean(samples) * 1000:>10.1f}{p95 * 1000:>10.1f}")
+
+    saved = sum(statistics.mean(results[(kind, "legacy")]) - statistics.mean(results[(kind, "marker")])
+                for kind in FILES)
+    print(f"[INFO] Wait saved per vision turn (WAV + JPEG): {saved * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Seconds and bytes saved per turn by NAO endpointing and host-side VAD.
+
+Synthesises learner turns: a short lead-in, a spoken answer of random length
+and loudness (voiced syllables), background noise and some turns with no
+answer at all. Each turn runs through
+- legacy: a fixed RECORD_SECONDS recording, uploaded and sent to STT whole
+- endpointing: nao_endpointing.Endpointer on 100 ms energy frames, as
+  record_once does on NAO; silent turns are not uploaded
+- endpointing + trim: the host's nao_audio.trim_silence before STT
+
+and reports the recorded seconds, uploaded bytes and audio seconds sent to
+STT per turn, plus whether any speech was cut off. --wav runs the host VAD on
+real recordings instead.
+
+    python benchmarks/bench_vad.py --turns 200
+    python benchmarks/bench_vad.py --wav recordings/*.wav
+"""
+import io
+import sys
+import time
+import wave
+import argparse
+import statistics
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "Nao-Codes"))
+
+from nao_audio import speech_span, trim_silence
+from nao_endpointing import Endpointer
+
+RATE = 16000
+RECORD_SECONDS = 5.0
+FRAME_SECONDS = 0.1
+SILENT_SHARE = 0.15
+
+
+def syllables(rng, length, level):
+    out = np.zeros(length, dtype=np.float32)
+    pos = 0
+    while pos < len(out):
+        n = int(rng.uniform(0.12, 0.3) * RATE)
+        t = np.arange(n) / RATE
+        f0 = rng.uniform(110, 260)
+        voice = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 6))
+        chunk = (voice * np.hanning(n))[:len(out) - pos]
+        out[pos:pos + len(chunk)] = chunk
+        pos += n + int(rng.uniform(0.03, 0.15) * RATE)
+    return out / (np.sqrt(np.mean(out * out)) + 1e-9) * level
+
+
+def make_turn(rng):
+    noise = rng.normal(0, rng.uniform(40, 150), int(RECORD_SECONDS * RATE)).astype(np.float32)
+    if rng.random() < SILENT_SHARE:
+        return noise, None
+    start = rng.uniform(0.3, 1.0)
+    length = min(rng.uniform(0.6, 3.5), RECORD_SECONDS - start)
+    a, b = int(start * RATE), int((start + length) * RATE)
+    noise[a:b] += syllables(rng, b - a, rng.uniform(700, 4000))
+    return noise, (a, b)
+
+
+def to_wav(samples):
+    out = io.BytesIO()
+    with wave.open(out, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(RATE)
+        wav.writeframes(np.clip(samples, -32768, 32767).astype("<i2").tobytes())
+    return out.getvalue()
+
+
+def endpoint(samples):
+    endpointer = Endpointer(FRAME_SECONDS, RECORD_SECONDS)
+    frame = int(FRAME_SECONDS * RATE)
+    for i in range(0, len(samples), frame):
+        chunk = samples[i:i + frame]
+        if endpointer.update(float(np.sqrt(np.mean(chunk * chunk)))):
+            break
+    return endpointer.started, min(len(samples), int(round(endpointer.elapsed * RATE)))
+
+
+def run_synthetic(args):
+    rng = np.random.default_rng(args.seed)
+    rows = {"legacy": [], "endpointing": [], "endpointing + trim": []}
+    vad_ms = []
+    cut_off = missed = clipped = 0
+
+    for _ in range(args.turns):
+        samples, speech = make_turn(rng)
+        full = to_wav(samples)
+        rows["legacy"].append((RECORD_SECONDS, len(full), RECORD_SECONDS, 1))
+
+        heard, recorded = endpoint(samples)
+        if speech is not None and (not heard or recorded < speech[1]):
+            cut_off += 1
+        if not heard:
+            rows["endpointing"].append((recorded / RATE, 0, 0.0, 0))
+            rows["endpointing + trim"].append((recorded / RATE, 0, 0.0, 0))
+            continue
+        data = to_wav(samples[:recorded])
+        rows["endpointing"].append((recorded / RATE, len(data), recorded / RATE, 1))
+
+        start = time.perf_counter()
+        clip = trim_silence(data)
+        vad_ms.append((time.perf_counter() - start) * 1000)
+        if clip is None:
+            missed += speech is not None
+            rows["endpointing + trim"].append((recorded / RATE, len(data), 0.0, 0))
+        else:
+            rows["endpointing + trim"].append((recorded / RATE, len(data), clip.seconds_out, 1))
+            span = speech_span(np.clip(samples[:recorded], -32768, 32767).astype("<i2"), RATE)
+            if speech is not None and (span[0] > speech[0] or span[1] < min(speech[1], recorded)):
+                clipped += 1
+
+    print(f"{args.turns} turns, {SILENT_SHARE:.0%} without an answer")
+    print(f"{'per turn':<20}  {'recorded s':>10}  {'uploaded B':>10}  {'STT audio s':>11}  {'STT calls':>9}")
+    for label, values in rows.items():
+        cols = [statistics.mean(v[i] for v in values) for i in range(4)]
+        print(f"{label:<20}  {cols[0]:>10.2f}  {cols[1]:>10.0f}  {cols[2]:>11.2f}  {cols[3]:>9.0%}")
+    legacy = [statistics.mean(v[i] for v in rows["legacy"]) for i in range(3)]
+    best = [statistics.mean(v[i] for v in rows["endpointing + trim"]) for i in range(3)]
+    print()
+    print(f"saved per turn: {legacy[0] - best[0]:.2f} s recording, {legacy[1] - best[1]:.0f} bytes uploaded, "
+          f"{legacy[2] - best[2]:.2f} s of STT audio")
+    print(f"answers cut off by endpointing: {cut_off}, rejected by host VAD: {missed}, clipped by trimming: {clipped}")
+    print(f"host VAD: {statistics.mean(vad_ms):.2f} ms per clip")
+
+
+def run_files(paths):
+    print(f"{'file':<40}  {'in s':>6}  {'out s':>6}  {'in B':>8}  {'out B':>8}  {'ms':>6}")
+    for path in paths:
+        data = Path(path).read_bytes()
+        start = time.perf_counter()
+        clip = trim_silence(data)
+        ms = (time.perf_counter() - start) * 1000
+        name = Path(path).name[:40]
+        if clip is None:
+            print(f"{name:<40}  {'no speech':>6}  {'':>6}  {len(data):>8}  {0:>8}  {ms:>6.2f}")
+        else:
+            print(f"{name:<40}  {clip.seconds_in:>6.2f}  {clip.seconds_out:>6.2f}  "
+                  f"{clip.bytes_in:>8}  {clip.bytes_out:>8}  {ms:>6.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--wav", nargs="+", help="run the host VAD on these recordings")
+    args = parser.parse_args()
+    if args.wav:
+        run_files(args.wav)
+    else:
+        run_synthetic(args)
+
+
+if __name__ == "__main__":
+    main()
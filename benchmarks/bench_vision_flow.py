@@ -0,0 +1,88 @@
+"""Latency of a vision question under the old and new NAO <-> laptop flows.
+
+Monte Carlo timeline of one vision turn, measured from the end of the
+recording to the moment NAO starts speaking the answer:
+
+  legacy       need_camera reply, fixed 3.0 s sleep, speech-equality polling,
+               size-stability checks on the WAV (twice) and on the JPEG
+  push         need_camera reply, answer delivered as chunk 2 with no sleeps,
+               upload markers instead of stability checks
+  speculative  frame captured during the recording and uploaded with it,
+               answer delivered as the first message
+
+    python benchmarks/bench_vision_flow.py --hop 0.35 --vision 1.5
+"""
+import math
+import random
+import argparse
+import statistics
+
+
+def jitter(value, rng):
+    return value * rng.uniform(0.8, 1.5)
+
+
+def poll_until(ready_at, first_poll_at, hop, poll_sec):
+    # NAO polls with scp: each attempt costs one hop, then sleeps poll_sec.
+    cycle = hop + poll_sec
+    k = max(0, math.ceil((ready_at - first_poll_at) / cycle))
+    return first_poll_at + k * cycle + hop
+
+
+def legacy(args, rng):
+    hop = jitter(args.hop, rng)
+    t_up = hop
+    t_stt = t_up + rng.uniform(0, 0.2) + 2 * args.stable + jitter(args.stt, rng)
+    t_heard = poll_until(t_stt, t_up, hop, args.poll)
+    t_img = t_heard + args.say_look + args.capture + jitter(args.hop, rng)
+    t_seen = t_stt + math.ceil((t_img - t_stt) / 0.5) * 0.5
+    t_answer = t_seen + args.stable + jitter(args.vision, rng)
+    return poll_until(t_answer, t_img + 3.0, hop, args.poll)
+
+
+def push(args, rng):
+    hop = jitter(args.hop, rng)
+    t_up = hop
+    t_stt = t_up + jitter(args.stt, rng)
+    t_heard = poll_until(t_stt, t_up, hop, args.poll)
+    t_img = t_heard + args.say_look + args.capture + jitter(args.hop, rng)
+    t_answer = t_img + jitter(args.vision, rng)
+    return poll_until(t_answer, t_img, hop, args.poll)
+
+
+def speculative(args, rng):
+    hop = jitter(args.hop, rng)
+    t_up = hop
+    t_img = t_up + jitter(args.hop, rng)
+    t_stt = t_up + jitter(args.stt, rng)
+    t_answer = max(t_stt, t_img) + jitter(args.vision, rng)
+    return poll_until(t_answer, t_img, hop, args.poll)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10000)
+    parser.add_argument("--hop", type=float, default=0.35, help="one scp transfer incl. SSH handshake (s)")
+    parser.add_argument("--poll", type=float, default=0.3, help="NAO POLL_SECONDS")
+    parser.add_argument("--stt", type=float, default=1.0)
+    parser.add_argument("--vision", type=float, default=1.5)
+    parser.add_argument("--stable", type=float, default=0.7, help="one legacy size-stability wait (s)")
+    parser.add_argument("--say-look", type=float, default=2.0, help="'Let me look at that.' plus look_up gesture (s)")
+    parser.add_argument("--capture", type=float, default=0.4)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'flow':<13}{'mean s':>8}{'p50 s':>8}{'p95 s':>8}")
+    baseline = None
+    for name, flow in (("legacy", legacy), ("push", push), ("speculative", speculative)):
+        samples = sorted(flow(args, rng) for _ in range(args.runs))
+        mean = statistics.mean(samples)
+        baseline = baseline or mean
+        p50 = samples[len(samples) // 2]
+        p95 = samples[int(len(samples) * 0.95)]
+        print(f"{name:<13}{mean:>8.2f}{p50:>8.2f}{p95:>8.2f}   ({(1 - mean / baseline) * 100:.0f}% faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+"""Stand-in for the old PIL Image module on NAO, which take_photo() uses.
+
+The fake ALVideoDevice (naoqi.py) returns the canned JPEG as the pixel data,
+so saving writes it unchanged.
+"""
+
+
+class _Frame(object):
+    def __init__(self, data):
+        self.data = data
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.data)
+
+
+def fromstring(mode, size, data):
+    return _Frame(data)
@@ -0,0 +1,245 @@
+"""A stand-in for the NAOqi SDK, so nao_tutor_loop.py runs off the robot.
+
+ALProxy hands out fakes of the services the loop uses. Nothing moves and
+nothing is heard, but calls take about as long as on NAO:
+- ALTextToSpeech: say() lasts as long as the words take at
+  FAKE_NAO_WORDS_PER_SEC (0: no time at all)
+- ALAudioDevice / ALAudioRecorder: the learner's answers are canned 16-bit
+  mono WAVs (FAKE_NAO_ANSWERS/*.wav in name order; the first is said once,
+  the others in turn after it). They play in real time into the subscribed
+  module's processRemote, or into the front-mic energy readings while the
+  recorder runs, which then saves the canned WAV as the recording
+- ALVideoDevice: every frame is the canned JPEG FAKE_NAO_FRAME, which the
+  fake Image module next to this file saves unchanged; with
+  FAKE_NAO_FRAME="" the camera returns nothing, as a busy one does
+- ALMotion, ALLeds: timelines and fades take their time
+
+When the robot stops listening and whenever it starts to say something is
+appended to FAKE_NAO_EVENTS as JSON lines (see bench_fleet.py).
+"""
+import os
+import glob
+import json
+import time
+import wave
+import audioop
+import shutil
+import threading
+
+# About what ALAudioDevice hands a subscriber at a time.
+BUFFER_SAMPLES = 1600
+FRAME_WIDTH = 640
+FRAME_HEIGHT = 480
+
+_modules = {}
+_events_lock = threading.Lock()
+
+
+def note(event, **fields):
+    path = os.environ.get("FAKE_NAO_EVENTS")
+    if not path:
+        return
+    fields.update(event=event, t=time.time())
+    with _events_lock:
+        with open(path, "a") as f:
+            f.write(json.dumps(fields) + "\n")
+
+
+class _Tasks(object):
+    """proxy.post.<method>(...) runs the method on a thread and returns an id for wait()."""
+
+    def __init__(self, service):
+        self._service = service
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def __getattr__(self, name):
+        method = getattr(self._service, name)
+
+        def post(*args):
+            thread = threading.Thread(target=method, args=args)
+            thread.daemon = True
+            with self._lock:
+                self._next_id += 1
+                task_id = self._next_id
+                self._threads[task_id] = thread
+            thread.start()
+            return task_id
+        return post
+
+    def wait(self, task_id, timeout=0):
+        with self._lock:
+            thread = self._threads.pop(task_id, None)
+        if thread is not None:
+            thread.join(timeout / 1000.0 if timeout else None)
+
+
+class _Service(object):
+    def __init__(self):
+        self.post = _Tasks(self)
+
+    def wait(self, task_id, timeout=0):
+        self.post.wait(task_id, timeout)
+
+
+class _Microphone(object):
+    """The learner's canned answers, one per recording."""
+
+    def __init__(self, folder):
+        self.paths = sorted(glob.glob(os.path.join(folder, "*.wav"))) if folder else []
+        self.turn = 0
+        self.path = None
+        self.pcm = b""
+        self.rate = 16000
+        self.started = 0.0
+
+    def next_answer(self):
+        if not self.paths:
+            raise IOError("no canned answers in FAKE_NAO_ANSWERS")
+        if self.turn < len(self.paths):
+            index = self.turn
+        elif len(self.paths) > 1:
+            index = 1 + (self.turn - 1) % (len(self.paths) - 1)
+        else:
+            index = 0
+        self.turn += 1
+        self.path = self.paths[index]
+        wav = wave.open(self.path, "rb")
+        try:
+            self.rate = wav.getframerate()
+            self.pcm = wav.readframes(wav.getnframes())
+        finally:
+            wav.close()
+        self.started = time.time()
+
+    def energy(self):
+        """Energy of the last 100 ms of the answer; silence once it is over."""
+        end = int((time.time() - self.started) * self.rate) * 2
+        chunk = self.pcm[max(0, end - self.rate // 10 * 2):end]
+        return audioop.rms(chunk, 2) if chunk else 0
+
+
+microphone = _Microphone(os.environ.get("FAKE_NAO_ANSWERS"))
+
+
+class TextToSpeech(_Service):
+    def say(self, text):
+        note("say", text=text)
+        words_per_sec = float(os.environ.get("FAKE_NAO_WORDS_PER_SEC", "3"))
+        if words_per_sec:
+            time.sleep(len(text.split()) / words_per_sec)
+
+
+class AudioDevice(_Service):
+    def __init__(self):
+        _Service.__init__(self)
+        self._stop = None
+
+    def enableEnergyComputation(self):
+        pass
+
+    def setClientPreferences(self, name, rate, channels, deinterleave):
+        pass
+
+    def getFrontMicEnergy(self):
+        return microphone.energy()
+
+    def subscribe(self, name):
+        microphone.next_answer()
+        self._stop = threading.Event()
+        thread = threading.Thread(target=self._play, args=(_modules[name], self._stop))
+        thread.daemon = True
+        thread.start()
+
+    def unsubscribe(self, name):
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+        note("listened")
+
+    def _play(self, module, stop):
+        size = BUFFER_SAMPLES * 2
+        buffer_seconds = float(BUFFER_SAMPLES) / microphone.rate
+        index = 0
+        while not stop.wait(max(0.0, microphone.started + (index + 1) * buffer_seconds - time.time())):
+            buffer = microphone.pcm[index * size:(index + 1) * size]
+            module.processRemote(1, BUFFER_SAMPLES, [0, 0], buffer + b"\0" * (size - len(buffer)))
+            index += 1
+
+
+class AudioRecorder(_Service):
+    def __init__(self):
+        _Service.__init__(self)
+        self._path = None
+
+    def startMicrophonesRecording(self, path, file_type, rate, channels):
+        microphone.next_answer()
+        self._path = path
+
+    def stopMicrophonesRecording(self):
+        # The loop also calls this to clear a recording left running.
+        if self._path is None:
+            return
+        shutil.copyfile(microphone.path, self._path)
+        self._path = None
+        note("listened")
+
+
+class VideoDevice(_Service):
+    def subscribe(self, name, resolution, color_space, fps):
+        return name
+
+    def unsubscribe(self, name):
+        pass
+
+    def getImageRemote(self, name):
+        if not os.environ.get("FAKE_NAO_FRAME"):
+            return None
+        with open(os.environ["FAKE_NAO_FRAME"], "rb") as f:
+            data = f.read()
+        now = time.time()
+        return [FRAME_WIDTH, FRAME_HEIGHT, 3, 11, int(now), int(now % 1 * 1e6), data]
+
+
+class Motion(_Service):
+    def setStiffnesses(self, names, stiffness):
+        pass
+
+    def angleInterpolation(self, names, angles, times, absolute):
+        time.sleep(max(keys[-1] for keys in times) if times else 0.0)
+
+
+class Leds(_Service):
+    def fadeRGB(self, name, color, duration):
+        time.sleep(duration)
+
+
+SERVICES = {
+    "ALTextToSpeech": TextToSpeech,
+    "ALAudioDevice": AudioDevice,
+    "ALAudioRecorder": AudioRecorder,
+    "ALVideoDevice": VideoDevice,
+    "ALMotion": Motion,
+    "ALLeds": Leds,
+}
+
+
+def ALProxy(name, ip="127.0.0.1", port=9559):
+    return SERVICES[name]()
+
+
+class ALBroker(object):
+    def __init__(self, name, ip, port, parent_ip, parent_port):
+        self.name = name
+
+    def shutdown(self):
+        pass
+
+
+class ALModule(object):
+    """Found by ALAudioDevice.subscribe() under its name, as NAOqi would."""
+
+    def __init__(self, name):
+        self.name = name
+        _modules[name] = self
@@ -0,0 +1,23 @@
+"""Run Nao-Codes/nao_tutor_loop.py as a virtual robot on the fake NAOqi next to this file.
+
+Needs the Python 2.7 interpreter NAO runs. NAO_ROBOT_ID names the robot, as
+on NAO; FAKE_NAO_SETTINGS (JSON) overrides the loop's settings, e.g.
+
+    FAKE_NAO_SETTINGS='{"LAPTOP_SSH": "nao@127.0.0.1", "LOCAL_DIR": "/tmp/nao1"}' python2 robot.py
+
+The canned answers and frame are set as described in naoqi.py.
+"""
+import os
+import sys
+import json
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir, os.pardir, "Nao-Codes"))
+sys.path.insert(0, HERE)
+
+import nao_tutor_loop
+
+for name, value in json.loads(os.environ.get("FAKE_NAO_SETTINGS", "{}")).items():
+    setattr(nao_tutor_loop, str(name), value)
+
+nao_tutor_loop.main()
@@ -0,0 +1,199 @@
+"""Local stand-in for the Gemini API, for benchmarks.
+
+Speaks enough of the REST protocol for the google-genai SDK
+(generateContent, streamGenerateContent?alt=sse and models.get), so the
+server runs unchanged with nao_gemini.create_client(key, standin.base_url).
+Replies are canned per request kind (profile, tutor, vision, summary) and
+delayed by a configurable latency distribution, plus prefill_ms for every
+1000 prompt tokens; streamed tutor replies arrive in small chunks. The
+prompt size of every request is kept in prompt_tokens, by kind. Replies carry usageMetadata, and with quota_rpm / quota_tpm
+requests beyond the quota of the last quota_window_sec get a 429, like an
+API key shared by too many robots.
+
+    standin = GeminiStandIn(Latency.parse("600:0.4"))
+    base_url = standin.start()
+"""
+import json
+import math
+import random
+import asyncio
+import time
+import threading
+from collections import Counter, defaultdict, deque
+
+TUTOR_REPLY = {
+    "gestures": ["nod", "hand_open"],
+    "led_color": "blue",
+    "speech": "Great answer, well done! We say I like apples, not I likes apples. "
+              "Now tell me, which animal do you like the most and why?",
+}
+VISION_REPLY = {"speech": "I can see a person with a striped shirt.", "gestures": ["nod"], "led_color": "blue"}
+PROFILE_REPLY = {"name": "Alex", "topic": "animals"}
+SUMMARY_REPLY = ("Practised simple present sentences about the topic. The student often says 'I likes' "
+                 "and 'I has' and was corrected to 'I like' and 'I have'. Good vocabulary and full answers.")
+
+
+class Latency:
+    """Lognormal delay around median_ms; stall_rate of the calls take stall_ms instead."""
+
+    def __init__(self, median_ms, sigma=0.0, stall_rate=0.0, stall_ms=0.0):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.stall_rate = stall_rate
+        self.stall_ms = stall_ms
+
+    @classmethod
+    def parse(cls, spec):
+        """"median[:sigma[:stall_rate:stall_ms]]", e.g. "600:0.4" or "600:0.4:0.02:10000"."""
+        return cls(*(float(part) for part in spec.split(":")))
+
+    def sample(self, rng=random):
+        if self.stall_rate and rng.random() < self.stall_rate:
+            return self.stall_ms / 1000.0
+        return self.median_ms * math.exp(rng.gauss(0.0, self.sigma)) / 1000.0 if self.sigma else self.median_ms / 1000.0
+
+    def __repr__(self):
+        return f"{self.median_ms:g}:{self.sigma:g}:{self.stall_rate:g}:{self.stall_ms:g}"
+
+
+IMAGE_TOKENS = 258
+
+
+def _tokens(text):
+    return len(text) // 4
+
+
+def _candidate(text, usage=None):
+    body = {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP", "index": 0}]}
+    if usage is not None:
+        body["usageMetadata"] = {"promptTokenCount": usage[0], "candidatesTokenCount": usage[1], "totalTokenCount": sum(usage)}
+    return body
+
+
+class GeminiStandIn:
+    """error_rate of the calls fail with error_status (e.g. 503, 429) after their delay."""
+
+    def __init__(self, latency=None, chunk_ms=40.0, chunk_chars=24, error_rate=0.0, error_status=503, seed=1,
+                 quota_rpm=0, quota_tpm=0, quota_window_sec=60.0, prefill_ms=0.0):
+        self.latency = latency or Latency(600, 0.4)
+        self.prefill_ms = prefill_ms
+        self.chunk_ms = chunk_ms
+        self.chunk_chars = chunk_chars
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rng = random.Random(seed)
+        self.quota_rpm = quota_rpm
+        self.quota_tpm = quota_tpm
+        self.quota_window_sec = quota_window_sec
+        self._admitted = deque()
+        self.calls = Counter()
+        self.prompt_tokens = defaultdict(list)
+        self.base_url = None
+        self._loop = None
+        self._server = None
+
+    def start(self, host="127.0.0.1", port=0):
+        ready = threading.Event()
+        threading.Thread(target=self._run, args=(host, port, ready), daemon=True).start()
+        ready.wait(5)
+        return self.base_url
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+
+    def _run(self, host, port, ready):
+        async def main():
+            self._loop = asyncio.get_running_loop()
+            self._server = await asyncio.start_server(self._serve_connection, host, port)
+            self.base_url = "http://%s:%d" % self._server.sockets[0].getsockname()[:2]
+            ready.set()
+            # stop() only closes the listening socket; the loop lives as long as the process.
+            await asyncio.Event().wait()
+
+        asyncio.run(main())
+
+    async def _serve_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length") or 0))
+                method, target = request_line.decode("latin-1").split()[:2]
+                await self._handle(method, target, body, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _over_quota(self, tokens):
+        now = time.monotonic()
+        while self._admitted and self._admitted[0][0] <= now - self.quota_window_sec:
+            self._admitted.popleft()
+        if self.quota_rpm and len(self._admitted) >= self.quota_rpm:
+            return True
+        if self.quota_tpm and sum(t for _, t in self._admitted) + tokens > self.quota_tpm:
+            return True
+        self._admitted.append((now, tokens))
+        return False
+
+    async def _handle(self, method, target, body, writer):
+        if method == "GET":
+            self.calls["get"] += 1
+            return await self._send_json(writer, 200, {"name": target.split("/")[-1].split("?")[0]})
+
+        request = json.loads(body or b"{}")
+        parts = [part for content in request.get("contents", []) for part in content.get("parts", [])]
+        prompt = " ".join(part.get("text", "") for part in parts)
+        if any("inlineData" in part or "inline_data" in part for part in parts):
+            kind, reply = "vision", VISION_REPLY
+        elif "exactly these keys" in prompt:
+            kind, reply = "profile", PROFILE_REPLY
+        elif "NOTES SO FAR" in prompt:
+            kind, reply = "summary", SUMMARY_REPLY
+        else:
+            kind, reply = "tutor", TUTOR_REPLY
+        self.calls[kind] += 1
+
+        text = reply if isinstance(reply, str) else json.dumps(reply)
+        images = sum(1 for part in parts if "inlineData" in part or "inline_data" in part)
+        usage = (_tokens(prompt) + IMAGE_TOKENS * images, _tokens(text))
+        self.prompt_tokens[kind].append(usage[0])
+        if (self.quota_rpm or self.quota_tpm) and self._over_quota(sum(usage)):
+            self.calls["throttled"] += 1
+            error = {"error": {"code": 429, "message": "stand-in quota exceeded", "status": "RESOURCE_EXHAUSTED"}}
+            return await self._send_json(writer, 429, error)
+
+        await asyncio.sleep(self.latency.sample(self.rng) + self.prefill_ms * usage[0] / 1e6)
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.calls["errors"] += 1
+            error = {"error": {"code": self.error_status, "message": "stand-in error", "status": "UNAVAILABLE"}}
+            return await self._send_json(writer, self.error_status, error)
+
+        if ":streamGenerateContent" not in target:
+            return await self._send_json(writer, 200, _candidate(text, usage))
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        for i in range(0, len(text), self.chunk_chars):
+            if i:
+                await asyncio.sleep(self.chunk_ms / 1000.0)
+            last = i + self.chunk_chars >= len(text)
+            event = b"data: " + json.dumps(_candidate(text[i:i + self.chunk_chars], usage if last else None)).encode() + b"\r\n\r\n"
+            writer.write(b"%x\r\n%s\r\n" % (len(event), event))
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _send_json(self, writer, status, payload):
+        data = json.dumps(payload).encode()
+        writer.write(b"HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n"
+                     % (status, b"OK" if status == 200 else b"Error", len(data)) + data)
+        await writer.drain()
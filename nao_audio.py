@@ -0,0 +1,197 @@
+import io
+import wave
+import shutil
+import struct
+import warnings
+import subprocess
+from collections import namedtuple
+
+import numpy as np
+
+try:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        import audioop
+except ImportError:
+    # Gone from the standard library since Python 3.13; ADPCM uploads then
+    # go through the pure-Python decoder below.
+    audioop = None
+
+FRAME_MS = 20
+# A frame is speech when its RMS is this many times the clip's noise floor.
+NOISE_RATIO = 3.0
+MIN_SPEECH_RMS = 150.0
+MIN_SPEECH_MS = 150
+PAD_MS = 200
+
+# Upload formats NAO may send (UPLOAD_FORMAT in nao_tutor_loop.py).
+UPLOAD_SUFFIXES = (".wav", ".ogg", ".flac", ".adpcm")
+# Header of Nao-Codes/nao_codec.py's ADPCM files: magic, sample rate, channels.
+ADPCM_MAGIC = b"NAOA"
+_ADPCM_HEADER = struct.Struct("<4sIH")
+# Sample rate compressed uploads are decoded to when ffmpeg does the decoding.
+DECODE_RATE = 16000
+
+Clip = namedtuple("Clip", ["wav", "seconds_in", "seconds_out", "bytes_in", "bytes_out"])
+
+# IMA ADPCM tables, as in audioop.
+_ADPCM_INDEX = [-1, -1, -1, -1, 2, 4, 6, 8] * 2
+_ADPCM_STEPS = [
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45, 50, 55, 60, 66,
+    73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230, 253, 279, 307, 337, 371, 408,
+    449, 494, 544, 598, 658, 724, 796, 876, 963, 1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066,
+    2272, 2499, 2749, 3024, 3327, 3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630,
+    9493, 10442, 11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794, 32767
+]
+
+
+def frame_rms(samples, frame_len):
+    frames = len(samples) // frame_len
+    x = samples[:frames * frame_len].astype(np.float32).reshape(frames, frame_len)
+    return np.sqrt(np.mean(x * x, axis=1))
+
+
+def pcm_wav(pcm, rate, channels=1):
+    out = io.BytesIO()
+    with wave.open(out, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(pcm)
+    return out.getvalue()
+
+
+def _adpcm_tables():
+    """For every (step index, code): the signed change to the sample and the next step index."""
+    diffs, nexts = [], []
+    for index, step in enumerate(_ADPCM_STEPS):
+        for code in range(16):
+            diff = step >> 3
+            if code & 4:
+                diff += step
+            if code & 2:
+                diff += step >> 1
+            if code & 1:
+                diff += step >> 2
+            diffs.append(-diff if code & 8 else diff)
+            nexts.append(min(max(index + _ADPCM_INDEX[code], 0), 88) * 16)
+    return diffs, nexts
+
+
+_ADPCM_DIFFS, _ADPCM_NEXT = _adpcm_tables()
+
+
+def adpcm_to_pcm(adpcm):
+    """audioop.adpcm2lin(adpcm, 2, None)[0] in pure Python: two samples per byte, high nibble first."""
+    diffs, nexts = _ADPCM_DIFFS, _ADPCM_NEXT
+    out = []
+    value, state = 0, 0
+    for byte in adpcm:
+        for code in (byte >> 4, byte & 0x0F):
+            value += diffs[state + code]
+            value = -32768 if value < -32768 else 32767 if value > 32767 else value
+            state = nexts[state + code]
+            out.append(value)
+    return np.array(out, dtype="<i2").tobytes()
+
+
+def decode_adpcm(data):
+    _, rate, channels = _ADPCM_HEADER.unpack_from(data)
+    adpcm = data[_ADPCM_HEADER.size:]
+    if audioop is not None:
+        pcm, _ = audioop.adpcm2lin(adpcm, 2, None)
+    else:
+        pcm = adpcm_to_pcm(adpcm)
+    return pcm_wav(pcm, rate, channels)
+
+
+def decode_compressed(data):
+    """Ogg (Vorbis/Opus) or FLAC bytes to WAV, with soundfile if installed, else an ffmpeg pipe."""
+    try:
+        import soundfile
+    except ImportError:
+        soundfile = None
+    if soundfile is not None:
+        samples, rate = soundfile.read(io.BytesIO(data), dtype="int16", always_2d=True)
+        return pcm_wav(samples.tobytes(), rate, samples.shape[1])
+    if shutil.which("ffmpeg"):
+        pcm = subprocess.run(
+            ["ffmpeg", "-v", "error", "-i", "pipe:0", "-f", "s16le", "-ac", "1", "-ar", str(DECODE_RATE), "pipe:1"],
+            input=data, stdout=subprocess.PIPE, check=True
+        ).stdout
+        return pcm_wav(pcm, DECODE_RATE)
+    raise RuntimeError("decoding ogg/flac uploads needs the soundfile package or ffmpeg")
+
+
+def to_wav(data):
+    """16-bit PCM WAV bytes for any upload format, decoded in memory."""
+    head = data[:4]
+    if head == b"RIFF":
+        return data
+    if head == ADPCM_MAGIC:
+        return decode_adpcm(data)
+    if head in (b"OggS", b"fLaC"):
+        return decode_compressed(data)
+    raise ValueError(f"unrecognised audio upload (starts with {head!r})")
+
+
+def mono_pcm(data):
+    """16-bit mono samples and the sample rate of WAV bytes; channels are averaged."""
+    with wave.open(io.BytesIO(data), "rb") as wav:
+        params = wav.getparams()
+        frames = wav.readframes(params.nframes)
+    if params.sampwidth != 2:
+        raise ValueError(f"expected 16-bit PCM, got {params.sampwidth * 8}-bit")
+    samples = np.frombuffer(frames, dtype="<i2")
+    if params.nchannels > 1:
+        samples = samples[:len(samples) // params.nchannels * params.nchannels].reshape(-1, params.nchannels)
+        samples = samples.mean(axis=1).astype("<i2")
+    return samples, params.framerate
+
+
+def speech_span(samples, rate, frame_ms=FRAME_MS, pad_ms=PAD_MS):
+    """(start, end) sample indices of the speech in a mono clip, or None if there is none."""
+    frame_len = max(1, rate * frame_ms // 1000)
+    rms = frame_rms(samples, frame_len)
+    if not len(rms):
+        return None
+    floor = np.percentile(rms, 10)
+    # A clip that is speech from end to end has a high floor; stay below its peaks.
+    threshold = max(MIN_SPEECH_RMS, min(floor * NOISE_RATIO, rms.max() * 0.2))
+    voiced = np.flatnonzero(rms > threshold)
+    if len(voiced) * frame_ms < MIN_SPEECH_MS:
+        return None
+    pad = rate * pad_ms // 1000
+    start = max(0, voiced[0] * frame_len - pad)
+    end = min(len(samples), (voiced[-1] + 1) * frame_len + pad)
+    return start, end
+
+
+def trim_silence(data):
+    """Cut leading and trailing silence from WAV bytes.
+
+    Returns a Clip with the trimmed WAV, or None if the recording holds no
+    speech. Anything but 16-bit PCM is passed through untouched.
+    """
+    with wave.open(io.BytesIO(data), "rb") as wav:
+        params = wav.getparams()
+        frames = wav.readframes(params.nframes)
+    if not params.nframes:
+        return None
+    seconds_in = params.nframes / float(params.framerate or 1)
+    if params.sampwidth != 2:
+        return Clip(data, seconds_in, seconds_in, len(data), len(data))
+
+    samples = np.frombuffer(frames, dtype="<i2")
+    if params.nchannels > 1:
+        samples = samples[:len(samples) // params.nchannels * params.nchannels].reshape(-1, params.nchannels)
+        mono = samples.mean(axis=1)
+    else:
+        mono = samples
+    span = speech_span(mono, params.framerate)
+    if span is None:
+        return None
+
+    start, end = span
+    trimmed = pcm_wav(samples[start:end].tobytes(), params.framerate, params.nchannels)
+    return Clip(trimmed, seconds_in, (end - start) / float(params.framerate), len(data), len(trimmed))
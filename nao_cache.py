@@ -0,0 +1,193 @@
+import re
+import copy
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+NAME_SLOT = "{name}"
+
+
+def normalize_utterance(text):
+    text = text.lower().replace("’", "'")
+    return " ".join(re.sub(r"[^a-z0-9' ]+", " ", text).split())
+
+
+def cache_key(kind, version, stage, topic, utterance):
+    """Canonical key: same template version, stage, topic and normalized words."""
+    return json.dumps([kind, version, stage, (topic or "").strip().lower(), normalize_utterance(utterance)])
+
+
+def template_name(text, name):
+    # Replies greet the learner by name; store them name-free so the entry
+    # can serve every learner on the same topic.
+    if not name:
+        return text
+    return re.sub(r"\b%s\b" % re.escape(name), NAME_SLOT, text)
+
+
+def fill_name(text, name):
+    return text.replace(NAME_SLOT, name or "my friend")
+
+
+class MemoryTier:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires < now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value, expires
+
+    def put(self, key, value, expires):
+        self._entries[key] = (value, expires)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteTier:
+    """On-disk tier that survives restarts; least recently used rows go first."""
+
+    def __init__(self, path, max_entries=50000):
+        self.max_entries = max_entries
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL, used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_used ON responses (used)")
+
+    def get(self, key, now):
+        with self._lock:
+            row = self._db.execute("SELECT value, expires FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._db.execute("UPDATE responses SET used = ? WHERE key = ?", (now, key))
+        return json.loads(row[0]), row[1]
+
+    def put(self, key, value, expires):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires, used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires, now)
+            )
+            self._puts += 1
+            if self._puts % 100:
+                return
+            count = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY used LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class ResponseCache:
+    """Model response cache: memory LRU in front of an optional on-disk tier."""
+
+    def __init__(self, ttl_sec=3600.0, max_entries=1024, sqlite_path=None):
+        self.ttl_sec = ttl_sec
+        self.memory = MemoryTier(max_entries)
+        self.disk = SqliteTier(sqlite_path) if sqlite_path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._listeners = []
+
+    def listen(self, callback):
+        """callback(result) for every lookup: "hit", "disk_hit" or "miss"."""
+        self._listeners.append(callback)
+
+    def get(self, key):
+        if key is None:
+            return None
+        now = time.time()
+        found = self._memory_get(key, now)
+        if found is None and self.disk is not None:
+            found = self._disk_found(key, self.disk.get(key, now))
+        return self._result(found)
+
+    async def get_async(self, key, run_blocking):
+        """get(), with the disk tier read through run_blocking instead of on the event loop."""
+        if key is None:
+            return None
+        now = time.time()
+        found = self._memory_get(key, now)
+        if found is None and self.disk is not None:
+            found = self._disk_found(key, await run_blocking(self.disk.get, key, now))
+        return self._result(found)
+
+    def put(self, key, value):
+        if key is None:
+            return
+        expires = time.time() + self.ttl_sec
+        self.memory.put(key, value, expires)
+        if self.disk is not None:
+            self.disk.put(key, value, expires)
+
+    async def put_async(self, key, value, run_blocking):
+        if key is None:
+            return
+        expires = time.time() + self.ttl_sec
+        self.memory.put(key, value, expires)
+        if self.disk is not None:
+            await run_blocking(self.disk.put, key, value, expires)
+
+    def _memory_get(self, key, now):
+        found = self.memory.get(key, now)
+        if found is not None:
+            self._note("hit")
+        return found
+
+    def _disk_found(self, key, found):
+        if found is not None:
+            self.disk_hits += 1
+            self.memory.put(key, *found)
+            self._note("disk_hit")
+        return found
+
+    def _result(self, found):
+        if found is None:
+            self.misses += 1
+            self._note("miss")
+            return None
+        self.hits += 1
+        return copy.deepcopy(found[0])
+
+    def _note(self, result):
+        for callback in self._listeners:
+            callback(result)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.memory),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,392 @@
+import os
+import time
+import random
+import asyncio
+import contextlib
+import contextvars
+import functools
+from collections import Counter, deque
+
+import httpx
+from google import genai
+from google.genai import errors, types
+
+from nao_scheduler import RequestScheduler
+
+MAX_CONNECTIONS = 64
+KEEPALIVE_SEC = 300
+MAX_CONCURRENT_CALLS = 32
+
+# The API key's quota, shared by every robot (0: no limit). Requests are
+# held back to QUOTA_HEADROOM of it rather than sent into a 429; after a 429
+# nothing is sent for THROTTLE_PAUSE_SEC.
+REQUESTS_PER_MINUTE = int(os.getenv("NAO_GEMINI_RPM", "1000"))
+TOKENS_PER_MINUTE = int(os.getenv("NAO_GEMINI_TPM", "1000000"))
+QUOTA_HEADROOM = 0.9
+# Quota saved up while idle, in seconds of it. With the headroom, no minute
+# can see more than 0.9 + 5/60 of the quota.
+QUOTA_BURST_SEC = 5.0
+THROTTLE_PAUSE_SEC = 2.0
+# Token estimate per request, settled against usage_metadata afterwards.
+CHARS_PER_TOKEN = 4
+IMAGE_TOKENS = 258
+EXPECTED_REPLY_TOKENS = 200
+# Scheduling class of each call; anything else is "interactive".
+CALL_PRIORITIES = {"vision": "vision"}
+
+# One request may take at most this long, and never past the turn deadline.
+CALL_TIMEOUT_SEC = 8.0
+# Once a streamed reply has started, the next chunk must come within this.
+CHUNK_TIMEOUT_SEC = 5.0
+# Attempts per call (first try + retries) and their full-jitter backoff.
+MAX_ATTEMPTS = 3
+BACKOFF_BASE_SEC = 0.2
+BACKOFF_MAX_SEC = 1.0
+# Less time than this left in the deadline is not worth another attempt.
+MIN_ATTEMPT_SEC = 0.5
+
+# A second, identical request is sent when the first one is slower than the
+# p95 of recent calls of the same kind; the first answer wins.
+HEDGE_REQUESTS = True
+HEDGE_QUANTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_DEFAULT_SEC = 2.0
+HEDGE_MIN_DELAY_SEC = 0.2
+# Hedges are capped at about this share of the calls, so a slow upstream
+# does not get twice the load.
+HEDGE_BUDGET = 0.1
+
+# After this many failed calls in a row, calls fail fast for the cooldown;
+# then one probe call at a time is let through until one succeeds.
+BREAKER_FAILURES = 5
+BREAKER_COOLDOWN_SEC = 20.0
+
+_deadline = contextvars.ContextVar("gemini_deadline", default=None)
+_session = contextvars.ContextVar("gemini_session", default=None)
+_priority = contextvars.ContextVar("gemini_priority", default=None)
+_listeners = []
+_queue_listeners = []
+
+
+class GeminiUnavailable(Exception):
+    """No reply before the deadline, or the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    def __init__(self, failures=BREAKER_FAILURES, cooldown_sec=BREAKER_COOLDOWN_SEC):
+        self.failures = failures
+        self.cooldown_sec = cooldown_sec
+        self._failed = 0
+        self._retry_at = None
+
+    @property
+    def state(self):
+        if self._retry_at is None:
+            return "closed"
+        return "open" if time.monotonic() < self._retry_at else "half_open"
+
+    def allow(self):
+        if self._retry_at is None:
+            return True
+        now = time.monotonic()
+        if now < self._retry_at:
+            return False
+        # Let this call probe the upstream; the others keep failing fast.
+        self._retry_at = now + self.cooldown_sec
+        return True
+
+    def record(self, ok):
+        """Returns True when this failure opened the breaker."""
+        if ok:
+            self._failed = 0
+            self._retry_at = None
+            return False
+        self._failed += 1
+        if self._failed < self.failures:
+            return False
+        opened = self._retry_at is None
+        self._retry_at = time.monotonic() + self.cooldown_sec
+        return opened
+
+
+class LatencyWindow:
+    """Durations of the last `size` successful requests of one kind."""
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def add(self, seconds):
+        self._samples.append(seconds)
+
+    def quantile(self, q):
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def make_scheduler():
+    return RequestScheduler(int(REQUESTS_PER_MINUTE * QUOTA_HEADROOM), int(TOKENS_PER_MINUTE * QUOTA_HEADROOM),
+                            MAX_CONCURRENT_CALLS, QUOTA_BURST_SEC)
+
+
+breaker = CircuitBreaker()
+scheduler = make_scheduler()
+latencies = {}
+stats = Counter()
+_hedge_credit = 1.0
+
+
+def reset():
+    """Forget latencies, stats, breaker and quota state, and apply changed settings (benchmarks)."""
+    global breaker, scheduler, _hedge_credit
+    breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_COOLDOWN_SEC)
+    scheduler = make_scheduler()
+    latencies.clear()
+    stats.clear()
+    _hedge_credit = 1.0
+
+
+def listen(callback):
+    """callback(call, event) for every timeout, error, retry, hedge and breaker trip."""
+    _listeners.append(callback)
+
+
+def listen_queue(callback):
+    """callback(priority, seconds) for every request the scheduler lets through."""
+    _queue_listeners.append(callback)
+
+
+def _note(call, event):
+    stats[call, event] += 1
+    for callback in _listeners:
+        callback(call, event)
+
+
+@contextlib.contextmanager
+def deadline(seconds):
+    """Calls made inside the block (and tasks it starts) must finish within seconds."""
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextlib.contextmanager
+def scheduling(session, priority=None):
+    """Requests made inside the block queue as this session's; priority overrides the call's class."""
+    tokens = _session.set(session), _priority.set(priority)
+    try:
+        yield
+    finally:
+        _session.reset(tokens[0])
+        _priority.reset(tokens[1])
+
+
+def estimate_tokens(contents):
+    parts = contents if isinstance(contents, list) else [contents]
+    return EXPECTED_REPLY_TOKENS + sum(len(part) // CHARS_PER_TOKEN if isinstance(part, str) else IMAGE_TOKENS for part in parts)
+
+
+def _used_tokens(response):
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None) if usage is not None else None
+
+
+async def _acquire(call, contents):
+    priority = _priority.get() or CALL_PRIORITIES.get(call, "interactive")
+    grant = await scheduler.acquire(priority, _session.get(), estimate_tokens(contents))
+    for callback in _queue_listeners:
+        callback(priority, grant.waited)
+    return grant
+
+
+def _time_left(cap):
+    end = _deadline.get()
+    return cap if end is None else min(cap, end - time.monotonic())
+
+
+def _retryable(error):
+    if isinstance(error, (asyncio.TimeoutError, httpx.TransportError, errors.ServerError)):
+        return True
+    return isinstance(error, errors.ClientError) and error.code in (408, 429)
+
+
+def _hedge_delay(call):
+    if not HEDGE_REQUESTS or _hedge_credit < 1:
+        return None
+    window = latencies.get(call)
+    if window is None or len(window) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_SEC
+    return max(HEDGE_MIN_DELAY_SEC, window.quantile(HEDGE_QUANTILE))
+
+
+async def _hedged(call, start, discard, timeout):
+    """One attempt: start() once, and again if the first is slower than the hedge delay."""
+    global _hedge_credit
+    window = latencies.setdefault(call, LatencyWindow())
+    began = time.monotonic()
+    end = began + timeout
+    delay = _hedge_delay(call)
+    hedge_at = None if delay is None else began + delay
+    first = asyncio.ensure_future(start())
+    running = {first: began}
+    error = None
+    try:
+        while running:
+            now = time.monotonic()
+            wait = end - now if hedge_at is None else min(end, hedge_at) - now
+            done, _ = await asyncio.wait(running, timeout=max(wait, 0), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                started = running.pop(task)
+                if task.exception() is None:
+                    window.add(time.monotonic() - started)
+                    if task is not first:
+                        _note(call, "hedge_won")
+                    return task.result()
+                error = task.exception()
+            if done:
+                continue
+            if time.monotonic() >= end:
+                raise asyncio.TimeoutError()
+            if hedge_at is not None and _hedge_credit >= 1:
+                _hedge_credit -= 1
+                _note(call, "hedge")
+                running[asyncio.ensure_future(start())] = time.monotonic()
+            hedge_at = None
+        raise error
+    finally:
+        for task in running:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled() and task.exception() is None and discard is not None:
+                # Both requests answered at once; release the loser's resources.
+                asyncio.ensure_future(discard(task.result()))
+
+
+async def _call(call, start, discard=None):
+    """Run start() under the turn deadline with hedging, retries and the breaker."""
+    global _hedge_credit
+    _hedge_credit = min(_hedge_credit + HEDGE_BUDGET, 1 / HEDGE_BUDGET)
+    last_error = None
+    for attempt in range(MAX_ATTEMPTS):
+        timeout = _time_left(CALL_TIMEOUT_SEC)
+        if timeout < MIN_ATTEMPT_SEC:
+            _note(call, "deadline")
+            break
+        if not breaker.allow():
+            _note(call, "rejected")
+            raise GeminiUnavailable(f"{call}: circuit breaker open") from last_error
+        if attempt:
+            _note(call, "retry")
+        try:
+            result = await _hedged(call, start, discard, timeout)
+        except Exception as e:
+            if not _retryable(e):
+                # The upstream answered, it just did not like the request.
+                breaker.record(True)
+                raise
+            last_error = e
+            _note(call, "timeout" if isinstance(e, asyncio.TimeoutError) else "error")
+            if isinstance(e, errors.ClientError) and e.code == 429:
+                # Over quota, not down: hold every request back instead of tripping the breaker.
+                _note(call, "throttled")
+                scheduler.throttle(THROTTLE_PAUSE_SEC)
+            elif breaker.record(False):
+                _note(call, "breaker_open")
+                print(f"[WARN] Gemini circuit breaker open for {breaker.cooldown_sec:.0f} s after {breaker.failures} failures")
+            pause = random.uniform(0, min(BACKOFF_MAX_SEC, BACKOFF_BASE_SEC * 2 ** attempt))
+            if attempt + 1 < MAX_ATTEMPTS and _time_left(CALL_TIMEOUT_SEC) - pause >= MIN_ATTEMPT_SEC:
+                await asyncio.sleep(pause)
+            continue
+        breaker.record(True)
+        return result
+    raise GeminiUnavailable(f"{call}: no reply before the deadline ({last_error!r})") from last_error
+
+
+def create_client(api_key, base_url=None):
+    """One long-lived client whose HTTP pool is shared by every turn.
+
+    base_url points the client at a proxy or a local stand-in instead of the Gemini API.
+    """
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_SEC
+        ),
+        timeout=httpx.Timeout(60.0, connect=10.0)
+    )
+    return genai.Client(
+        api_key=api_key,
+        http_options=types.HttpOptions(base_url=base_url, httpx_async_client=http_client)
+    )
+
+
+async def warm_up(client, model_name):
+    # Opens the pooled TLS connection now so the first learner turn doesn't pay for it.
+    start = time.monotonic()
+    try:
+        await client.aio.models.get(model=model_name)
+        print(f"[INFO] Gemini client warmed up in {(time.monotonic() - start) * 1000:.0f} ms")
+    except Exception as e:
+        print(f"[WARN] Gemini warm-up failed: {e}")
+
+
+async def _request(client, model_name, contents, call):
+    grant = await _acquire(call, contents)
+    try:
+        response = await client.aio.models.generate_content(model=model_name, contents=contents)
+        grant.used = _used_tokens(response)
+        return response
+    finally:
+        scheduler.release(grant)
+
+
+async def _open_stream(client, model_name, contents, call):
+    """The stream, its first chunk and the scheduler grant, held until _close_stream."""
+    grant = await _acquire(call, contents)
+    stream = None
+    try:
+        stream = await client.aio.models.generate_content_stream(model=model_name, contents=contents)
+        return stream, await anext(stream, None), grant
+    except BaseException:
+        if stream is not None:
+            await stream.aclose()
+        scheduler.release(grant)
+        raise
+
+
+async def _close_stream(opened):
+    try:
+        await opened[0].aclose()
+    finally:
+        scheduler.release(opened[2])
+
+
+async def generate(client, model_name, contents, call="generate"):
+    """generate_content under the current deadline; raises GeminiUnavailable when out of options."""
+    return await _call(call, functools.partial(_request, client, model_name, contents, call))
+
+
+async def generate_stream(client, model_name, contents, call="stream"):
+    # Only the wait for the first chunk is hedged and retried: once text has
+    # been spoken, the reply cannot start over.
+    opened = await _call(call, functools.partial(_open_stream, client, model_name, contents, call), _close_stream)
+    stream, chunk, grant = opened
+    try:
+        while chunk is not None:
+            # The last chunk carries the usage of the whole reply.
+            grant.used = _used_tokens(chunk) or grant.used
+            yield chunk
+            try:
+                chunk = await asyncio.wait_for(anext(stream, None), max(_time_left(CHUNK_TIMEOUT_SEC), 0))
+            except asyncio.TimeoutError:
+                _note(call, "timeout")
+                if breaker.record(False):
+                    _note(call, "breaker_open")
+                raise
+    finally:
+        await _close_stream(opened)
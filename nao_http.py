@@ -0,0 +1,267 @@
+import os
+import re
+import hmac
+import json
+import asyncio
+import hashlib
+import ipaddress
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from nao_audio import UPLOAD_SUFFIXES
+from nao_messages import message_name, read_messages
+from nao_upload import MARKER_SUFFIX
+
+MAX_UPLOAD_BYTES = 32 * 1024 * 1024
+MAX_WAIT_SEC = 30.0
+IDLE_TIMEOUT_SEC = 120.0
+
+_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+_REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+            405: "Method Not Allowed", 408: "Request Timeout", 411: "Length Required", 413: "Payload Too Large"}
+TOKEN_HEADER = "x-nao-token"
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def _write_upload(path, body, extra):
+    """Write the file atomically, then its .done marker, like an scp upload would."""
+    tmp = path.with_name("." + path.name + ".part")
+    tmp.write_bytes(body)
+    os.replace(tmp, path)
+    info = {"size": len(body), "sha1": hashlib.sha1(body).hexdigest()}
+    info.update(extra)
+    marker = path.with_name("." + path.name + MARKER_SUFFIX + ".part")
+    marker.write_text(json.dumps(info), encoding="utf-8")
+    os.replace(marker, path.with_name(path.name + MARKER_SUFFIX))
+
+
+class NaoHttpEndpoint:
+    """Keep-alive HTTP endpoint so NAO reuses one connection for every hop.
+
+    PUT /incoming/<input_*.wav|.ogg|.flac|.adpcm> and PUT /images/<image_*.jpg> store an upload
+    plus its .done marker (X-Upload-Extra carries extra marker fields).
+    GET /outgoing/<stem>?after=N&wait=W long-polls for the turn's messages
+    with seq > N and returns them as a JSON list; GET /outgoing/<name>.json
+    returns a single message file.
+    PUT /stream/<input_*.pcm>?rate=R (chunked) is a recording sent while it
+    is made: on_stream(path, rate, extra) returns a LiveAudio that gets the
+    PCM as it arrives, and the finished recording is stored as <input_*>.wav.
+    X-Upload-Extra may also come in the stream's trailer, for marker fields
+    NAO only knows at the end (a frame it managed to capture).
+    With a token, every request must carry it in X-Nao-Token (401 otherwise);
+    without one, only a loopback address can be bound.
+    """
+
+    def __init__(self, watcher, incoming_dir, images_dir, outgoing_dir, executor=None, on_stream=None, token=None):
+        self.watcher = watcher
+        self.executor = executor
+        self.on_stream = on_stream
+        self.token = token.encode("utf-8") if token else None
+        self.uploads = {
+            "incoming": (Path(incoming_dir), "input_", UPLOAD_SUFFIXES),
+            "images": (Path(images_dir), "image_", (".jpg",)),
+        }
+        self.outgoing_dir = Path(outgoing_dir)
+        self._server = None
+
+    async def start(self, host, port):
+        if self.token is None and not is_loopback(host):
+            raise ValueError(f"refusing to serve {host} without a token")
+        self._server = await asyncio.start_server(self._serve_connection, host, port)
+        print(f"[INFO] NAO HTTP endpoint on {host}:{port}")
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _blocking(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def _serve_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT_SEC)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, close=True)
+                    break
+
+                # Refused before any body is read; the connection cannot be reused after that.
+                if self.token is not None and not hmac.compare_digest(
+                        headers.get(TOKEN_HEADER, "").encode("latin-1"), self.token):
+                    await self._respond(writer, 401, close=True)
+                    break
+
+                body = b""
+                if method == "PUT" and headers.get("transfer-encoding", "").lower() == "chunked":
+                    status = await self._stream(target, headers, reader)
+                    close = version == "HTTP/1.0" or headers.get("connection", "").lower() == "close"
+                    await self._respond(writer, status, close=close)
+                    if close:
+                        break
+                    continue
+                if method == "PUT":
+                    if "content-length" not in headers:
+                        await self._respond(writer, 411, close=True)
+                        break
+                    length = int(headers["content-length"])
+                    if length > MAX_UPLOAD_BYTES:
+                        await self._respond(writer, 413, close=True)
+                        break
+                    body = await reader.readexactly(length)
+
+                status, payload = await self._route(method, target, headers, body)
+                close = version == "HTTP/1.0" or headers.get("connection", "").lower() == "close"
+                await self._respond(writer, status, payload, close=close)
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            print(f"[ERROR] NAO HTTP connection failed: {e}")
+        finally:
+            writer.close()
+
+    async def _stream(self, target, headers, reader):
+        url = urlsplit(target)
+        parts = url.path.strip("/").split("/")
+        live = None
+        if (self.on_stream is not None and len(parts) == 2 and parts[0] == "stream" and _NAME.match(parts[1])
+                and parts[1].startswith("input_") and parts[1].endswith(".pcm")):
+            try:
+                rate = int(parse_qs(url.query).get("rate", ["16000"])[0])
+                extra = json.loads(headers.get("x-upload-extra") or "{}")
+            except ValueError:
+                rate = None
+            if rate:
+                path = self.uploads["incoming"][0] / (parts[1][:-len(".pcm")] + ".wav")
+                live = self.on_stream(path, rate, extra if isinstance(extra, dict) else {})
+
+        # The body is read to the end even when it is refused, to keep the connection usable.
+        total = 0
+        try:
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    while True:
+                        line = await reader.readline()
+                        if line in (b"\r\n", b"\n", b""):
+                            break
+                        key, _, value = line.decode("latin-1").partition(":")
+                        if live is not None and key.strip().lower() == "x-upload-extra":
+                            try:
+                                late = json.loads(value.strip())
+                            except ValueError:
+                                late = None
+                            if isinstance(late, dict):
+                                live.extra.update(late)
+                    break
+                data = await reader.readexactly(size)
+                await reader.readexactly(2)
+                total += size
+                if live is not None and total <= MAX_UPLOAD_BYTES:
+                    await live.feed(data)
+        except BaseException:
+            if live is not None:
+                live.abort()
+            raise
+
+        if live is None:
+            return 404
+        if total > MAX_UPLOAD_BYTES:
+            live.abort("stream too large")
+            return 413
+        try:
+            await self._blocking(_write_upload, live.path, live.wav(), live.extra)
+        except Exception:
+            live.abort("recording could not be stored")
+            raise
+        live.close()
+        return 201
+
+    async def _route(self, method, target, headers, body):
+        url = urlsplit(target)
+        parts = url.path.strip("/").split("/")
+        if len(parts) != 2 or not _NAME.match(parts[1]):
+            return 404, b""
+        area, name = parts
+
+        if area in self.uploads:
+            if method != "PUT":
+                return 405, b""
+            directory, prefix, suffixes = self.uploads[area]
+            if not (name.startswith(prefix) and name.endswith(suffixes)):
+                return 404, b""
+            try:
+                extra = json.loads(headers.get("x-upload-extra") or "{}")
+            except ValueError:
+                return 400, b""
+            expected = headers.get("x-content-sha1")
+            if expected and expected != hashlib.sha1(body).hexdigest():
+                return 400, b""
+            await self._blocking(_write_upload, directory / name, body, extra if isinstance(extra, dict) else {})
+            return 201, b""
+
+        if area == "outgoing":
+            if method != "GET":
+                return 405, b""
+            query = parse_qs(url.query)
+            try:
+                wait = min(float(query.get("wait", ["0"])[0]), MAX_WAIT_SEC)
+                after = int(query.get("after", ["0"])[0])
+            except ValueError:
+                return 400, b""
+
+            if name.endswith(".json"):
+                path = self.outgoing_dir / name
+                if wait > 0 and not await self.watcher.wait_for_file_async(path, wait):
+                    return 404, b""
+                try:
+                    return 200, await self._blocking(path.read_bytes)
+                except FileNotFoundError:
+                    return 404, b""
+
+            # Messages are written atomically and never change, so only the
+            # next one needs watching.
+            next_path = self.outgoing_dir / message_name(name, after + 1)
+            if wait > 0 and not await self.watcher.wait_for_file_async(next_path, wait):
+                return 404, b""
+            messages = await self._blocking(read_messages, self.outgoing_dir, name, after)
+            if not messages:
+                return 404, b""
+            return 200, json.dumps(messages, ensure_ascii=False).encode("utf-8")
+
+        return 404, b""
+
+    async def _respond(self, writer, status, payload=b"", close=False):
+        head = (
+            f"HTTP/1.1 {status} {_REASONS.get(status, 'OK')}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + payload)
+        await writer.drain()
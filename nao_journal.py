@@ -0,0 +1,134 @@
+"""Crash-safe record of every session's lesson state, for a fast restart.
+
+Each finished turn appends one line to journal.jsonl: the session id, the
+upload the turn handled and the session's whole state. Replaying the lines
+over the last snapshot gives back every session as it was, and the uploads
+already answered. Every snapshot_every lines, the sessions are written to
+snapshot.json (temp file, fsync, rename) and the journal starts over, so a
+restart reads one snapshot and a short journal.
+
+Records carry whole states, so replaying a line twice does no harm; that
+happens after a crash between a snapshot and the journal's truncation. A
+torn last line, from a crash in the middle of a write, is ignored.
+"""
+import os
+import json
+import threading
+from collections import OrderedDict
+
+SNAPSHOT_NAME = "snapshot.json"
+JOURNAL_NAME = "journal.jsonl"
+
+
+class SessionJournal:
+    """load() once at startup, then record() on the event loop and write() the lines it returns off it.
+
+    Lines must be written in the order record() returned them: replay keeps
+    the last line of each session, so a line written late would restore an
+    older state.
+    """
+
+    def __init__(self, directory, snapshot_every=500, keep_uploads=1024, fsync=True):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.keep_uploads = keep_uploads
+        self.fsync = fsync
+        # The latest state of every session, as JSON text, and the newest uploads handled.
+        self._states = {}
+        self._uploads = OrderedDict()
+        self._lines = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    @property
+    def snapshot_path(self):
+        return self.directory / SNAPSHOT_NAME
+
+    @property
+    def journal_path(self):
+        return self.directory / JOURNAL_NAME
+
+    def load(self):
+        """({session id: state}, [upload names handled, oldest first]) as of the last record."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if self.snapshot_path.exists():
+            snapshot = json.loads(self.snapshot_path.read_text(encoding="utf-8"))
+            for session_id, state in snapshot["sessions"].items():
+                self._states[session_id] = json.dumps(state)
+            for name in snapshot["uploads"]:
+                self._remember_upload(name)
+
+        replayed = 0
+        if self.journal_path.exists():
+            with open(self.journal_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn by a crash mid-write; nothing after it was acknowledged.
+                        break
+                    self._states[record["session"]] = json.dumps(record["state"])
+                    if record.get("upload"):
+                        self._remember_upload(record["upload"])
+                    replayed += 1
+
+        with self._lock:
+            if replayed or self.journal_path.exists():
+                # Start from a snapshot, so a torn line is never followed by good ones.
+                self._snapshot()
+            self._open()
+        states = {session_id: json.loads(state) for session_id, state in self._states.items()}
+        return states, list(self._uploads)
+
+    def record(self, session_id, state, upload=None):
+        """The journal line for the session's new state; call on the thread that owns the state."""
+        state_json = json.dumps(state)
+        with self._lock:
+            self._states[session_id] = state_json
+            if upload:
+                self._remember_upload(upload)
+        return '{"session": %s, "upload": %s, "state": %s}\n' % (json.dumps(session_id), json.dumps(upload), state_json)
+
+    def write(self, line):
+        """Append a line from record() and make it durable; blocks."""
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._lines += 1
+            if self._lines >= self.snapshot_every:
+                self._snapshot()
+                self._open()
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self._snapshot()
+            self._file = None
+
+    def _remember_upload(self, name):
+        self._uploads[name] = True
+        self._uploads.move_to_end(name)
+        while len(self._uploads) > self.keep_uploads:
+            self._uploads.popitem(last=False)
+
+    def _open(self):
+        self._file = open(self.journal_path, "a", encoding="utf-8")
+        self._lines = 0
+
+    def _snapshot(self):
+        sessions = ", ".join("%s: %s" % (json.dumps(session_id), state) for session_id, state in self._states.items())
+        data = '{"uploads": %s, "sessions": {%s}}\n' % (json.dumps(list(self._uploads)), sessions)
+        tmp = self.snapshot_path.with_name("." + SNAPSHOT_NAME + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        # The snapshot holds everything the journal did.
+        if self._file is not None:
+            self._file.close()
+        with open(self.journal_path, "w", encoding="utf-8"):
+            pass
@@ -0,0 +1,46 @@
+import asyncio
+
+from nao_audio import pcm_wav
+
+
+class LiveAudio:
+    """A learner's answer streamed from NAO while they are still speaking.
+
+    The HTTP endpoint feeds it 16-bit mono PCM as it arrives. Engines with an
+    incremental recognizer (engine.stream(rate)) decode every frame right
+    away; the turn waits on wait_closed() instead of a finished upload.
+    """
+
+    def __init__(self, path, rate, extra=None, recognizer=None, blocking=None):
+        # Where the finished recording is kept, named like the upload it replaces.
+        self.path = path
+        self.rate = rate
+        self.extra = extra or {}
+        self.recognizer = recognizer
+        self._blocking = blocking
+        self._pcm = bytearray()
+        self._closed = asyncio.get_running_loop().create_future()
+
+    @property
+    def seconds(self):
+        return len(self._pcm) / 2.0 / self.rate
+
+    async def feed(self, data):
+        self._pcm += data
+        if self.recognizer is not None:
+            # One frame at a time, in order; NAO is held back if recognition falls behind.
+            await self._blocking(self.recognizer.accept, bytes(data))
+
+    def wav(self):
+        return pcm_wav(bytes(self._pcm), self.rate)
+
+    def close(self):
+        if not self._closed.done():
+            self._closed.set_result(None)
+
+    def abort(self, reason="NAO stopped streaming"):
+        if not self._closed.done():
+            self._closed.set_exception(ConnectionError(reason))
+
+    async def wait_closed(self):
+        await asyncio.shield(self._closed)
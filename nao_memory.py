@@ -0,0 +1,96 @@
+"""Rolling memory of a lesson's conversation for the tutor prompt.
+
+The newest turns are kept word for word. Once they outgrow recent_tokens,
+the oldest of them are folded into a running summary by one Gemini call,
+enough at a time to bring the verbatim part down to half of recent_tokens.
+The summary is therefore rewritten every few turns, not on every turn. The
+rendered memory never exceeds its budget however long the lesson runs: while
+a summary is still being written, the oldest verbatim turns are left out.
+
+The memory is a plain dict kept in the session state:
+{"summary": str, "turns": [[student, tutor], ...]}.
+"""
+from nao_gemini import CHARS_PER_TOKEN
+
+
+def new_memory():
+    return {"summary": "", "turns": []}
+
+
+def count_tokens(text):
+    return len(text) // CHARS_PER_TOKEN
+
+
+def _turn_lines(turn):
+    student, tutor = turn
+    return f"Student: {student}\nTutor: {tutor}"
+
+
+def _turn_tokens(turn):
+    return count_tokens(_turn_lines(turn)) + 1
+
+
+def clip(text, max_tokens):
+    """text cut to about max_tokens, at a word boundary."""
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + " ..."
+
+
+def remember(memory, student, tutor):
+    memory["turns"].append([student, tutor])
+
+
+def render(memory, budget_tokens):
+    """The memory as prompt text of at most budget_tokens; "" while it is empty."""
+    summary = clip(memory["summary"], budget_tokens // 2) if memory["summary"] else ""
+    left = budget_tokens - count_tokens(summary)
+    kept = []
+    for turn in reversed(memory["turns"]):
+        left -= _turn_tokens(turn)
+        if left < 0:
+            break
+        kept.append(_turn_lines(turn))
+    parts = []
+    if summary:
+        parts.append(f"Earlier in the lesson: {summary}")
+    parts.extend(reversed(kept))
+    return "\n".join(parts)
+
+
+def turns_to_fold(memory, recent_tokens):
+    """How many of the oldest turns to summarize now; 0 while the recent turns fit."""
+    sizes = [_turn_tokens(turn) for turn in memory["turns"]]
+    total = sum(sizes)
+    if total <= recent_tokens:
+        return 0
+    count = 0
+    # Fold down to half, so the next summary is a few turns away.
+    while count < len(sizes) - 1 and total > recent_tokens // 2:
+        total -= sizes[count]
+        count += 1
+    return count
+
+
+def summary_prompt(memory, count, summary_tokens):
+    turns = "\n".join(_turn_lines(turn) for turn in memory["turns"][:count])
+    return f"""
+You keep short notes on an English lesson for the tutor who is teaching it.
+
+NOTES SO FAR: {memory["summary"] or "(none yet)"}
+
+NEW TURNS:
+{turns}
+
+Rewrite the notes so they also cover the new turns, in at most {summary_tokens * 3 // 4} words:
+what was practised, the student's mistakes and how they were corrected, what
+they did well, and any question still open. Return only the notes, as one
+plain paragraph.
+""".strip()
+
+
+def fold(memory, count, summary, summary_tokens):
+    """Replace the oldest count turns by the new summary."""
+    memory["summary"] = clip(" ".join(summary.split()), summary_tokens)
+    del memory["turns"][:count]
@@ -0,0 +1,48 @@
+import os
+import json
+from pathlib import Path
+
+
+def message_name(stem, seq):
+    # seq 1 keeps the plain <stem>.json name older NAO scripts fetch.
+    return f"{stem}.json" if seq == 1 else f"{stem}.{seq}.json"
+
+
+def write_message(directory, stem, seq, payload):
+    """Write one message atomically: readers see the whole file or nothing."""
+    path = Path(directory) / message_name(stem, seq)
+    tmp = path.with_name("." + path.name + ".tmp")
+    tmp.write_text(json.dumps(dict(payload, seq=seq), ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+    return path
+
+
+def read_messages(directory, stem, after=0):
+    """Messages of a turn with seq > after, in order, up to the first one not yet written."""
+    messages = []
+    seq = after
+    while True:
+        seq += 1
+        try:
+            data = (Path(directory) / message_name(stem, seq)).read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return messages
+        message = json.loads(data)
+        messages.append(message)
+        if not message.get("more"):
+            return messages
+
+
+class MessageStream:
+    """Append-only, sequence-numbered replies for one turn."""
+
+    def __init__(self, directory, stem):
+        self.directory = Path(directory)
+        self.stem = stem
+        self.seq = 0
+
+    def append(self, payload):
+        # Only count a message once it is on disk, so a failed write leaves no gap.
+        path = write_message(self.directory, self.stem, self.seq + 1, payload)
+        self.seq += 1
+        return path
@@ -1,11 +1,33 @@
 import os
 import time
 import json
+import random
+import asyncio
 import traceback
+import contextlib
+import functools
+import contextvars
 from pathlib import Path
-import speech_recognition as sr
-from google import genai
-from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+from google.genai import types
+from collections import OrderedDict
+import nao_gemini
+import nao_memory
+from nao_journal import SessionJournal
+from nao_watcher import DirectoryWatcher
+from nao_upload import MARKER_SUFFIX, marker_path, read_marker, upload_path, wait_for_upload_async
+from nao_sessions import SessionManager, session_id_for
+from nao_streaming import SpeechStreamParser
+from nao_vision_cache import VisionAnswerCache, preprocess_image
+from nao_cache import ResponseCache, cache_key, fill_name, template_name
+from nao_profile import guess_profile
+from nao_audio import UPLOAD_SUFFIXES, to_wav, trim_silence
+import nao_stt
+from nao_http import NaoHttpEndpoint
+from nao_live_audio import LiveAudio
+from nao_messages import MessageStream
+from nao_text import GESTURE_WORDS, VISION_KEYWORDS, WordMatcher, scrub_speech
+from nao_trace import Metrics, Tracer, start_metrics_server
 
 INCOMING_DIR = Path(r"C:\Users\sanaz\Documents\Nao_Project\incoming")
 OUTGOING_DIR = Path(r"C:\Users\sanaz\Documents\Nao_Project\outgoing")
@@ -14,11 +36,197 @@ IMAGES_DIR = Path(r"C:\Users\sanaz\Documents\Nao_Project\images")
 MODEL_NAME = "models/gemini-2.5-flash"
 
 api_key = os.getenv("GEMINI_API_KEY")
-
-
-recognizer = sr.Recognizer()
-
-VISION_KEYWORDS = ["see", "look", "watch", "color", "colour", "wearing", "hand", "holding", "what is this", "show", "picture", "photo", "capture"]
+# Optional proxy or local stand-in in front of the Gemini API.
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")
+
+# Created once in serve() and shared by every session.
+client = None
+
+# "google" (network), "vosk[:model dir]", "whisper[:model size or dir]" or
+# "stub[:text]"; local models are loaded once in serve() and stay resident.
+STT_ENGINE = os.getenv("NAO_STT_ENGINE", "google")
+stt_engine = None
+
+def make_watcher():
+    w = DirectoryWatcher()
+    for suffix in UPLOAD_SUFFIXES:
+        w.add(INCOMING_DIR, "input_*" + suffix, "audio")
+        w.add(INCOMING_DIR, "input_*" + suffix + MARKER_SUFFIX, "audio_marker")
+    w.add(IMAGES_DIR, "image_*.jpg", "image")
+    w.add(IMAGES_DIR, "image_*.jpg" + MARKER_SUFFIX, "image_marker")
+    w.add(OUTGOING_DIR, "*.json", "outgoing")
+    return w
+
+watcher = make_watcher()
+
+# NAOs on the HTTP transport upload and long-poll replies over one
+# keep-alive connection instead of forking scp per hop. 0 disables it.
+# Unlike scp it has no SSH keys behind it: to listen on the robots' network
+# (e.g. NAO_HTTP_HOST=192.168.0.178) it needs NAO_HTTP_TOKEN, the shared
+# secret set as HOST_HTTP_TOKEN on each robot.
+NAO_HTTP_HOST = os.getenv("NAO_HTTP_HOST", "127.0.0.1")
+NAO_HTTP_PORT = int(os.getenv("NAO_HTTP_PORT", "8765"))
+NAO_HTTP_TOKEN = os.getenv("NAO_HTTP_TOKEN", "")
+
+RECENT_UPLOADS_LIMIT = 1024
+IMAGE_TIMEOUT_SEC = 15
+
+vision_cache = VisionAnswerCache()
+
+# Bump a version whenever its prompt changes so stale cached replies are never served.
+PROFILE_PROMPT_VERSION = 1
+TUTOR_PROMPT_VERSION = 4
+# Stages where replies should vary are never served from the cache.
+UNCACHED_STAGES = {"application", "review"}
+RESPONSE_CACHE_TTL_SEC = 6 * 3600
+# Set to a file path to keep cached replies across restarts.
+RESPONSE_CACHE_DB = os.getenv("NAO_RESPONSE_CACHE_DB")
+response_cache = ResponseCache(ttl_sec=RESPONSE_CACHE_TTL_SEC, sqlite_path=RESPONSE_CACHE_DB)
+
+# Profile fields the local extractor is at least this sure of skip the model call.
+LOCAL_PROFILE_MIN_CONFIDENCE = 0.8
+
+PROBLEM_SPEECH = "Sorry, I had a problem. Please say that again."
+NOT_UNDERSTOOD_SPEECH = "Sorry, I did not understand. Please say it again."
+NOT_HEARD_SPEECH = "Sorry, I did not hear you. Please say it again."
+VISION_ERROR_SPEECH = "Sorry, I cannot see that right now. Let's continue our lesson."
+VISION_TIMEOUT_SPEECH = "Sorry, I could not see that. Let's continue."
+FALLBACK_REASONS = {
+    PROBLEM_SPEECH: "problem",
+    NOT_UNDERSTOOD_SPEECH: "not_understood",
+    NOT_HEARD_SPEECH: "not_heard",
+    VISION_ERROR_SPEECH: "vision_error",
+    VISION_TIMEOUT_SPEECH: "vision_timeout",
+}
+
+# Send tutor replies sentence by sentence so NAO can start speaking early.
+STREAM_REPLIES = True
+
+# If a turn has no reply this long after its upload arrived, NAO gets a
+# filler ("Hmm, let me think.") first, and the reply follows as the next
+# message. 0 turns it off.
+FILLER_AFTER_MS = int(os.getenv("NAO_FILLER_AFTER_MS", "2000"))
+FILLER_SPEECH = ["Hmm, let me think.", "Hmm, good question. Let me think.", "Let me think about that."]
+
+# The introduction only depends on the learner's name and topic, so it is
+# generated as soon as the profile is complete, while NAO confirms it, and
+# served on the first lesson turn. 0 turns it off.
+INTRO_PREFETCH = os.getenv("NAO_INTRO_PREFETCH", "1") != "0"
+
+# The tutor prompt carries the lesson so far in at most MEMORY_BUDGET_TOKENS:
+# the newest turns word for word, and a summary of at most
+# MEMORY_SUMMARY_TOKENS of the older ones, rewritten in the background every
+# few turns (nao_memory). 0 sends the current answer alone.
+MEMORY_BUDGET_TOKENS = int(os.getenv("NAO_MEMORY_BUDGET_TOKENS", "600"))
+MEMORY_SUMMARY_TOKENS = 150
+
+# NAO gives up on a reply after RESPONSE_TIMEOUT (20 s); Gemini calls for a
+# message must be done (retries and hedges included) well before that.
+REPLY_BUDGET_SEC = 15
+
+# Said instead of the tutor reply when Gemini is down or too slow, so the
+# lesson keeps going instead of apologising.
+DEGRADED_SPEECH = {
+    "introduction": "Let's start with {topic}. Tell me one thing you already know about {topic}.",
+    "practice": "Good try! Can you say that again in a full sentence?",
+    "check_questions": "Do you have any questions about {topic} so far?",
+    "application": "Imagine you are talking to a friend about {topic}. What would you say?",
+    "review": "You worked hard today, {name}! What was easy and what was difficult for you?",
+}
+
+# STT, image decoding and file writes block; they share this pool instead of
+# getting a thread per turn.
+BLOCKING_WORKERS = 8
+blocking_pool = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="nao-io")
+
+# Prometheus metrics on a local port (0 disables), one JSONL trace line per
+# turn in NAO_TRACE_FILE, and with NAO_PROFILE_SLOW_MS a folded-stack profile
+# of every turn slower than that in NAO_PROFILE_DIR.
+METRICS_HOST = os.getenv("NAO_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("NAO_METRICS_PORT", "9464"))
+TRACE_FILE = os.getenv("NAO_TRACE_FILE")
+PROFILE_SLOW_MS = os.getenv("NAO_PROFILE_SLOW_MS")
+PROFILE_DIR = os.getenv("NAO_PROFILE_DIR", "profiles")
+
+# Every finished turn journals its session's state and the upload it
+# answered in NAO_JOURNAL_DIR ("" disables), so a restart resumes every
+# lesson where it was and answers no upload twice. Uploads older than
+# RESUME_UPLOAD_SEC when the server starts are not picked up: NAO has
+# stopped waiting for them (RESPONSE_TIMEOUT, 20 s).
+JOURNAL_DIR = os.getenv("NAO_JOURNAL_DIR", "journal")
+SNAPSHOT_EVERY = 500
+RESUME_UPLOAD_SEC = 20
+journal = None
+journal_writer = None
+
+metrics = Metrics()
+tracer = Tracer(
+    metrics,
+    trace_path=TRACE_FILE,
+    slow_turn_sec=float(PROFILE_SLOW_MS) / 1000 if PROFILE_SLOW_MS else None,
+    profile_dir=PROFILE_DIR,
+    executor=blocking_pool
+)
+fallbacks_total = metrics.counter("nao_fallback_replies_total", "Apologies sent instead of an answer", ["reason"])
+json_failures_total = metrics.counter("nao_json_parse_failures_total", "Gemini replies that were not valid JSON", ["call"])
+vision_timeouts_total = metrics.counter("nao_vision_timeouts_total", "Vision turns where no camera frame arrived")
+stt_failures_total = metrics.counter("nao_stt_failures_total", "Recordings that could not be transcribed", ["reason"])
+fillers_total = metrics.counter("nao_filler_messages_total", "Filler messages sent because the reply was late")
+degraded_total = metrics.counter("nao_degraded_replies_total", "Local replies sent because Gemini was unavailable", ["call"])
+prefetch_total = metrics.counter(
+    "nao_intro_prefetch_total", "Prefetched introductions: ready, waited for, stale or failed", ["result"]
+)
+summaries_total = metrics.counter("nao_memory_summaries_total", "Conversation summaries rewritten or failed", ["result"])
+prompt_tokens = metrics.histogram(
+    "nao_prompt_tokens", "Estimated tokens in each Gemini prompt", ["call"],
+    buckets=(250, 500, 750, 1000, 1500, 2000, 3000, 5000, 10000)
+)
+gemini_events_total = metrics.counter(
+    "nao_gemini_events_total", "Gemini timeouts, errors, retries, hedges and circuit breaker trips", ["call", "event"]
+)
+nao_gemini.listen(lambda call, event: tracer.count(gemini_events_total, call=call, event=event))
+gemini_queue_seconds = metrics.histogram(
+    "nao_gemini_queue_wait_seconds", "Time Gemini requests waited for quota or a connection", ["priority"]
+)
+nao_gemini.listen_queue(lambda priority, waited: gemini_queue_seconds.observe(waited, priority=priority))
+response_cache_total = metrics.counter(
+    "nao_response_cache_lookups_total", "Profile and tutor reply cache lookups: memory hit, disk hit or miss", ["result"]
+)
+response_cache.listen(lambda result: tracer.count(response_cache_total, result=result))
+metrics.gauge(
+    "nao_response_cache_entries", "Replies in the in-memory response cache",
+    collect=lambda: {(): response_cache.stats()["entries"]}
+)
+metrics.gauge(
+    "nao_response_cache_hit_ratio", "Share of response cache lookups that were hits",
+    collect=lambda: {(): response_cache.stats()["hit_rate"]}
+)
+vision_cache_total = metrics.counter("nao_vision_cache_lookups_total", "Vision answer cache lookups", ["result"])
+vision_bytes_total = metrics.counter(
+    "nao_vision_image_bytes_total", "Camera frame bytes received, sent to Gemini and saved by resizing or the cache", ["kind"]
+)
+vision_reply_seconds = metrics.histogram("nao_vision_reply_seconds", "Vision answer time, cache hit or miss", ["cache"])
+metrics.gauge(
+    "nao_vision_cache_entries", "Vision answers in the cache",
+    collect=lambda: {(): vision_cache.stats()["entries"]}
+)
+metrics.gauge(
+    "nao_vision_cache_hit_ratio", "Share of vision cache lookups that were hits",
+    collect=lambda: {(): vision_cache.stats()["hit_rate"]}
+)
+metrics.gauge(
+    "nao_gemini_queue_depth", "Gemini requests waiting for quota or a connection", ["priority"],
+    collect=lambda: {(priority,): depth for priority, depth in nao_gemini.scheduler.depths().items()}
+)
+metrics.gauge(
+    "nao_gemini_requests_in_flight", "Gemini requests sent and not yet answered",
+    collect=lambda: {(): nao_gemini.scheduler.in_flight}
+)
+
+# Vision answers describe colours the learner asked about, so only gesture
+# names are scrubbed from them.
+vision_scrubber = WordMatcher(GESTURE_WORDS)
+vision_intent = WordMatcher(VISION_KEYWORDS)
 
 def default_state():
     return {
@@ -27,66 +235,74 @@ def default_state():
         "topic": None,
         "turn": 0,
         "lesson_stage": "introduction",
-        "questions_asked": []
+        "questions_asked": [],
+        "memory": nao_memory.new_memory()
     }
 
 def needs_vision(text):
-    text_lower = text.lower()
-    for keyword in VISION_KEYWORDS:
-        if keyword in text_lower:
-            return True
-    return False
-
-def wait_for_stable_file(path, stable_checks=3, interval_sec=0.2, timeout_sec=8.0):
-    start = time.time()
-    last_size = -1
-    stable_count = 0
-
-    while True:
-        if time.time() - start > timeout_sec:
-            raise TimeoutError(f"File not stable within {timeout_sec}s: {path}")
-
-        try:
-            if not path.exists():
-                stable_count = 0
-                time.sleep(interval_sec)
-                continue
-
-            size = path.stat().st_size
-            if size > 0 and size == last_size:
-                stable_count += 1
-            else:
-                stable_count = 0
-
-            last_size = size
-
-            with open(path, "rb"):
-                pass
-
-            if stable_count >= stable_checks:
-                return
-
-        except PermissionError:
-            stable_count = 0
+    return vision_intent.search(text)
 
-        time.sleep(interval_sec)
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(blocking_pool, functools.partial(func, *args, **kwargs))
 
-def stt_from_wav(wav_path):
-    wait_for_stable_file(wav_path)
+def read_wav(wav_path):
     last_err = None
     for _ in range(6):
         try:
-            with sr.AudioFile(str(wav_path)) as source:
-                audio = recognizer.record(source)
-            return recognizer.recognize_google(audio, language="en-US")
+            return Path(wav_path).read_bytes()
         except PermissionError as e:
             last_err = e
             time.sleep(0.2)
-        except Exception:
-            raise
     raise last_err or PermissionError("Permission denied while reading audio file.")
 
-def gemini_extract_profile(user_text):
+def load_clip(wav_path):
+    data = read_wav(wav_path)
+    if wav_path.suffix != ".wav":
+        # Compressed uploads are decoded in memory; nothing is written to disk.
+        start = time.monotonic()
+        wav = to_wav(data)
+        print(
+            f"[INFO] Decoded {wav_path.suffix[1:]} upload: {len(data)} -> {len(wav)} bytes "
+            f"in {(time.monotonic() - start) * 1000:.1f} ms"
+        )
+        data = wav
+    return trim_silence(data)
+
+async def stt_from_wav(wav_path):
+    """Transcript of the recording, or None if it holds no speech."""
+    clip = await run_blocking(load_clip, wav_path)
+    return await transcribe_clip(clip, wav_path.name)
+
+async def stt_from_live(live):
+    """stt_from_wav for a streamed answer; an incremental recognizer only has the end left to decode."""
+    clip = await run_blocking(lambda: trim_silence(live.wav()))
+    return await transcribe_clip(clip, live.path.name, live.recognizer)
+
+async def transcribe_clip(clip, name, recognizer=None):
+    if clip is None:
+        print(f"[INFO] VAD: no speech in {name}, skipping STT")
+        return None
+    print(
+        f"[INFO] VAD: {clip.seconds_in:.2f} s -> {clip.seconds_out:.2f} s, "
+        f"{clip.bytes_in} -> {clip.bytes_out} bytes "
+        f"(saved {clip.seconds_in - clip.seconds_out:.2f} s, {clip.bytes_in - clip.bytes_out} bytes)"
+    )
+    start = time.monotonic()
+    if recognizer is not None:
+        text = await run_blocking(recognizer.result)
+    else:
+        text = await run_blocking(stt_engine.transcribe, clip.wav)
+    print(f"[INFO] STT ({stt_engine.name}{', streamed' if recognizer else ''}) took {(time.monotonic() - start) * 1000:.0f} ms")
+    return text
+
+async def gemini_extract_profile(user_text):
+    key = cache_key("profile", PROFILE_PROMPT_VERSION, None, None, user_text)
+    cached = await response_cache.get_async(key, run_blocking)
+    if cached is not None:
+        print("[INFO] Profile cache hit")
+        return cached
+
     prompt = f"""
 Return ONLY valid JSON with exactly these keys:
 - "name": string or null
@@ -98,29 +314,69 @@ Student text:
 {user_text}
 """.strip()
 
-    resp = client.models.generate_content(model=MODEL_NAME, contents=prompt)
+    resp = await nao_gemini.generate(client, MODEL_NAME, prompt, call="profile")
     raw = (resp.text or "").strip()
 
     try:
         data = json.loads(raw)
     except Exception:
+        tracer.count(json_failures_total, call="profile")
         data = {"name": None, "topic": None}
 
     name = data.get("name")
     topic = data.get("topic")
 
-    return {
+    profile = {
         "name": name.strip() if isinstance(name, str) else None,
         "topic": topic.strip() if isinstance(topic, str) else None
     }
-
-def gemini_vision_reply(state, user_text, image_path):
+    if profile["name"] or profile["topic"]:
+        await response_cache.put_async(key, profile, run_blocking)
+    return profile
+
+async def extract_profile(state, user_text):
+    guess = guess_profile(user_text)
+    missing = [field for field in ("name", "topic") if not state[field]]
+    if all(guess[field] and guess[field + "_confidence"] >= LOCAL_PROFILE_MIN_CONFIDENCE for field in missing):
+        print(f"[INFO] Profile from local extractor: {guess}")
+        return {"name": guess["name"], "topic": guess["topic"]}
+
+    print(f"[INFO] Local profile guess not confident enough: {guess}")
+    try:
+        prof = await gemini_extract_profile(user_text)
+    except Exception as e:
+        # Take whatever the local extractor found; the learner is asked again for the rest.
+        print(f"[WARN] Gemini profile call failed, using the local guess: {e}")
+        tracer.count(degraded_total, call="profile")
+        return {"name": guess["name"], "topic": guess["topic"]}
+    for field in ("name", "topic"):
+        if not prof[field] and guess[field + "_confidence"] >= LOCAL_PROFILE_MIN_CONFIDENCE:
+            prof[field] = guess[field]
+    return prof
+
+async def gemini_vision_reply(state, user_text, image_path):
     name = state.get("name") or "my friend"
     topic = state.get("topic") or "today's topic"
+    started = time.monotonic()
     
     try:
-        img = Image.open(image_path)
-        print(f"[INFO] Image loaded successfully: {img.size}, mode: {img.mode}")
+        frame = await run_blocking(preprocess_image, image_path)
+        print(f"[INFO] Image loaded successfully: {frame.size}, {frame.original_bytes} -> {len(frame.jpeg)} bytes")
+
+        # The same learner keeps asking about the same scene; near-identical
+        # frames reuse the earlier answer.
+        cached = vision_cache.lookup(frame.phash, user_text, name)
+        vision_cache.record_frame(frame, sent=cached is None)
+        sent_bytes = len(frame.jpeg) if cached is None else 0
+        tracer.count(vision_cache_total, result="miss" if cached is None else "hit")
+        vision_bytes_total.inc(frame.original_bytes, kind="received")
+        vision_bytes_total.inc(sent_bytes, kind="sent")
+        vision_bytes_total.inc(frame.original_bytes - sent_bytes, kind="saved")
+        if cached is not None:
+            vision_cache.record_latency(True, time.monotonic() - started)
+            vision_reply_seconds.observe(time.monotonic() - started, cache="hit")
+            print(f"[INFO] Vision cache hit: {vision_cache.stats()}")
+            return cached
         
         prompt = f"""
 You are NAO robot, an English teacher.
@@ -148,10 +404,8 @@ Return ONLY this JSON:
 """.strip()
 
         print("[INFO] Sending to Gemini Vision...")
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=[prompt, img]
-        )
+        image_part = types.Part.from_bytes(data=frame.jpeg, mime_type="image/jpeg")
+        response = await nao_gemini.generate(client, MODEL_NAME, [prompt, image_part], call="vision")
         
         raw = (response.text or "").strip()
         print(f"[INFO] Gemini raw response: {raw}")
@@ -171,31 +425,32 @@ Return ONLY this JSON:
         if not isinstance(gestures, list):
             gestures = ["nod"]
         
-        # Remove forbidden words
-        forbidden_words = ["wave", "nod", "shake_head", "look_up", "look_left", "look_right", 
-                          "hand_open", "hand_close", "red", "green", "blue", "yellow", "white"]
-        
-        for word in forbidden_words:
-            speech = speech.replace(" " + word + " ", " ")
-            speech = speech.replace(" " + word, "")
-            speech = speech.replace(word + " ", "")
-        
-        speech = " ".join(speech.split())
+        speech = scrub_speech(speech, vision_scrubber)
         
         print(f"[INFO] Final speech: {speech}")
-        
-        return {"speech": speech, "gestures": gestures, "led_color": led_color}
+
+        reply = {"speech": speech, "gestures": gestures, "led_color": led_color}
+        vision_cache.store(frame.phash, user_text, name, reply)
+        vision_cache.record_latency(False, time.monotonic() - started)
+        vision_reply_seconds.observe(time.monotonic() - started, cache="miss")
+        print(f"[INFO] Vision cache: {vision_cache.stats()}")
+        return reply
         
     except Exception as e:
         print(f"[ERROR] Vision processing failed: {e}")
-        traceback.print_exc()
+        if isinstance(e, nao_gemini.GeminiUnavailable):
+            tracer.count(degraded_total, call="vision")
+        else:
+            traceback.print_exc()
+        if isinstance(e, json.JSONDecodeError):
+            tracer.count(json_failures_total, call="vision")
         return {
-            "speech": "Sorry, I cannot see that right now. Let's continue our lesson.",
+            "speech": VISION_ERROR_SPEECH,
             "gestures": ["shake_head"],
             "led_color": "red"
         }
 
-def gemini_tutor_reply(state, user_text):
+def tutor_prompt(state, user_text):
     name = state.get("name") or "my friend"
     topic = state.get("topic") or "today's topic"
     turn = state.get("turn", 0)
@@ -221,6 +476,13 @@ THEN: Briefly review what was learned. Give specific positive feedback. Ask what
 
     current_instruction = stage_instructions.get(lesson_stage, stage_instructions["introduction"]).replace("{topic}", topic)
 
+    conversation = ""
+    if MEMORY_BUDGET_TOKENS and state.get("memory"):
+        memory = nao_memory.render(state["memory"], MEMORY_BUDGET_TOKENS)
+        if memory:
+            # What "the student's previous answer" refers to.
+            conversation = f"CONVERSATION SO FAR (oldest first):\n{memory}\n\n"
+
     prompt = f"""
 You are NAO robot, a professional English tutor.
 
@@ -264,15 +526,15 @@ LED COLOR SELECTION (for robot eyes, NOT to say out loud):
 - "yellow" for questions/waiting
 - "red" for corrections
 
-Student said: {user_text}
+{conversation}Student said: {user_text}
 
-Return ONLY this JSON format (speech must be ONE line and must NOT contain gesture or color words):
-{{"speech": "your response without any gesture or color names", "gestures": ["gesture1", "gesture2"], "led_color": "color"}}
+Return ONLY this JSON format, keys in this order (speech must be ONE line and must NOT contain gesture or color words):
+{{"gestures": ["gesture1", "gesture2"], "led_color": "color", "speech": "your response without any gesture or color names"}}
 """.strip()
 
-    resp = client.models.generate_content(model=MODEL_NAME, contents=prompt)
-    raw = (resp.text or "").strip()
+    return prompt
 
+def parse_tutor_reply(raw):
     if raw.startswith("```"):
         raw = raw.strip()
         raw = raw.replace("```json", "").replace("```", "").strip()
@@ -290,17 +552,10 @@ Return ONLY this JSON format (speech must be ONE line and must NOT contain gestu
         if not isinstance(led_color, str):
             led_color = "blue"
         
-        forbidden_words = ["wave", "nod", "shake_head", "look_up", "look_left", "look_right", 
-                          "hand_open", "hand_close", "red", "green", "blue", "yellow", "white"]
-        
-        for word in forbidden_words:
-            speech = speech.replace(" " + word + " ", " ")
-            speech = speech.replace(" " + word, "")
-            speech = speech.replace(word + " ", "")
-        
-        speech = " ".join(speech.split())
+        speech = scrub_speech(speech)
             
     except json.JSONDecodeError as e:
+        tracer.count(json_failures_total, call="tutor")
         print(f"[ERROR] Gemini JSON parse failed: {e}")
         print(f"[ERROR] Raw response: {raw}")
         
@@ -317,38 +572,282 @@ Return ONLY this JSON format (speech must be ONE line and must NOT contain gestu
             if not isinstance(led_color, str):
                 led_color = "blue"
             
-            forbidden_words = ["wave", "nod", "shake_head", "look_up", "look_left", "look_right", 
-                              "hand_open", "hand_close", "red", "green", "blue", "yellow", "white"]
-            
-            for word in forbidden_words:
-                speech = speech.replace(" " + word + " ", " ")
-                speech = speech.replace(" " + word, "")
-                speech = speech.replace(word + " ", "")
-            
-            speech = " ".join(speech.split())
+            speech = scrub_speech(speech)
                 
             print("[INFO] Fixed by removing newlines")
         except Exception:
-            speech = "Sorry, I had a problem. Please say that again."
+            speech = PROBLEM_SPEECH
             gestures = ["shake_head"]
             led_color = "red"
     except Exception as e:
         print(f"[ERROR] Unexpected error: {e}")
-        speech = "Sorry, I had a problem. Please say that again."
+        speech = PROBLEM_SPEECH
         gestures = ["shake_head"]
         led_color = "red"
 
     if not speech:
-        speech = "Sorry, I did not understand. Please say it again."
+        speech = NOT_UNDERSTOOD_SPEECH
         gestures = ["shake_head"]
         led_color = "yellow"
 
     return {"speech": speech, "gestures": gestures, "led_color": led_color}
 
-def write_outgoing(basename, payload):
-    OUTGOING_DIR.mkdir(parents=True, exist_ok=True)
-    out_path = OUTGOING_DIR / (Path(basename).stem + ".json")
-    out_path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+def tutor_cache_key(state, user_text):
+    stage = state.get("lesson_stage", "introduction")
+    if stage in UNCACHED_STAGES:
+        return None
+    # The reply checks the answer against the question it answers, so both are the key.
+    turns = (state.get("memory") or {}).get("turns") if MEMORY_BUDGET_TOKENS else None
+    question = template_name(turns[-1][1], state.get("name")) if turns else ""
+    return cache_key("tutor", TUTOR_PROMPT_VERSION, stage, state.get("topic"), f"{question} | {user_text}")
+
+async def cached_tutor_reply(state, user_text):
+    reply = await response_cache.get_async(tutor_cache_key(state, user_text), run_blocking)
+    if reply is None:
+        return None
+    print("[INFO] Tutor reply cache hit")
+    reply["speech"] = fill_name(reply["speech"], state.get("name"))
+    return reply
+
+async def remember_tutor_reply(state, user_text, reply):
+    if reply["speech"] in (PROBLEM_SPEECH, NOT_UNDERSTOOD_SPEECH):
+        return
+    stored = dict(reply, speech=template_name(reply["speech"], state.get("name")))
+    await response_cache.put_async(tutor_cache_key(state, user_text), stored, run_blocking)
+
+def degraded_tutor_reply(state):
+    tracer.count(degraded_total, call="tutor")
+    speech = DEGRADED_SPEECH.get(state.get("lesson_stage"), DEGRADED_SPEECH["practice"])
+    speech = speech.format(name=state.get("name") or "my friend", topic=state.get("topic") or "today's topic")
+    return {"speech": speech, "gestures": ["nod"], "led_color": "blue"}
+
+async def gemini_tutor_reply(state, user_text):
+    cached = await cached_tutor_reply(state, user_text)
+    if cached is not None:
+        return cached
+
+    prompt = tutor_prompt(state, user_text)
+    prompt_tokens.observe(nao_memory.count_tokens(prompt), call="tutor")
+    try:
+        resp = await nao_gemini.generate(client, MODEL_NAME, prompt, call="tutor")
+    except Exception as e:
+        print(f"[ERROR] Gemini tutor call failed: {e}")
+        return degraded_tutor_reply(state)
+    reply = parse_tutor_reply((resp.text or "").strip())
+    await remember_tutor_reply(state, user_text, reply)
+    return reply
+
+def profile_key(state):
+    return state.get("name"), state.get("topic")
+
+def prefetch_intro(session, user_text):
+    """Start the introduction reply in the background for the current profile."""
+    cancel_prefetch(session)
+    state = dict(session.state, lesson_stage="introduction")
+
+    async def generate():
+        # Nobody is waiting for it yet, so it yields the quota to live turns.
+        with nao_gemini.deadline(REPLY_BUDGET_SEC), nao_gemini.scheduling(session.id, "background"):
+            return await gemini_tutor_reply(state, user_text)
+
+    # A context of its own: the reply belongs to no turn's trace or deadline.
+    # (A task copies the context it is created in; create_task(context=) needs 3.11.)
+    task = contextvars.Context().run(asyncio.get_running_loop().create_task, generate())
+    session.prefetch["intro"] = (profile_key(state), task)
+
+def cancel_prefetch(session):
+    _, task = session.prefetch.pop("intro", (None, None))
+    if task is not None:
+        task.cancel()
+
+async def take_prefetched_intro(session):
+    """The prefetched introduction, or None if there is none or the profile changed since."""
+    key, task = session.prefetch.pop("intro", (None, None))
+    if task is None:
+        return None
+    if key != profile_key(session.state):
+        task.cancel()
+        tracer.count(prefetch_total, result="stale")
+        return None
+    result = "ready" if task.done() else "waited"
+    try:
+        with tracer.span("tutor", prefetched=True):
+            reply = await task
+    except Exception as e:
+        print(f"[WARN] Prefetched introduction failed: {e!r}")
+        tracer.count(prefetch_total, result="failed")
+        return None
+    tracer.count(prefetch_total, result=result)
+    print(f"[INFO] Serving prefetched introduction ({result})")
+    return reply
+
+async def stream_tutor_reply(state, user_text, replies):
+    """Append the tutor reply to the turn's messages one sentence at a time.
+
+    Every message but the last carries "more": true, so NAO keeps asking
+    for the ones after it while it speaks. Returns what NAO says, or None if
+    the reply broke off.
+    """
+    cached = await cached_tutor_reply(state, user_text)
+    if cached is not None:
+        await write_outgoing(replies, cached)
+        return cached["speech"]
+
+    prompt = tutor_prompt(state, user_text)
+    prompt_tokens.observe(nao_memory.count_tokens(prompt), call="tutor")
+    parser = SpeechStreamParser()
+    raw_parts = []
+    spoken = []
+    gestures = []
+    index = 0
+    failed = False
+
+    try:
+        async with contextlib.aclosing(nao_gemini.generate_stream(client, MODEL_NAME, prompt, call="tutor")) as stream:
+            async for chunk in stream:
+                delta = chunk.text or ""
+                raw_parts.append(delta)
+                for sentence, last in parser.feed(delta):
+                    speech = scrub_speech(sentence)
+                    if not speech and not last:
+                        continue
+                    index += 1
+                    led_color = parser.led_color() or "blue"
+                    if index == 1:
+                        gestures = (parser.gestures() or [])[:2]
+                        if not speech:
+                            # The reply says nothing at all; as in parse_tutor_reply(), NAO asks again.
+                            speech, gestures, led_color = NOT_UNDERSTOOD_SPEECH, ["shake_head"], "yellow"
+                    spoken.append(speech)
+                    payload = {
+                        "speech": speech,
+                        "gestures": gestures if index == 1 else [],
+                        "led_color": led_color,
+                        "more": not last
+                    }
+                    await write_outgoing(replies, payload)
+                if parser.done:
+                    break
+    except Exception as e:
+        print(f"[ERROR] Gemini streaming failed: {e}")
+        failed = True
+
+    if parser.done and index:
+        reply = {"speech": " ".join(s for s in spoken if s), "gestures": gestures, "led_color": parser.led_color() or "blue"}
+        await remember_tutor_reply(state, user_text, reply)
+        return reply["speech"]
+
+    if index == 0 and failed:
+        payload = degraded_tutor_reply(state)
+        await write_outgoing(replies, payload)
+        return payload["speech"]
+
+    if index == 0:
+        # Nothing usable was streamed; fall back to parsing the whole reply.
+        payload = parse_tutor_reply("".join(raw_parts).strip())
+        await write_outgoing(replies, payload)
+        await remember_tutor_reply(state, user_text, payload)
+        return payload["speech"]
+
+    payload = {
+        "speech": PROBLEM_SPEECH,
+        "gestures": ["shake_head"],
+        "led_color": "red",
+        "more": False
+    }
+    await write_outgoing(replies, payload)
+    return None
+
+def remember_turn(session, user_text, speech):
+    """Add the answered turn to the lesson memory; start a summary when one is due."""
+    if not MEMORY_BUDGET_TOKENS or not speech or speech in FALLBACK_REASONS:
+        return
+    memory = session.state.setdefault("memory", nao_memory.new_memory())
+    nao_memory.remember(memory, user_text, speech)
+    count = nao_memory.turns_to_fold(memory, MEMORY_BUDGET_TOKENS - MEMORY_SUMMARY_TOKENS)
+    if count and session.summarizing is None:
+        # Like the introduction prefetch: no turn waits for it, so it gets a context of its own.
+        session.summarizing = contextvars.Context().run(
+            asyncio.get_running_loop().create_task, summarize(session, count)
+        )
+
+async def summarize(session, count):
+    """Fold the oldest count turns of the lesson memory into its summary."""
+    memory = session.state["memory"]
+    prompt = nao_memory.summary_prompt(memory, count, MEMORY_SUMMARY_TOKENS)
+    prompt_tokens.observe(nao_memory.count_tokens(prompt), call="summary")
+    try:
+        with nao_gemini.deadline(REPLY_BUDGET_SEC), nao_gemini.scheduling(session.id, "background"):
+            resp = await nao_gemini.generate(client, MODEL_NAME, prompt, call="summary")
+        summary = (resp.text or "").strip()
+        if not summary:
+            raise ValueError("empty summary")
+    except Exception as e:
+        # The turns stay verbatim (the oldest drop out of the prompt) until the next try.
+        print(f"[WARN] Conversation summary failed: {e!r}")
+        tracer.count(summaries_total, result="failed")
+        return
+    finally:
+        session.summarizing = None
+    nao_memory.fold(memory, count, summary, MEMORY_SUMMARY_TOKENS)
+    tracer.count(summaries_total, result="ok")
+    print(f"[INFO] Summarized {count} turns for {session.id}")
+    await save_session(session)
+
+class TurnReplies(MessageStream):
+    """A turn's reply messages, preceded by a filler if the first one is late.
+
+    Messages are written one at a time under a lock, and the filler only if
+    nothing has been written yet, so it can never follow a real reply.
+    """
+
+    def __init__(self, directory, stem, filler_after_sec=0):
+        super().__init__(directory, stem)
+        self.lock = asyncio.Lock()
+        self.filler_sent = False
+        self._filler = asyncio.create_task(self._send_filler(filler_after_sec)) if filler_after_sec else None
+
+    async def _send_filler(self, delay_sec):
+        await asyncio.sleep(delay_sec)
+        async with self.lock:
+            if self.seq or self._filler is None:
+                return
+            # Past this point a reply waits for the filler instead of cancelling it mid-write.
+            self._filler = None
+            payload = {
+                "speech": random.choice(FILLER_SPEECH),
+                "gestures": ["think"],
+                "led_color": "yellow",
+                "filler": True,
+                "more": True
+            }
+            with tracer.span("filler"):
+                out_path = await run_blocking(self.append, payload)
+            self.filler_sent = True
+            tracer.count(fillers_total)
+        print(f"[INFO] Reply late, wrote filler: {out_path}")
+
+    def cancel_filler(self):
+        if self._filler is not None:
+            self._filler.cancel()
+            self._filler = None
+
+    async def finish(self):
+        """Close the turn; a filler must not be NAO's last word."""
+        self.cancel_filler()
+        async with self.lock:
+            dangling = self.filler_sent and self.seq == 1
+        if dangling:
+            await write_outgoing(self, {"speech": NOT_UNDERSTOOD_SPEECH, "gestures": ["shake_head"], "led_color": "yellow"})
+
+async def write_outgoing(replies, payload):
+    reason = FALLBACK_REASONS.get(payload.get("speech"))
+    if reason:
+        tracer.count(fallbacks_total, reason=reason)
+    replies.cancel_filler()
+    async with replies.lock:
+        with tracer.span("write"):
+            out_path = await run_blocking(replies.append, payload)
     print(f"[INFO] Wrote: {out_path}")
 
 def update_lesson_stage(state):
@@ -367,21 +866,30 @@ def update_lesson_stage(state):
         state["lesson_stage"] = "review"
     return state
 
-def process_one_audio(wav_path, state):
+async def process_one_audio(wav_path, session, replies, live=None):
+    state = session.state
     try:
-        text = stt_from_wav(wav_path)
+        with tracer.span("stt"):
+            text = await (stt_from_live(live) if live is not None else stt_from_wav(wav_path))
         print(f"[INFO] STT: {text}")
-    except sr.UnknownValueError:
-        print("[ERROR] STT failed: UnknownValueError()")
-        return state
     except Exception as e:
         print(f"[ERROR] STT failed: {repr(e)}")
+        tracer.count(stt_failures_total, reason="error")
+        return state
+
+    if text is None:
+        await write_outgoing(replies, {"speech": NOT_HEARD_SPEECH, "gestures": ["shake_head"], "led_color": "yellow"})
+        return state
+    if not text:
+        print("[ERROR] STT failed: nothing recognized")
+        tracer.count(stt_failures_total, reason="no_match")
         return state
 
     state["turn"] += 1
 
     if state["phase"] == "collect_profile":
-        prof = gemini_extract_profile(text)
+        with tracer.span("profile"):
+            prof = await extract_profile(state, text)
         if prof["name"] and not state["name"]:
             state["name"] = prof["name"]
         if prof["topic"] and not state["topic"]:
@@ -394,74 +902,146 @@ def process_one_audio(wav_path, state):
             if not state["topic"]:
                 missing.append("a topic")
             payload = {"speech": f"Sorry, I did not catch {' and '.join(missing)}. Please say it again.", "gestures": ["shake_head"], "led_color": "yellow"}
-            write_outgoing(wav_path.name, payload)
+            await write_outgoing(replies, payload)
             return state
 
         state["phase"] = "tutor"
         state["lesson_stage"] = "introduction"
+        if INTRO_PREFETCH:
+            prefetch_intro(session, text)
         payload = {
             "speech": f"Perfect {state['name']}! Let's learn about {state['topic']} today.",
             "gestures": ["wave", "nod"],
             "led_color": "green"
         }
-        write_outgoing(wav_path.name, payload)
+        await write_outgoing(replies, payload)
         return state
 
     if needs_vision(text):
         print("[INFO] Vision request detected!")
-        
-        # Signal NAO to take photo
+        image_stem = Path(wav_path.name).stem.replace("input_", "image_")
+        image_path = IMAGES_DIR / f"{image_stem}.jpg"
+
+        upload = read_marker(marker_path(wav_path)) or {}
+        if upload.get("image"):
+            # NAO captured a frame while recording: answer in a single message.
+            print(f"[INFO] Using frame sent with the recording: {image_path}")
+            with tracer.span("image_wait"):
+                arrived = await watcher.wait_for_file_async(image_path, IMAGE_TIMEOUT_SEC)
+            return await finish_vision_turn(replies, session, text, image_path, arrived)
+
+        # Signal NAO to take photo; the answer follows as the next message
         payload = {
             "speech": "Let me look at that.",
             "gestures": ["look_up"],
             "led_color": "yellow",
-            "need_camera": True
+            "need_camera": True,
+            "more": True
         }
-        write_outgoing(wav_path.name, payload)
-        
-        # Wait for image
-        image_stem = Path(wav_path.name).stem.replace("input_", "image_")
-        image_path = IMAGES_DIR / f"{image_stem}.jpg"
-        
+        await write_outgoing(replies, payload)
+
         print(f"[INFO] Waiting for image: {image_path}")
-        timeout = 15
-        start = time.time()
-        image_received = False
-        
-        while time.time() - start < timeout:
-            if image_path.exists():
-                try:
-                    wait_for_stable_file(image_path, timeout_sec=5)
-                    print(f"[INFO] Image received: {image_path}")
-                    image_received = True
-                    break
-                except Exception as e:
-                    print(f"[WARN] Image not ready: {e}")
-            time.sleep(0.5)
-        
-        if image_received:
-            # Process with vision - this OVERWRITES the previous JSON
-            print("[INFO] Processing image with Gemini Vision...")
-            payload = gemini_vision_reply(state, text, image_path)
-            write_outgoing(wav_path.name, payload)
-            print("[INFO] Vision response written")
-        else:
-            # Timeout - no image - OVERWRITE with error message
-            payload = {
-                "speech": "Sorry, I could not see that. Let's continue.",
-                "gestures": ["shake_head"],
-                "led_color": "red"
-            }
-            write_outgoing(wav_path.name, payload)
-        
+        # NAO waits afresh for the answer once it has the "Let me look" message.
+        with nao_gemini.deadline(REPLY_BUDGET_SEC):
+            # Awaiting the watcher parks only this session; no thread is held.
+            with tracer.span("image_wait"):
+                arrived = await watcher.wait_for_file_async(image_path, IMAGE_TIMEOUT_SEC)
+            return await finish_vision_turn(replies, session, text, image_path, arrived)
+
+    if state["lesson_stage"] == "introduction":
+        # The first lesson turn teaches the topic; the later stages follow the turn count.
+        state["lesson_stage"] = "practice"
+        reply_state = dict(state, lesson_stage="introduction")
+        payload = await take_prefetched_intro(session)
+        if payload is not None:
+            await write_outgoing(replies, payload)
+            remember_turn(session, text, payload["speech"])
+            return state
+    else:
+        state = update_lesson_stage(state)
+        reply_state = state
+
+    if STREAM_REPLIES:
+        with tracer.span("tutor", streamed=True):
+            speech = await stream_tutor_reply(reply_state, text, replies)
+        remember_turn(session, text, speech)
         return state
 
-    state = update_lesson_stage(state)
-    payload = gemini_tutor_reply(state, text)
-    write_outgoing(wav_path.name, payload)
+    with tracer.span("tutor"):
+        payload = await gemini_tutor_reply(reply_state, text)
+    await write_outgoing(replies, payload)
+    remember_turn(session, text, payload["speech"])
     return state
 
-def main():
+async def finish_vision_turn(replies, session, text, image_path, arrived):
+    state = session.state
+    image_received = False
+    if arrived:
+        try:
+            with tracer.span("image_wait"):
+                how = await wait_for_upload_async(image_path, watcher, timeout_sec=5)
+            print(f"[INFO] Image received ({how}): {image_path}")
+            image_received = True
+        except Exception as e:
+            print(f"[WARN] Image not ready: {e}")
+
+    if image_received:
+        print("[INFO] Processing image with Gemini Vision...")
+        with tracer.span("vision"):
+            payload = await gemini_vision_reply(state, text, image_path)
+        await write_outgoing(replies, payload)
+        remember_turn(session, text, payload["speech"])
+        print("[INFO] Vision response written")
+    else:
+        # Timeout - no image
+        tracer.count(vision_timeouts_total)
+        payload = {
+            "speech": VISION_TIMEOUT_SPEECH,
+            "gestures": ["shake_head"],
+            "led_color": "red"
+        }
+        await write_outgoing(replies, payload)
+
+    return state
+
+async def handle_turn(session, upload):
+    live = upload if isinstance(upload, LiveAudio) else None
+    wav_path = live.path if live is not None else upload
+    async with tracer.turn(session.id, wav_path.stem):
+        try:
+            if live is not None:
+                # The learner is still talking; the turn starts when NAO ends the stream.
+                with tracer.span("stream"):
+                    await live.wait_closed()
+                how = f"streamed, {live.seconds:.1f} s"
+            else:
+                with tracer.span("upload_wait"):
+                    how = await wait_for_upload_async(wav_path, watcher)
+        except Exception as e:
+            print(f"[WARN] File not ready: {wav_path} ({e})")
+            return
+
+        print(f"[INFO] Audio received ({how}) for {session.id}: {wav_path}")
+        replies = TurnReplies(OUTGOING_DIR, wav_path.stem, FILLER_AFTER_MS / 1000)
+        try:
+            with nao_gemini.deadline(REPLY_BUDGET_SEC), nao_gemini.scheduling(session.id):
+                await process_one_audio(wav_path, session, replies, live)
+        finally:
+            await replies.finish()
+            await save_session(session, wav_path.name)
+
+async def save_session(session, upload=None):
+    """Journal the session's state, and the upload it has just answered."""
+    if journal is None:
+        return
+    line = journal.record(session.id, session.state, upload)
+    # A turn and its summary both save the session; one writer thread appends
+    # their lines in the order they were recorded, so replay ends on the newest.
+    await asyncio.get_running_loop().run_in_executor(journal_writer, journal.write, line)
+
+async def serve():
+    global client, stt_engine, journal, journal_writer
+
     INCOMING_DIR.mkdir(parents=True, exist_ok=True)
     OUTGOING_DIR.mkdir(parents=True, exist_ok=True)
     IMAGES_DIR.mkdir(parents=True, exist_ok=True)
@@ -470,35 +1050,101 @@ def main():
     print(f"[INFO] Writing outgoing: {OUTGOING_DIR}")
     print(f"[INFO] Images directory: {IMAGES_DIR}")
 
-    state = default_state()
-    seen = set()
-
-    while True:
+    if client is None:
+        client = nao_gemini.create_client(api_key, GEMINI_BASE_URL)
+    await nao_gemini.warm_up(client, MODEL_NAME)
+    if stt_engine is None:
+        start = time.monotonic()
+        stt_engine = await run_blocking(nao_stt.create_engine, STT_ENGINE)
+        print(f"[INFO] STT engine {stt_engine.name} ready in {(time.monotonic() - start) * 1000:.0f} ms")
+
+    saved_states, answered = {}, []
+    if JOURNAL_DIR:
+        start = time.monotonic()
+        journal = SessionJournal(Path(JOURNAL_DIR), SNAPSHOT_EVERY, RECENT_UPLOADS_LIMIT)
+        journal_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="nao-journal")
+        saved_states, answered = await run_blocking(journal.load)
+        print(f"[INFO] Restored {len(saved_states)} sessions and {len(answered)} answered uploads "
+              f"from {JOURNAL_DIR} in {(time.monotonic() - start) * 1000:.1f} ms")
+
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    watcher.listen(lambda event: loop.call_soon_threadsafe(events.put_nowait, event))
+    # Without a journal every upload found at startup is answered, as before.
+    watcher.start(since=time.time() - RESUME_UPLOAD_SEC if journal is not None else None)
+
+    metrics_server = None
+    if METRICS_PORT:
+        metrics_server = await start_metrics_server(metrics, METRICS_HOST, METRICS_PORT)
+
+    sessions = SessionManager(handle_turn, default_state)
+    sessions.restore(saved_states)
+    # Both the WAV and its completion marker raise events; handle each upload once.
+    handled = OrderedDict.fromkeys(answered, True)
+
+    def first_time(name):
+        if name in handled:
+            return False
+        handled[name] = True
+        if len(handled) > RECENT_UPLOADS_LIMIT:
+            handled.popitem(last=False)
+        return True
+
+    def start_live_turn(path, rate, extra):
+        # The .wav stored when the stream ends must not start a second turn.
+        first_time(path.name)
+        recognizer = stt_engine.stream(rate) if hasattr(stt_engine, "stream") else None
+        live = LiveAudio(path, rate, extra, recognizer, run_blocking)
+        sessions.submit(session_id_for(path), live)
+        return live
+
+    http_endpoint = None
+    if NAO_HTTP_PORT:
+        http_endpoint = NaoHttpEndpoint(watcher, INCOMING_DIR, IMAGES_DIR, OUTGOING_DIR, blocking_pool, start_live_turn,
+                                        token=NAO_HTTP_TOKEN or None)
         try:
-            wavs = sorted(INCOMING_DIR.glob("input_*.wav"), key=lambda p: p.stat().st_mtime)
-            for wav_path in wavs:
-                if wav_path.name in seen:
-                    continue
+            await http_endpoint.start(NAO_HTTP_HOST, NAO_HTTP_PORT)
+        except ValueError as e:
+            # NAO falls back to scp when the endpoint does not answer.
+            print(f"[ERROR] NAO HTTP endpoint not started: {e}; set NAO_HTTP_TOKEN")
+            http_endpoint = None
 
-                try:
-                    wait_for_stable_file(wav_path)
-                except Exception as e:
-                    print(f"[WARN] File not ready yet: {wav_path} ({e})")
+    try:
+        while True:
+            event = await events.get()
+            try:
+                if event.kind == "audio":
+                    wav_path = event.path
+                elif event.kind == "audio_marker":
+                    wav_path = upload_path(event.path)
+                else:
                     continue
 
-                seen.add(wav_path.name)
-                print(f"[INFO] Audio received: {wav_path}")
-                state = process_one_audio(wav_path, state)
+                if not first_time(wav_path.name):
+                    continue
 
-            time.sleep(0.2)
+                sessions.submit(session_id_for(wav_path), wav_path)
+
+            except Exception:
+                print("[ERROR] Loop error:")
+                print(traceback.format_exc())
+    finally:
+        if http_endpoint is not None:
+            await http_endpoint.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        watcher.stop()
+        await sessions.shutdown()
+        if journal is not None:
+            journal_writer.shutdown(wait=True)
+            journal.close()
+        blocking_pool.shutdown(wait=False, cancel_futures=True)
 
-        except KeyboardInterrupt:
-            print("[INFO] Stopped by user.")
-            break
-        except Exception:
-            print("[ERROR] Loop error:")
-            print(traceback.format_exc())
-            time.sleep(1.0)
+def main():
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("[INFO] Stopped by user.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,131 @@
+import re
+
+# Canonical topic -> the ways learners say it.
+TOPICS = {
+    "colors": ["colors", "colours", "color", "colour"],
+    "animals": ["animals", "animal", "pets", "pet"],
+    "numbers": ["numbers", "number", "counting"],
+    "food": ["food", "foods", "meals", "eating"],
+    "fruits": ["fruits", "fruit"],
+    "vegetables": ["vegetables", "vegetable"],
+    "family": ["family", "my family", "family members"],
+    "weather": ["weather"],
+    "days of the week": ["days of the week", "days", "weekdays"],
+    "months": ["months", "months of the year"],
+    "body parts": ["body parts", "the body", "body", "parts of the body"],
+    "clothes": ["clothes", "clothing"],
+    "sports": ["sports", "sport", "football", "soccer"],
+    "school": ["school", "classroom"],
+    "jobs": ["jobs", "job", "professions", "work"],
+    "greetings": ["greetings", "greeting", "saying hello"],
+    "shapes": ["shapes", "shape"],
+    "toys": ["toys", "toy"],
+    "transport": ["transport", "transportation", "vehicles", "cars"],
+    "the house": ["the house", "house", "home", "rooms"],
+    "hobbies": ["hobbies", "hobby", "free time"],
+    "time": ["time", "telling the time", "the time", "clock"],
+    "feelings": ["feelings", "emotions", "feeling"],
+    "past tense": ["past tense", "the past tense", "past simple"],
+    "present tense": ["present tense", "the present tense", "present simple"],
+    "verbs": ["verbs", "verb"],
+    "adjectives": ["adjectives", "adjective"]
+}
+
+# Words that follow "I'm" / "I am" without being a name.
+NOT_NAMES = {
+    "a", "an", "the", "not", "so", "very", "really", "just", "also", "here", "from", "in", "at",
+    "happy", "fine", "good", "ok", "okay", "great", "well", "ready", "sorry", "hungry", "tired",
+    "bored", "excited", "sad", "glad", "interested", "learning", "going", "trying", "doing",
+    "looking", "studying", "want", "wanna", "gonna", "like", "would", "student", "boy", "girl",
+    "back", "years", "year", "new", "called", "your", "and", "to", "ten", "nine", "eight", "seven",
+    "six", "five", "four", "three", "two", "one", "eleven", "twelve", "hello", "hi",
+    "sleepy", "nervous", "scared", "shy", "busy", "sick", "late", "sure", "afraid", "angry", "cold",
+    "hot", "curious", "confused", "alright", "done", "lost", "lucky", "proud", "cool",
+    "english", "spanish", "italian", "french", "german", "portuguese", "dutch", "greek", "polish",
+    "russian", "ukrainian", "turkish", "iranian", "persian", "arab", "arabic", "egyptian", "indian",
+    "pakistani", "chinese", "japanese", "korean", "vietnamese", "thai", "american", "canadian",
+    "mexican", "brazilian", "argentinian", "british", "irish", "scottish", "swedish", "norwegian",
+    "danish", "finnish", "swiss", "austrian", "belgian", "african", "nigerian", "moroccan", "syrian",
+    "afghan", "kurdish", "european", "asian"
+}
+
+_TOPIC_LOOKUP = {alias: topic for topic, aliases in TOPICS.items() for alias in aliases}
+_TOPIC_RE = re.compile(
+    r"\b(%s)\b" % "|".join(re.escape(alias) for alias in sorted(_TOPIC_LOOKUP, key=len, reverse=True))
+)
+
+_WORD = r"([a-z][a-z'-]*)"
+# "I'm X" is as often a nationality or a mood as a name, so the weak
+# patterns stay below the confidence at which the server skips Gemini
+# (LOCAL_PROFILE_MIN_CONFIDENCE, 0.8), however the word is capitalized.
+WEAK_PATTERN_MAX = 0.75
+_NAME_PATTERNS = [
+    (re.compile(r"\bmy name(?: is|'s) " + _WORD), 0.95),
+    (re.compile(r"\b(?:call me|i am called|i'm called|they call me) " + _WORD), 0.9),
+    (re.compile(r"\bname is " + _WORD), 0.85),
+    (re.compile(r"\b(?:i'm|i am|im) " + _WORD), 0.75),
+    (re.compile(r"(?:^|\| )(?:hi |hello )?" + _WORD + r" here\b"), 0.7),
+    (re.compile(r"\b(?:this is|it's) " + _WORD), 0.6),
+]
+_LEARN_RE = re.compile(
+    r"\b(?:learn|learning|study|studying|practice|practise|practicing|talk about|topic is|lesson about|interested in|teach me)"
+    r"(?: about)?(?: the| some| my)? ([a-z][a-z' ]*)"
+)
+_PHRASE_STOP = re.compile(r"\b(?:and|please|today|now|with|because|but|so|my name|i'm|i am)\b")
+# "I'm learning English" says nothing about the topic.
+_NOT_TOPICS = {"english", "english words", "more", "something", "a lot", "it"}
+
+
+def canonical_topic(topic):
+    """Gazetteer name for a topic phrase, or the phrase itself lower-cased."""
+    if not topic:
+        return None
+    topic = " ".join(topic.lower().split())
+    known = _TOPIC_RE.search(topic)
+    return _TOPIC_LOOKUP[known.group(1)] if known else topic
+
+
+def _normalize(text):
+    text = text.lower().replace("’", "'")
+    # Sentence punctuation becomes "|" so a name or topic never runs into the next clause.
+    text = re.sub(r"[.,!?;:]+", " | ", text)
+    return " ".join(re.sub(r"[^a-z'| ]+", " ", text).split())
+
+
+def _guess_name(lowered, capitalized):
+    for pattern, conf in _NAME_PATTERNS:
+        for match in pattern.finditer(lowered):
+            word = match.group(1).strip("'-")
+            if word in NOT_NAMES or word in _TOPIC_LOOKUP or len(word) < 2:
+                continue
+            if conf < 0.85:
+                # STT capitalizes the names it recognises, which backs up a weak pattern.
+                conf = min(conf + 0.1, WEAK_PATTERN_MAX) if word.capitalize() in capitalized else conf - 0.1
+            return word.capitalize(), round(conf, 2)
+    return None, 0.0
+
+
+def _guess_topic(lowered):
+    for learn in _LEARN_RE.finditer(lowered):
+        phrase = _PHRASE_STOP.split(learn.group(1))[0].strip()
+        if not phrase or phrase in _NOT_TOPICS:
+            continue
+        known = _TOPIC_RE.search(phrase)
+        if known is not None:
+            return _TOPIC_LOOKUP[known.group(1)], 0.95
+        words = phrase.split()
+        # A short phrase right after "learn about" is a topic even if we don't know it.
+        return " ".join(words[:3]), 0.8 if len(words) <= 2 else 0.6
+    known = _TOPIC_RE.search(lowered)
+    if known is not None:
+        return _TOPIC_LOOKUP[known.group(1)], 0.8
+    return None, 0.0
+
+
+def guess_profile(text):
+    """Name and topic from an intro utterance, each with a 0-1 confidence."""
+    lowered = _normalize(text)
+    capitalized = {word.strip(".,!?;:") for word in text.split()[1:] if word[:1].isupper()}
+    name, name_conf = _guess_name(lowered, capitalized)
+    topic, topic_conf = _guess_topic(lowered)
+    return {"name": name, "topic": topic, "name_confidence": name_conf, "topic_confidence": topic_conf}
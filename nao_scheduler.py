@@ -0,0 +1,179 @@
+"""Quota-aware scheduling of the Gemini requests of every robot.
+
+All sessions share one API key, and with it a requests-per-minute and a
+tokens-per-minute limit. A request waits here until both token buckets
+allow it and one of max_in_flight slots is free. Waiting requests go out by
+priority class, and within a class round-robin across sessions, so a busy
+robot gets its turn like the others instead of filling the queue.
+"""
+import time
+import asyncio
+import contextlib
+from collections import OrderedDict, deque
+
+# Highest first: a learner waiting on a tutor reply, a vision answer, then
+# speculative work nobody is waiting for yet.
+PRIORITIES = ("interactive", "vision", "background")
+
+
+class TokenBucket:
+    """rate units per second, holding at most capacity.
+
+    Taking more than is left is allowed and leaves a debt that later
+    requests wait out; it is how a reply longer than estimated is charged.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount):
+        """Seconds until amount (at most a full bucket) can be taken."""
+        self._refill()
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount):
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+    def drain(self):
+        self._refill()
+        self.level = min(self.level, 0.0)
+
+
+class Grant:
+    """A request let through; set used to the real token count once known."""
+
+    def __init__(self, priority, tokens, waited):
+        self.priority = priority
+        self.tokens = tokens
+        self.waited = waited
+        self.used = None
+
+
+class _Waiter:
+    def __init__(self, priority, session, tokens, future):
+        self.priority = priority
+        self.session = session
+        self.tokens = tokens
+        self.future = future
+        self.queued_at = time.monotonic()
+
+
+class RequestScheduler:
+    """Token buckets for requests and tokens (0: no limit) in front of max_in_flight slots.
+
+    The buckets hold burst_sec worth of quota, so an idle minute does not
+    turn into a burst the API would reject.
+    """
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0, max_in_flight=32, burst_sec=5.0):
+        self.requests = TokenBucket(requests_per_minute / 60.0, max(1.0, requests_per_minute * burst_sec / 60.0)) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute * burst_sec / 60.0) if tokens_per_minute else None
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        # priority -> session -> waiting requests; the session order is the round-robin order.
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._paused_until = 0.0
+        self._timer = None
+
+    def depths(self):
+        return {priority: sum(len(waiters) for waiters in queue.values()) for priority, queue in self._queues.items()}
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority, session, tokens):
+        grant = await self.acquire(priority, session, tokens)
+        try:
+            yield grant
+        finally:
+            self.release(grant)
+
+    async def acquire(self, priority, session, tokens):
+        waiter = _Waiter(priority, session, tokens, asyncio.get_running_loop().create_future())
+        self._queues[priority].setdefault(session, deque()).append(waiter)
+        self._dispatch()
+        try:
+            return await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Let through just as the caller gave up.
+                self.release(waiter.future.result())
+            else:
+                self._remove(waiter)
+            raise
+
+    def release(self, grant):
+        self.in_flight -= 1
+        if grant.used is not None and self.tokens is not None:
+            # Settle the estimate against what the request really cost.
+            self.tokens.take(grant.used - grant.tokens)
+        self._dispatch()
+
+    def throttle(self, seconds):
+        """The API said 429: send nothing for a while, then start from an empty bucket."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        if self.requests is not None:
+            self.requests.drain()
+        self._dispatch()
+
+    def _remove(self, waiter):
+        queue = self._queues[waiter.priority]
+        waiters = queue.get(waiter.session)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del queue[waiter.session]
+        self._dispatch()
+
+    def _head(self):
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            while queue:
+                session, waiters = next(iter(queue.items()))
+                if not waiters[0].future.done():
+                    return waiters[0]
+                # Cancelled while queued; acquire() has not cleaned up yet.
+                waiters.popleft()
+                if not waiters:
+                    del queue[session]
+        return None
+
+    def _delay(self, waiter):
+        delay = self._paused_until - time.monotonic()
+        if self.requests is not None:
+            delay = max(delay, self.requests.wait_time(1))
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.wait_time(waiter.tokens))
+        return delay
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self.in_flight < self.max_in_flight:
+            waiter = self._head()
+            if waiter is None:
+                return
+            delay = self._delay(waiter)
+            if delay > 0:
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            queue = self._queues[waiter.priority]
+            waiters = queue.pop(waiter.session)
+            waiters.popleft()
+            if waiters:
+                # Back of the line: the next session in this class goes first.
+                queue[waiter.session] = waiters
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None:
+                self.tokens.take(waiter.tokens)
+            self.in_flight += 1
+            waiter.future.set_result(Grant(waiter.priority, waiter.tokens, time.monotonic() - waiter.queued_at))
@@ -0,0 +1,83 @@
+import re
+import asyncio
+import traceback
+from collections import deque
+
+DEFAULT_SESSION = "default"
+
+_STEM_RE = re.compile(r"^(?:input|image)_(?:(?P<robot>[A-Za-z0-9-]+)_)?(?P<ts>\d+)$")
+
+
+def session_id_for(path):
+    """Robot id embedded in input_<robot>_<ts>.wav; older robots send input_<ts>.wav."""
+    match = _STEM_RE.match(path.stem)
+    if match is None or not match.group("robot"):
+        return DEFAULT_SESSION
+    return match.group("robot")
+
+
+class Session:
+    def __init__(self, session_id, state):
+        self.id = session_id
+        self.state = state
+        self.pending = deque()
+        self.task = None
+        # Replies started ahead of the turn that needs them, by kind.
+        self.prefetch = {}
+        # The lesson memory's summary being rewritten, if any.
+        self.summarizing = None
+
+
+class SessionManager:
+    """Runs turns for many robots concurrently, in order per robot.
+
+    Each session drains its own queue in one task, so a turn parked on a
+    camera image or a slow Gemini call holds no thread and never delays
+    another robot. Blocking work is bounded by the pools the handler uses.
+    """
+
+    def __init__(self, handler, new_state):
+        self._handler = handler
+        self._new_state = new_state
+        self._sessions = {}
+
+    def session(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = Session(session_id, self._new_state())
+            self._sessions[session_id] = session
+            print(f"[INFO] New session: {session_id}")
+        return session
+
+    def restore(self, states):
+        """Sessions saved before a restart; states missing newer keys get their defaults."""
+        for session_id, saved in states.items():
+            state = self._new_state()
+            state.update(saved)
+            self._sessions[session_id] = Session(session_id, state)
+
+    def submit(self, session_id, item):
+        session = self.session(session_id)
+        session.pending.append(item)
+        if session.task is None:
+            session.task = asyncio.create_task(self._drain(session))
+
+    async def shutdown(self):
+        tasks = [session.task for session in self._sessions.values() if session.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _drain(self, session):
+        try:
+            while session.pending:
+                item = session.pending.popleft()
+                try:
+                    await self._handler(session, item)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    print(f"[ERROR] Turn failed for session {session.id}:")
+                    print(traceback.format_exc())
+        finally:
+            session.task = None
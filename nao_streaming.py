@@ -0,0 +1,120 @@
+import re
+import json
+
+_SPEECH_KEY = re.compile(r'"speech"\s*:\s*"')
+_GESTURES = re.compile(r'"gestures"\s*:\s*(\[[^\]]*\])')
+_LED_COLOR = re.compile(r'"led_color"\s*:\s*"([^"\\]*)"')
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "", "f": "", "n": " ", "r": " ", "t": " "}
+_SENTENCE_END = ".!?"
+
+
+def _unescape(escape):
+    """The character of one \\uXXXX escape; "" if it is malformed."""
+    try:
+        return chr(int(escape[2:6], 16))
+    except ValueError:
+        return ""
+
+
+class SpeechStreamParser:
+    """Pulls sentences out of the "speech" field of a JSON reply as it streams in.
+
+    feed() returns (sentence, last) pairs. A sentence is released as soon as
+    the next one starts, or with last=True when the speech string closes.
+    """
+
+    def __init__(self):
+        self._raw = ""
+        self._pos = None
+        self._current = []
+        self._ready = None
+        self.done = False
+
+    def feed(self, delta):
+        self._raw += delta
+        out = []
+        if self.done:
+            return out
+
+        if self._pos is None:
+            match = _SPEECH_KEY.search(self._raw)
+            if match is None:
+                return out
+            self._pos = match.end()
+
+        raw = self._raw
+        pos = self._pos
+        while pos < len(raw):
+            ch = raw[pos]
+            if ch == "\\":
+                if pos + 1 >= len(raw):
+                    break
+                code = raw[pos + 1]
+                if code == "u":
+                    if pos + 6 > len(raw):
+                        break
+                    ch = _unescape(raw[pos:pos + 6])
+                    pos += 6
+                    if "\ud800" <= ch <= "\udbff":
+                        # An emoji arrives as two escapes; wait for the low half and join them.
+                        if pos + 6 > len(raw):
+                            pos -= 6
+                            break
+                        low = _unescape(raw[pos:pos + 6]) if raw.startswith("\\u", pos) else ""
+                        if "\udc00" <= low <= "\udfff":
+                            ch = chr(0x10000 + ((ord(ch) - 0xD800) << 10) + (ord(low) - 0xDC00))
+                            pos += 6
+                        else:
+                            ch = ""
+                    elif "\udc00" <= ch <= "\udfff":
+                        ch = ""
+                else:
+                    ch = _ESCAPES.get(code, code)
+                    pos += 2
+            elif ch == '"':
+                pos += 1
+                self.done = True
+                break
+            else:
+                pos += 1
+            if ch:
+                self._take(ch, out)
+        self._pos = pos
+
+        if self.done:
+            tail = "".join(self._current).strip()
+            self._current = []
+            if self._ready is not None:
+                out.append((self._ready, not tail))
+                self._ready = None
+            if tail:
+                out.append((tail, True))
+            if not out:
+                out.append(("", True))
+        return out
+
+    def _take(self, ch, out):
+        if self._ready is not None and not ch.isspace():
+            # Something follows the finished sentence, so it is not the last one.
+            out.append((self._ready, False))
+            self._ready = None
+        if ch.isspace() and self._current and self._current[-1] in _SENTENCE_END:
+            self._ready = "".join(self._current).strip()
+            self._current = []
+            return
+        self._current.append(ch)
+
+    def gestures(self):
+        match = _GESTURES.search(self._raw)
+        if match is None:
+            return None
+        try:
+            gestures = json.loads(match.group(1))
+        except ValueError:
+            return None
+        return [g for g in gestures if isinstance(g, str)] if isinstance(gestures, list) else None
+
+    def led_color(self):
+        match = _LED_COLOR.search(self._raw)
+        return match.group(1) if match else None
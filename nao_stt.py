@@ -0,0 +1,151 @@
+import io
+import json
+import time
+import hashlib
+import threading
+
+import numpy as np
+
+from nao_audio import mono_pcm
+
+LANGUAGE = "en-US"
+# Local engines are CPU bound; more parallel transcriptions than this only
+# make each one slower.
+LOCAL_WORKERS = 2
+WHISPER_RATE = 16000
+
+
+class GoogleEngine:
+    """The free Google Web Speech API through speech_recognition (network round trip per turn)."""
+
+    name = "google"
+
+    def __init__(self, language=LANGUAGE):
+        import speech_recognition as sr
+
+        self._sr = sr
+        self.language = language
+        self.recognizer = sr.Recognizer()
+
+    def transcribe(self, wav_bytes):
+        sr = self._sr
+        with sr.AudioFile(io.BytesIO(wav_bytes)) as source:
+            audio = self.recognizer.record(source)
+        try:
+            return self.recognizer.recognize_google(audio, language=self.language)
+        except sr.UnknownValueError:
+            return ""
+
+
+class VoskEngine:
+    """Offline Kaldi recognizer; the model is loaded once and shared by every turn."""
+
+    name = "vosk"
+
+    def __init__(self, model=None, workers=LOCAL_WORKERS):
+        import vosk
+
+        vosk.SetLogLevel(-1)
+        self._vosk = vosk
+        # A model directory, or None for the small English model vosk downloads itself.
+        self.model = vosk.Model(model) if model else vosk.Model(lang="en-us")
+        self._slots = threading.BoundedSemaphore(workers)
+
+    def transcribe(self, wav_bytes):
+        samples, rate = mono_pcm(wav_bytes)
+        with self._slots:
+            recognizer = self._vosk.KaldiRecognizer(self.model, rate)
+            recognizer.AcceptWaveform(samples.tobytes())
+            return json.loads(recognizer.FinalResult()).get("text", "")
+
+    def stream(self, rate):
+        """Incremental recognizer, fed 16-bit mono PCM while the learner is still talking."""
+        return VoskStream(self, rate)
+
+
+class VoskStream:
+    def __init__(self, engine, rate):
+        self._slots = engine._slots
+        self.recognizer = engine._vosk.KaldiRecognizer(engine.model, rate)
+
+    def accept(self, pcm):
+        with self._slots:
+            self.recognizer.AcceptWaveform(pcm)
+
+    def result(self):
+        with self._slots:
+            return json.loads(self.recognizer.FinalResult()).get("text", "")
+
+
+class WhisperEngine:
+    """Offline Whisper through faster-whisper (CTranslate2, int8 on CPU)."""
+
+    name = "whisper"
+
+    def __init__(self, model=None, workers=LOCAL_WORKERS, compute_type="int8"):
+        from faster_whisper import WhisperModel
+
+        self.model = WhisperModel(model or "base.en", device="cpu", compute_type=compute_type, num_workers=workers)
+        self.language = LANGUAGE.split("-")[0]
+        self._slots = threading.BoundedSemaphore(workers)
+
+    def transcribe(self, wav_bytes):
+        samples, rate = mono_pcm(wav_bytes)
+        audio = samples.astype(np.float32) / 32768.0
+        if rate != WHISPER_RATE:
+            positions = np.arange(0, len(audio), rate / float(WHISPER_RATE))
+            audio = np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+        with self._slots:
+            segments, _ = self.model.transcribe(audio, language=self.language, beam_size=1)
+            return " ".join(segment.text.strip() for segment in segments).strip()
+
+
+def audio_key(wav_bytes):
+    return hashlib.sha1(wav_bytes).hexdigest()
+
+
+class StubEngine:
+    """Deterministic transcripts for tests and benchmarks.
+
+    transcripts maps audio_key(wav_bytes) to text; anything else gets default.
+    latency (seconds, or a function returning seconds) stands in for the
+    recognition time.
+    """
+
+    name = "stub"
+
+    def __init__(self, transcripts=None, default="", latency=0.0):
+        self.transcripts = dict(transcripts or {})
+        self.default = default
+        self.latency = latency
+
+    def add(self, wav_bytes, text):
+        self.transcripts[audio_key(wav_bytes)] = text
+
+    def transcribe(self, wav_bytes):
+        latency = self.latency() if callable(self.latency) else self.latency
+        if latency:
+            time.sleep(latency)
+        return self.transcripts.get(audio_key(wav_bytes), self.default)
+
+
+ENGINES = {
+    "google": GoogleEngine,
+    "vosk": VoskEngine,
+    "whisper": WhisperEngine,
+    "stub": StubEngine,
+}
+
+
+def create_engine(spec):
+    """Engine from "name" or "name:model", e.g. "vosk:/opt/vosk-model-small-en-us" or "whisper:tiny.en"."""
+    name, _, model = spec.partition(":")
+    try:
+        engine_class = ENGINES[name.strip().lower()]
+    except KeyError:
+        raise ValueError(f"unknown STT engine {name!r}; choose from {', '.join(ENGINES)}")
+    if engine_class in (VoskEngine, WhisperEngine):
+        return engine_class(model or None)
+    if engine_class is StubEngine:
+        return engine_class(default=model)
+    return engine_class()
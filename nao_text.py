@@ -0,0 +1,81 @@
+import re
+
+GESTURE_WORDS = ["wave", "nod", "shake_head", "look_up", "look_left", "look_right", "hand_open", "hand_close"]
+LED_COLOR_WORDS = ["red", "green", "blue", "yellow", "white"]
+
+VISION_KEYWORDS = [
+    "see", "seeing", "look", "looking", "watch", "watching", "show", "showing",
+    "color", "colour", "colors", "colours", "wearing", "hand", "hands", "holding",
+    "what is this", "what's this", "picture", "pictures", "photo", "photos", "capture"
+]
+
+_PUNCTUATION = ".,!?;:"
+
+
+def _alternative(word):
+    # The boundary check trails the first word instead of leading the group,
+    # so the regex engine can still jump between literal prefixes rather than
+    # trying the whole alternation at every position.
+    head, *tail = word.split()
+    head = re.escape(head)
+    return "%s(?<![\\w']%s)%s" % (head, head, "".join(r"\s+" + re.escape(t) for t in tail))
+
+
+class WordMatcher:
+    """Whole-word, case-insensitive matcher for a word list, compiled once.
+
+    Entries may be phrases. "_" is matched literally: "shake_head" catches
+    the gesture name but not "shake head", which is ordinary English.
+    """
+
+    def __init__(self, words):
+        self.words = list(words)
+        alternatives = sorted({w.lower() for w in self.words if w}, key=len, reverse=True)
+        body = "|".join(_alternative(w) for w in alternatives) or r"(?!)"
+        self._pattern = re.compile(r"(?:%s)(?![\w'])" % body)
+
+    def _lower(self, text):
+        lowered = text.lower()
+        # Spans found in the lower-cased copy only line up if lowering kept the length.
+        return lowered if len(lowered) == len(text) else text
+
+    def search(self, text):
+        return self._pattern.search(self._lower(text)) is not None
+
+    def findall(self, text):
+        return [text[m.start():m.end()] for m in self._pattern.finditer(self._lower(text))]
+
+    def remove(self, text):
+        pieces = []
+        last = 0
+        for m in self._pattern.finditer(self._lower(text)):
+            pieces.append(text[last:m.start()].strip())
+            last = m.end()
+        if not pieces:
+            return text
+        pieces.append(text[last:].lstrip())
+
+        # Only the seams need tidying, so the rest of the text is not rescanned.
+        out = ""
+        for piece in pieces:
+            if not piece:
+                continue
+            if not out:
+                out = piece.lstrip(_PUNCTUATION + " ")
+            elif piece[0] in _PUNCTUATION:
+                if out[-1] in ".!?":
+                    piece = piece.lstrip(_PUNCTUATION + " ")
+                    out += " " + piece if piece else ""
+                else:
+                    out = (out.rstrip(",;:") if piece[0] in ".!?" else out) + piece
+            else:
+                out += " " + piece
+        return out
+
+
+speech_scrubber = WordMatcher(GESTURE_WORDS + LED_COLOR_WORDS)
+
+
+def scrub_speech(speech, matcher=speech_scrubber):
+    # Gesture and LED colour names must never be spoken.
+    return matcher.remove(speech)
@@ -0,0 +1,292 @@
+import sys
+import json
+import time
+import asyncio
+import threading
+import contextlib
+import contextvars
+from pathlib import Path
+from collections import Counter
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0)
+
+_current_turn = contextvars.ContextVar("nao_turn", default=None)
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, values)) + "}"
+
+
+class MetricCounter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def value(self, **labels):
+        return self._values[tuple(str(labels.get(n, "")) for n in self.labels)]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        if not items and not self.labels:
+            items = [((), 0)]
+        for key, value in items:
+            lines.append(f"{self.name}{_label_text(self.labels, key)} {value}")
+        return lines
+
+
+class MetricGauge:
+    """A value read at scrape time: collect() returns {label values: value}."""
+
+    def __init__(self, name, help_text, labels=(), collect=None):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.collect = collect
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        values = self.collect() if self.collect is not None else {}
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_label_text(self.labels, tuple(str(v) for v in key))} {value}")
+        return lines
+
+
+class MetricHistogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket..., +Inf count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            row = self._values.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += 1
+            row[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, list(row)) for key, row in self._values.items())
+        for key, row in items:
+            for bound, count in zip(self.buckets + ("+Inf",), row[:-1]):
+                labels = _label_text(self.labels + ("le",), key + (str(bound),))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {row[-1]:.6f}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {row[-2]}")
+        return lines
+
+
+class Metrics:
+    """Counters and histograms rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text, labels=()):
+        metric = MetricCounter(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help_text, labels=(), collect=None):
+        metric = MetricGauge(name, help_text, labels, collect)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = MetricHistogram(name, help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+async def start_metrics_server(metrics, host, port):
+    """GET /metrics on a small local HTTP server for Prometheus to scrape."""
+    async def serve(reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            path = request_line.decode("latin-1").split(" ")[1] if request_line.count(b" ") >= 2 else ""
+            if path.split("?")[0] == "/metrics":
+                status, body = b"200 OK", metrics.render().encode()
+            else:
+                status, body = b"404 Not Found", b""
+            writer.write(b"HTTP/1.1 " + status + b"\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         b"Content-Length: %d\r\nConnection: close\r\n\r\n" % len(body) + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(serve, host, port)
+    print(f"[INFO] Metrics on http://{host}:{port}/metrics")
+    return server
+
+
+class SamplingProfiler:
+    """Samples every thread's stack while at least one turn is being profiled.
+
+    Turns share the process, so a turn's profile holds everything that ran
+    while it was open, in folded-stack format (flamegraph.pl, speedscope).
+    """
+
+    def __init__(self, interval_sec=0.005):
+        self.interval_sec = interval_sec
+        self._active = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def begin(self, key):
+        with self._lock:
+            self._active[key] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="nao-profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def end(self, key):
+        with self._lock:
+            return self._active.pop(key, Counter())
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            self._wake.clear()
+            if not self._active:
+                self._wake.wait()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    parts.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stacks.append(";".join([names.get(ident, str(ident))] + parts[::-1]))
+            with self._lock:
+                for counts in self._active.values():
+                    counts.update(stacks)
+            time.sleep(self.interval_sec)
+
+
+class TurnTrace:
+    def __init__(self, session, name):
+        self.session = session
+        self.name = name
+        self.wall_start = time.time()
+        self.start = time.monotonic()
+        self.spans = []
+        self.events = []
+
+    def offset_ms(self, moment=None):
+        return round(((moment or time.monotonic()) - self.start) * 1000, 2)
+
+    def record(self, duration):
+        return {
+            "session": self.session,
+            "turn": self.name,
+            "start": round(self.wall_start, 3),
+            "duration_ms": round(duration * 1000, 2),
+            "spans": self.spans,
+            "events": self.events,
+        }
+
+
+class Tracer:
+    """Per-turn spans with monotonic timestamps.
+
+    Every finished turn is observed in the stage/turn histograms and, with
+    trace_path, appended to a JSONL file. With slow_turn_sec, turns are
+    sampled and the slow ones leave a folded-stack profile in profile_dir.
+    """
+
+    def __init__(self, metrics, trace_path=None, slow_turn_sec=None, profile_dir="profiles", executor=None):
+        self.turn_seconds = metrics.histogram("nao_turn_seconds", "Time from upload to the last reply of a turn")
+        self.stage_seconds = metrics.histogram("nao_stage_seconds", "Time spent per turn stage", ["stage"])
+        self.turns_total = metrics.counter("nao_turns_total", "Turns handled")
+        self.trace_path = Path(trace_path) if trace_path else None
+        self.slow_turn_sec = slow_turn_sec
+        self.profile_dir = Path(profile_dir)
+        self.profiler = SamplingProfiler() if slow_turn_sec else None
+        self.executor = executor
+        self._write_lock = threading.Lock()
+
+    @contextlib.asynccontextmanager
+    async def turn(self, session, name):
+        trace = TurnTrace(session, name)
+        token = _current_turn.set(trace)
+        if self.profiler is not None:
+            self.profiler.begin(trace)
+        try:
+            yield trace
+        finally:
+            _current_turn.reset(token)
+            duration = time.monotonic() - trace.start
+            self.turns_total.inc()
+            self.turn_seconds.observe(duration)
+            stacks = self.profiler.end(trace) if self.profiler is not None else None
+            slow = stacks is not None and duration >= self.slow_turn_sec
+            if self.trace_path is not None or slow:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(self.executor, self._finish, trace, duration, stacks if slow else None)
+
+    @contextlib.contextmanager
+    def span(self, stage, **attrs):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            end = time.monotonic()
+            self.stage_seconds.observe(end - start, stage=stage)
+            trace = _current_turn.get()
+            if trace is not None:
+                trace.spans.append(dict(attrs, name=stage, start_ms=trace.offset_ms(start), duration_ms=round((end - start) * 1000, 2)))
+
+    def count(self, counter, **labels):
+        """Increment counter and note it on the current turn's trace."""
+        counter.inc(**labels)
+        trace = _current_turn.get()
+        if trace is not None:
+            trace.events.append(dict(labels, name=counter.name, at_ms=trace.offset_ms()))
+
+    def _finish(self, trace, duration, stacks):
+        record = trace.record(duration)
+        if stacks:
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+            profile = self.profile_dir / f"{trace.name}.folded"
+            profile.write_text("".join(f"{stack} {count}\n" for stack, count in stacks.most_common()), encoding="utf-8")
+            record["profile"] = str(profile)
+            print(f"[INFO] Slow turn {trace.name} ({duration * 1000:.0f} ms), profile: {profile}")
+        if self.trace_path is not None:
+            line = json.dumps(record, ensure_ascii=False) + "\n"
+            with self._write_lock, open(self.trace_path, "a", encoding="utf-8") as f:
+                f.write(line)
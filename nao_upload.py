@@ -0,0 +1,120 @@
+import json
+import time
+import asyncio
+import hashlib
+from pathlib import Path
+
+MARKER_SUFFIX = ".done"
+
+
+def marker_path(path):
+    path = Path(path)
+    return path.with_name(path.name + MARKER_SUFFIX)
+
+
+def upload_path(marker):
+    marker = Path(marker)
+    return marker.with_name(marker.name[:-len(MARKER_SUFFIX)])
+
+
+def read_marker(marker):
+    try:
+        data = json.loads(Path(marker).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get("size"), int):
+        return None
+    return data
+
+
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(65536), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def verify_upload(path, marker, check_sha1=True):
+    info = read_marker(marker)
+    if info is None:
+        return False
+    try:
+        if Path(path).stat().st_size != info["size"]:
+            return False
+        if check_sha1 and info.get("sha1") and file_sha1(path) != info["sha1"]:
+            return False
+    except (FileNotFoundError, PermissionError):
+        return False
+    return True
+
+
+def _upload_checks(path, stable_checks, interval_sec, timeout_sec):
+    # Yields whether a marker is present each time the caller should wait
+    # interval_sec; returns "marker" or "stable" once the file is complete.
+    marker = marker_path(path)
+    start = time.monotonic()
+    last_size = -1
+    stable_count = 0
+
+    while True:
+        has_marker = marker.exists()
+        if has_marker and verify_upload(path, marker):
+            return "marker"
+
+        if time.monotonic() - start > timeout_sec:
+            raise TimeoutError(f"File not complete within {timeout_sec}s: {path}")
+
+        try:
+            size = path.stat().st_size
+            if size > 0 and size == last_size:
+                stable_count += 1
+            else:
+                stable_count = 0
+
+            last_size = size
+
+            with open(path, "rb"):
+                pass
+
+            if stable_count >= stable_checks:
+                return "stable"
+
+        except (FileNotFoundError, PermissionError):
+            stable_count = 0
+
+        yield has_marker
+
+
+def wait_for_upload(path, watcher=None, stable_checks=3, interval_sec=0.2, timeout_sec=8.0):
+    """Wait until an uploaded file is complete and return how that was decided.
+
+    Clients that send a completion marker are released as soon as the marker
+    verifies. Legacy clients fall back to the old size-stability checks.
+    """
+    path = Path(path)
+    checks = _upload_checks(path, stable_checks, interval_sec, timeout_sec)
+    while True:
+        try:
+            has_marker = next(checks)
+        except StopIteration as done:
+            return done.value
+        # Sleeping on the marker lets a new client cut the legacy wait short.
+        if watcher is not None and not has_marker:
+            watcher.wait_for_file(marker_path(path), interval_sec)
+        else:
+            time.sleep(interval_sec)
+
+
+async def wait_for_upload_async(path, watcher=None, stable_checks=3, interval_sec=0.2, timeout_sec=8.0):
+    path = Path(path)
+    checks = _upload_checks(path, stable_checks, interval_sec, timeout_sec)
+    while True:
+        try:
+            has_marker = next(checks)
+        except StopIteration as done:
+            return done.value
+        if watcher is not None and not has_marker:
+            await watcher.wait_for_file_async(marker_path(path), interval_sec)
+        else:
+            await asyncio.sleep(interval_sec)
@@ -0,0 +1,145 @@
+import io
+import re
+import time
+from collections import OrderedDict, namedtuple
+
+from PIL import Image
+
+MAX_SIDE = 512
+JPEG_QUALITY = 80
+
+CACHE_SIZE = 256
+CACHE_TTL_SEC = 120.0
+# Frames whose 64-bit difference hashes differ in at most this many bits
+# count as the same scene.
+MAX_HASH_DISTANCE = 3
+_BANDS = 4
+_BAND_BITS = 64 // _BANDS
+
+Frame = namedtuple("Frame", ["jpeg", "size", "original_bytes", "phash"])
+
+
+def dhash(img):
+    """64-bit difference hash: one bit per horizontal brightness step on a 9x8 thumbnail."""
+    small = img.convert("L").resize((9, 8), Image.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def preprocess_image(image_path, max_side=MAX_SIDE, quality=JPEG_QUALITY):
+    with open(image_path, "rb") as f:
+        original = f.read()
+    img = Image.open(io.BytesIO(original))
+    img = img.convert("RGB")
+    img.thumbnail((max_side, max_side))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=quality, optimize=True)
+    return Frame(out.getvalue(), img.size, len(original), dhash(img))
+
+
+def normalize_question(text):
+    text = text.lower().replace("colour", "color")
+    return " ".join(re.sub(r"[^a-z0-9' ]+", " ", text).split())
+
+
+class VisionAnswerCache:
+    """LRU + TTL cache of vision answers keyed by (frame hash bucket, question).
+
+    Each hash is split into bands; two hashes within MAX_HASH_DISTANCE bits
+    share at least one band exactly, so a lookup only inspects the entries
+    in its own buckets.
+    """
+
+    def __init__(self, max_entries=CACHE_SIZE, ttl_sec=CACHE_TTL_SEC, max_distance=MAX_HASH_DISTANCE):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self.max_distance = max_distance
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self._next_id = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.bytes_in = 0
+        self.bytes_sent = 0
+        self.hit_latency_sec = 0.0
+        self.miss_latency_sec = 0.0
+
+    def lookup(self, phash, question, name):
+        question = normalize_question(question)
+        now = time.monotonic()
+        for entry_id in self._candidates(phash, question, name):
+            entry = self._entries.get(entry_id)
+            if entry is None:
+                continue
+            entry_hash, _, _, answer, expires = entry
+            if expires < now:
+                self._remove(entry_id)
+                continue
+            if bin(entry_hash ^ phash).count("1") <= self.max_distance:
+                self._entries.move_to_end(entry_id)
+                self.hits += 1
+                return dict(answer)
+        self.misses += 1
+        return None
+
+    def store(self, phash, question, name, answer):
+        question = normalize_question(question)
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (phash, question, name, dict(answer), time.monotonic() + self.ttl_sec)
+        for key in self._keys(phash, question, name):
+            self._buckets.setdefault(key, set()).add(entry_id)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def record_frame(self, frame, sent):
+        self.bytes_in += frame.original_bytes
+        if sent:
+            self.bytes_sent += len(frame.jpeg)
+
+    def record_latency(self, hit, seconds):
+        if hit:
+            self.hit_latency_sec += seconds
+        else:
+            self.miss_latency_sec += seconds
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "bytes_in": self.bytes_in,
+            "bytes_sent": self.bytes_sent,
+            "bytes_saved": self.bytes_in - self.bytes_sent,
+            "avg_hit_ms": self.hit_latency_sec * 1000 / self.hits if self.hits else 0.0,
+            "avg_miss_ms": self.miss_latency_sec * 1000 / self.misses if self.misses else 0.0
+        }
+
+    def _keys(self, phash, question, name):
+        mask = (1 << _BAND_BITS) - 1
+        return [(band, (phash >> (band * _BAND_BITS)) & mask, question, name) for band in range(_BANDS)]
+
+    def _candidates(self, phash, question, name):
+        found = set()
+        for key in self._keys(phash, question, name):
+            found.update(self._buckets.get(key, ()))
+        return found
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        phash, question, name, _, _ = entry
+        for key in self._keys(phash, question, name):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
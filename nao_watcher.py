@@ -0,0 +1,314 @@
+import os
+import sys
+import time
+import queue
+import asyncio
+import select
+import struct
+import fnmatch
+import threading
+import ctypes
+import ctypes.util
+from collections import namedtuple, OrderedDict
+from pathlib import Path
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+FileEvent = namedtuple("FileEvent", ["kind", "path"])
+
+
+def _load_inotify():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class DirectoryWatcher:
+    """Delivers file arrivals in watched directories as ordered FileEvents.
+
+    Uses inotify where available (one event per finished file, no directory
+    scans) and falls back to scandir polling elsewhere, e.g. on Windows hosts.
+
+    Names already delivered are remembered so a file is delivered once. A
+    name not seen again for forget_after seconds is forgotten; a later write
+    to it is delivered as a new file.
+    """
+
+    def __init__(self, poll_interval=0.2, forget_after=600.0):
+        self.poll_interval = poll_interval
+        self.forget_after = forget_after
+        self._watches = []
+        self._events = queue.Queue()
+        self._listener = None
+        self._waiters = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._fd = None
+        self._wd_dirs = {}
+        self._known = {}
+        self.backend = None
+
+    def add(self, directory, pattern, kind):
+        self._watches.append((Path(directory), pattern, kind))
+
+    def start(self, initial_scan=True, since=None):
+        """With since (a time.time()), files last changed before it count as seen and are not delivered."""
+        libc = _load_inotify()
+        if libc is not None and self._start_inotify(libc):
+            self.backend = "inotify"
+            target = self._run_inotify
+        else:
+            self.backend = "polling"
+            target = self._run_polling
+
+        # Files that arrived while the server was down are delivered first.
+        if initial_scan:
+            for event in self._scan_existing(since=since):
+                self._dispatch(event)
+        else:
+            self._scan_existing()
+
+        self._thread = threading.Thread(target=target, name="nao-watcher", daemon=True)
+        self._thread.start()
+        print(f"[INFO] Watcher backend: {self.backend}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def listen(self, callback):
+        """Hand every event to callback(event) instead of queueing it for get()."""
+        self._listener = callback
+
+    def get(self, timeout=None):
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def add_waiter(self, path, callback):
+        """Call callback() from the watcher thread when path arrives.
+
+        Returns False and registers nothing if the file is already there.
+        """
+        key = str(path)
+        with self._lock:
+            self._waiters.setdefault(key, []).append(callback)
+        # Registering before the existence check closes the race with the watcher thread.
+        if Path(path).exists():
+            self.remove_waiter(path, callback)
+            return False
+        return True
+
+    def remove_waiter(self, path, callback):
+        key = str(path)
+        with self._lock:
+            waiters = self._waiters.get(key)
+            if waiters is not None and callback in waiters:
+                waiters.remove(callback)
+                if not waiters:
+                    del self._waiters[key]
+
+    def wait_for_file(self, path, timeout):
+        path = Path(path)
+        if not self.running:
+            return _poll_for_file(path, timeout, self.poll_interval)
+
+        arrived = threading.Event()
+        if not self.add_waiter(path, arrived.set):
+            return True
+        try:
+            return arrived.wait(timeout)
+        finally:
+            self.remove_waiter(path, arrived.set)
+
+    async def wait_for_file_async(self, path, timeout):
+        path = Path(path)
+        if not self.running:
+            return await _poll_for_file_async(path, timeout, self.poll_interval)
+
+        loop = asyncio.get_running_loop()
+        arrived = loop.create_future()
+
+        def on_arrival():
+            loop.call_soon_threadsafe(_resolve, arrived)
+
+        if not self.add_waiter(path, on_arrival):
+            return True
+        try:
+            return await asyncio.wait_for(arrived, timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.remove_waiter(path, on_arrival)
+
+    def _match(self, directory, name):
+        for watch_dir, pattern, kind in self._watches:
+            if watch_dir == directory and fnmatch.fnmatchcase(name, pattern):
+                return kind
+        return None
+
+    def _dispatch(self, event):
+        if self._listener is not None:
+            self._listener(event)
+        else:
+            self._events.put(event)
+        with self._lock:
+            waiters = list(self._waiters.get(str(event.path), ()))
+        for callback in waiters:
+            callback()
+
+    def _remember(self, known, name):
+        """Mark name as seen now and forget the names not seen for forget_after seconds."""
+        now = time.monotonic()
+        known[name] = now
+        known.move_to_end(name)
+        while known:
+            oldest = next(iter(known))
+            if now - known[oldest] <= self.forget_after:
+                break
+            del known[oldest]
+
+    def _scan_existing(self, prune=False, since=None):
+        found = []
+        for directory in {watch_dir for watch_dir, _, _ in self._watches}:
+            known = self._known.setdefault(directory, OrderedDict())
+            try:
+                entries = list(os.scandir(directory))
+            except FileNotFoundError:
+                continue
+            if prune:
+                present = {entry.name for entry in entries}
+                for name in [name for name in known if name not in present]:
+                    del known[name]
+            for entry in entries:
+                kind = self._match(directory, entry.name)
+                if kind is None:
+                    continue
+                seen = entry.name in known
+                # Still there, so it stays known while polling.
+                self._remember(known, entry.name)
+                if seen:
+                    continue
+                try:
+                    mtime = entry.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                if since is not None and mtime < since:
+                    continue
+                found.append((mtime, FileEvent(kind, directory / entry.name)))
+        found.sort(key=lambda item: item[0])
+        return [event for _, event in found]
+
+    def _start_inotify(self, libc):
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return False
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE | IN_MOVED_FROM
+        for directory in {watch_dir for watch_dir, _, _ in self._watches}:
+            wd = libc.inotify_add_watch(fd, os.fsencode(str(directory)), mask)
+            if wd < 0:
+                os.close(fd)
+                self._wd_dirs.clear()
+                return False
+            self._wd_dirs[wd] = directory
+        self._fd = fd
+        return True
+
+    def _run_inotify(self):
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self._fd], [], [], 0.5)
+            if not ready:
+                continue
+            try:
+                buf = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+
+            offset = 0
+            while offset < len(buf):
+                wd, mask, _, name_len = _EVENT_HEADER.unpack_from(buf, offset)
+                offset += _EVENT_HEADER.size
+                name = buf[offset:offset + name_len].rstrip(b"\0").decode("utf-8", "replace")
+                offset += name_len
+
+                if mask & IN_Q_OVERFLOW:
+                    print("[WARN] inotify queue overflow, rescanning")
+                    # Files older than forget_after were delivered before their names were forgotten.
+                    for event in self._scan_existing(prune=True, since=time.time() - self.forget_after):
+                        self._dispatch(event)
+                    continue
+
+                directory = self._wd_dirs.get(wd)
+                if directory is None or not name:
+                    continue
+                kind = self._match(directory, name)
+                if kind is None:
+                    continue
+                known = self._known[directory]
+                if mask & (IN_DELETE | IN_MOVED_FROM):
+                    known.pop(name, None)
+                    continue
+                if name in known:
+                    # Already delivered, e.g. by the startup scan.
+                    continue
+                self._remember(known, name)
+                self._dispatch(FileEvent(kind, directory / name))
+
+    def _run_polling(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                for event in self._scan_existing(prune=True):
+                    self._dispatch(event)
+            except Exception as e:
+                print(f"[WARN] Watcher poll failed: {e}")
+
+
+def _poll_for_file(path, timeout, interval):
+    deadline = time.monotonic() + timeout
+    while True:
+        if path.exists():
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(interval, remaining))
+
+
+async def _poll_for_file_async(path, timeout, interval):
+    deadline = time.monotonic() + timeout
+    while True:
+        if path.exists():
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        await asyncio.sleep(min(interval, remaining))
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(True)